@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, TIMESTAMP
+from sqlalchemy import Column, Integer, String, Text, TIMESTAMP, LargeBinary, Index
 from app.core.database import Base
 from datetime import datetime
 import pytz
@@ -16,4 +16,28 @@ class AuditLog(Base):
     field = Column(String(50), nullable=True)
     old_value = Column(Text, nullable=True)
     new_value = Column(Text, nullable=True)
-    timestamp = Column(TIMESTAMP, default=lambda: datetime.now(pytz.timezone('Asia/Jerusalem')))
\ No newline at end of file
+    timestamp = Column(TIMESTAMP, default=lambda: datetime.now(pytz.timezone('Asia/Jerusalem')))
+
+    # אינדקסים לשאילתות ההיסטוריה: לפי אירוע / ישות / משתמש, ממוינים לפי זמן (id לשבירת שוויון בדפדוף)
+    __table_args__ = (
+        Index('ix_audit_log_event_timestamp', 'event_id', 'timestamp', 'id'),
+        Index('ix_audit_log_entity_timestamp', 'entity_type', 'entity_id', 'timestamp'),
+        Index('ix_audit_log_user_timestamp', 'user_id', 'timestamp'),
+    )
+
+class AuditLogArchive(Base):
+    """רשומות לוג ישנות, ארוזות לפי אירוע וחודש: JSON דחוס (zlib) של כל השורות בחבילה"""
+    __tablename__ = "audit_log_archive"
+
+    id = Column(Integer, primary_key=True, index=True)
+    event_id = Column(Integer, nullable=True)
+    period = Column(String(7), nullable=False)  # YYYY-MM
+    row_count = Column(Integer, nullable=False)
+    first_timestamp = Column(TIMESTAMP, nullable=True)
+    last_timestamp = Column(TIMESTAMP, nullable=True)
+    payload = Column(LargeBinary, nullable=False)
+    created_at = Column(TIMESTAMP, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index('ix_audit_log_archive_event_period', 'event_id', 'period'),
+    )
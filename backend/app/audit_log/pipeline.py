@@ -0,0 +1,203 @@
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional
+
+import pytz
+from sqlalchemy import event, insert
+from sqlalchemy.orm import Session
+
+from app.audit_log.models import AuditLog
+from app.auth.principal import principal_cache
+from app.core.config import settings
+
+# מפתחות ב-session.info: רשומות שנאספו בטרנזקציה, ורשומות שממתינות לסיום ה-commit (מצב אסינכרוני)
+BUFFER_KEY = "audit_buffer"
+COMMITTING_KEY = "audit_committing"
+
+ISRAEL_TZ = pytz.timezone('Asia/Jerusalem')
+
+
+def user_name(db: Session, user_id: Optional[int]) -> str:
+    """שם התצוגה של המשתמש ללוג - מאותו מטמון של get_current_user, כך שבדרך כלל הוא כבר טעון"""
+    if user_id is None:
+        return "לא ידוע"
+    try:
+        principal = principal_cache.get(db, user_id)
+    except Exception as e:
+        print(f"Error getting user name: {e}")
+        principal = None
+    return principal.display_name if principal else f"משתמש {user_id}"
+
+
+def make_entry(db: Session, user_id: Optional[int], action: str, entity_type: str, entity_id: int,
+               field: Optional[str], old_value: Optional[str], new_value: Optional[str],
+               event_id: Optional[int] = None) -> dict:
+    return {
+        "user_id": user_id,
+        "user_name": user_name(db, user_id),
+        "action": action,
+        "entity_type": entity_type,
+        "entity_id": entity_id,
+        "event_id": event_id,
+        "field": field,
+        "old_value": old_value,
+        "new_value": new_value,
+        # הזמן נקבע ברגע השינוי, לא ברגע הכתיבה
+        "timestamp": datetime.now(ISRAEL_TZ)
+    }
+
+
+def buffer_entries(db: Session, entries: List[dict]):
+    """הוספת רשומות לטרנזקציה הנוכחית של ה-session - נכתבות ב-commit, ונזרקות ב-rollback"""
+    if not db.in_transaction():
+        # הרשומות שייכות לטרנזקציה - בלעדיה rollback לא היה מפעיל את האירועים וזורק אותן
+        db.begin()
+    db.info.setdefault(BUFFER_KEY, []).extend(entries)
+
+
+def _insert(connection_or_session, entries: List[dict]):
+    connection_or_session.execute(insert(AuditLog), entries)
+
+
+class AuditDrain:
+    """
+    מצב אסינכרוני (AUDIT_LOG_ASYNC): רשומות של טרנזקציות שהצליחו נכנסות לתור,
+    ו-thread ברקע כותב אותן בחבילות עם session משלו - הבקשה לא מחכה לכתיבת הלוג.
+    """
+
+    def __init__(self, flush_interval_ms: int, max_batch: int):
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_batch = max_batch
+        self._queue: "queue.Queue[dict]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._failures = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="audit-drain", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        self._thread = None
+        # מה שנשאר אחרי העצירה נכתב כאן, כדי לא לאבד רשומות בכיבוי
+        while self._write_pending():
+            pass
+
+    def enqueue(self, entries: List[dict]):
+        for entry in entries:
+            self._queue.put(entry)
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _take_batch(self, wait: bool) -> List[dict]:
+        batch = []
+        try:
+            batch.append(self._queue.get(timeout=self.flush_interval) if wait else self._queue.get_nowait())
+            while len(batch) < self.max_batch:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _write(self, batch: List[dict]) -> bool:
+        from app.core.database import SessionLocal  # Local import to keep this module importable without a DB
+
+        db = SessionLocal()
+        try:
+            _insert(db, batch)
+            db.commit()
+            self._failures = 0
+            return True
+        except Exception as e:
+            db.rollback()
+            self._failures += 1
+            print(f"Audit drain: failed to write {len(batch)} entries ({self._failures}): {e}")
+            return False
+        finally:
+            db.close()
+
+    def _write_pending(self) -> bool:
+        batch = self._take_batch(wait=False)
+        if not batch:
+            return False
+        if not self._write(batch):
+            print(f"Audit drain: dropping {len(batch)} entries after failure on shutdown")
+        return True
+
+    def _run(self):
+        while not self._stopping.is_set():
+            batch = self._take_batch(wait=True)
+            if not batch:
+                continue
+            if not self._write(batch):
+                # מחזירים לתור ומחכים קצת - המסד כנראה לא זמין כרגע
+                self.enqueue(batch)
+                time.sleep(min(5.0, self.flush_interval * (2 ** min(self._failures, 5))))
+
+
+audit_drain = AuditDrain(settings.AUDIT_FLUSH_INTERVAL_MS, settings.AUDIT_FLUSH_MAX_BATCH)
+
+
+def _async_enabled() -> bool:
+    return settings.AUDIT_LOG_ASYNC and audit_drain.running
+
+
+@event.listens_for(Session, "before_commit")
+def _write_buffer_before_commit(session: Session):
+    entries = session.info.pop(BUFFER_KEY, None)
+    if not entries:
+        return
+    if _async_enabled():
+        session.info.setdefault(COMMITTING_KEY, []).extend(entries)
+    else:
+        # INSERT אחד מרובה שורות, בתוך אותה טרנזקציה של השינויים עצמם
+        _insert(session, entries)
+
+
+@event.listens_for(Session, "after_commit")
+def _enqueue_after_commit(session: Session):
+    entries = session.info.pop(COMMITTING_KEY, None)
+    if entries:
+        audit_drain.enqueue(entries)
+
+
+# after_soft_rollback ולא after_rollback - נקרא גם כשהטרנזקציה עוד לא פתחה חיבור למסד
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_after_rollback(session: Session, previous_transaction):
+    session.info.pop(BUFFER_KEY, None)
+    session.info.pop(COMMITTING_KEY, None)
+
+
+def flush_pending(db: Session):
+    """
+    סוף בקשה: רשומות שנרשמו אחרי ה-commit האחרון (למשל לוג יצירה אחרי commit + refresh)
+    שייכות לשינויים שכבר נשמרו - כותבים אותן בטרנזקציה קצרה משלהן.
+    """
+    entries = db.info.pop(BUFFER_KEY, None)
+    if not entries:
+        return
+    if _async_enabled():
+        audit_drain.enqueue(entries)
+        return
+    try:
+        # שינויים שלא עברו commit היו נזרקים ממילא בסגירת ה-session
+        db.rollback()
+        _insert(db, entries)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"Failed to write {len(entries)} audit entries: {e}")
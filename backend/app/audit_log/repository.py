@@ -1,23 +1,17 @@
+from sqlalchemy import and_, delete, or_
 from sqlalchemy.orm import Session
 from . import models, schemas
+from app.core import fast_json
+from app.audit_log.pipeline import buffer_entries, make_entry, user_name
 from datetime import datetime
+import base64
+import json
+import zlib
 import pytz
 
 def get_user_name(db: Session, user_id: int) -> str:
-    """קבלת שם המשתמש לפי ID"""
-    if user_id is None:
-        return "לא ידוע"
-
-    try:
-        # נסה למצוא משתמש בטבלת users
-        from app.users.models import User # Local import to avoid circular dependency
-        user = db.query(User).filter(User.id == user_id).first()
-        if user:
-            return user.full_name or user.username or f"משתמש {user_id}"
-    except Exception as e:
-        print(f"Error getting user name: {e}")
-
-    return f"משתמש {user_id}"
+    """קבלת שם המשתמש לפי ID (ממטמון המשתמשים של האימות)"""
+    return user_name(db, user_id)
 
 def create_audit_log(db: Session, log: schemas.AuditLogCreate):
     # הוסף שעת ישראל
@@ -41,16 +35,149 @@ def get_audit_logs(db: Session, entity_type: str, entity_id: int, event_id: int
     return query.order_by(models.AuditLog.timestamp.desc()).all()
 
 def log_change(db: Session, user_id: int, action: str, entity_type: str, entity_id: int, field: str, old_value: str, new_value: str, event_id: int = None):
-    user_name = get_user_name(db, user_id)
-    log = schemas.AuditLogCreate(
-        user_id=user_id,
-        action=action,
-        entity_type=entity_type,
-        entity_id=entity_id,
-        event_id=event_id,
-        field=field,
-        old_value=old_value,
-        new_value=new_value,
-        user_name=user_name
+    """
+    רישום שינוי בלוג. הרשומה נאספת ב-session ונכתבת יחד עם שאר הרשומות ב-INSERT אחד בזמן ה-commit
+    (או ב-drain ברקע כש-AUDIT_LOG_ASYNC פעיל); rollback זורק אותה יחד עם השינוי עצמו.
+    """
+    entry = make_entry(db, user_id, action, entity_type, entity_id, field, old_value, new_value, event_id)
+    buffer_entries(db, [entry])
+    return entry
+
+def log_changes(db: Session, user_id: int, entries: list, event_id: int = None) -> int:
+    """
+    רישום הרבה שינויים בבת אחת. כל entry הוא dict עם action, entity_type, entity_id, field,
+    old_value, new_value (ואופציונלית event_id).
+    """
+    buffer_entries(db, [
+        make_entry(
+            db, user_id, entry["action"], entry["entity_type"], entry["entity_id"], entry.get("field"),
+            entry.get("old_value"), entry.get("new_value"), entry.get("event_id", event_id)
+        )
+        for entry in entries
+    ])
+    return len(entries)
+
+# ---------- שאילתות היסטוריה עם דפדוף ----------
+
+AUDIT_PAGE_MAX_LIMIT = 500
+
+def encode_cursor(timestamp: datetime, log_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{timestamp.isoformat()}|{log_id}".encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        timestamp, log_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(timestamp), int(log_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("cursor לא תקין") from e
+
+def query_audit_logs(db: Session, event_id: int = None, entity_type: str = None, entity_id: int = None,
+                     user_id: int = None, action: str = None, since: datetime = None, until: datetime = None,
+                     limit: int = 100, cursor: str = None):
+    """
+    דף של רשומות לוג מהחדשה לישנה, עם דפדוף keyset לפי (timestamp, id) - כל דף עולה אותו דבר,
+    גם עמוק בהיסטוריה. מחזיר (רשומות, cursor לדף הבא או None).
+    """
+    AuditLog = models.AuditLog
+    query = db.query(AuditLog)
+    if event_id is not None:
+        query = query.filter(AuditLog.event_id == event_id)
+    if entity_type:
+        query = query.filter(AuditLog.entity_type == entity_type)
+    if entity_id is not None:
+        query = query.filter(AuditLog.entity_id == entity_id)
+    if user_id is not None:
+        query = query.filter(AuditLog.user_id == user_id)
+    if action:
+        query = query.filter(AuditLog.action == action)
+    if since:
+        query = query.filter(AuditLog.timestamp >= since)
+    if until:
+        query = query.filter(AuditLog.timestamp < until)
+    if cursor:
+        cursor_timestamp, cursor_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            AuditLog.timestamp < cursor_timestamp,
+            and_(AuditLog.timestamp == cursor_timestamp, AuditLog.id < cursor_id)
+        ))
+
+    limit = max(1, min(limit, AUDIT_PAGE_MAX_LIMIT))
+    rows = query.order_by(AuditLog.timestamp.desc(), AuditLog.id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].timestamp, rows[-1].id)
+    return rows, next_cursor
+
+# ---------- ארכיון ----------
+
+def _archive_row(log: models.AuditLog) -> dict:
+    return {
+        "id": log.id,
+        "user_id": log.user_id,
+        "user_name": log.user_name,
+        "action": log.action,
+        "entity_type": log.entity_type,
+        "entity_id": log.entity_id,
+        "event_id": log.event_id,
+        "field": log.field,
+        "old_value": log.old_value,
+        "new_value": log.new_value,
+        "timestamp": log.timestamp.isoformat() if log.timestamp else None
+    }
+
+def archive_audit_logs(db: Session, before: datetime, event_id: int = None, batch_size: int = 5000) -> dict:
+    """
+    העברת רשומות שלפני before לטבלת הארכיון: חבילה דחוסה לכל אירוע וחודש, ומחיקה מהטבלה הראשית.
+    כל חבילה של batch_size רשומות נשמרת בטרנזקציה משלה, כך שהפעולה בטוחה להפסקה ולהרצה חוזרת.
+    """
+    AuditLog = models.AuditLog
+    archived_rows = 0
+    chunks = 0
+    last_id = 0
+    while True:
+        query = db.query(AuditLog).filter(AuditLog.timestamp < before, AuditLog.id > last_id)
+        if event_id is not None:
+            query = query.filter(AuditLog.event_id == event_id)
+        logs = query.order_by(AuditLog.id).limit(batch_size).all()
+        if not logs:
+            break
+        last_id = logs[-1].id
+
+        groups = {}
+        for log in logs:
+            groups.setdefault((log.event_id, log.timestamp.strftime("%Y-%m")), []).append(log)
+        for (group_event_id, period), group in groups.items():
+            timestamps = [log.timestamp for log in group]
+            db.add(models.AuditLogArchive(
+                event_id=group_event_id,
+                period=period,
+                row_count=len(group),
+                first_timestamp=min(timestamps),
+                last_timestamp=max(timestamps),
+                payload=zlib.compress(fast_json.dumps([_archive_row(log) for log in group]), 9)
+            ))
+        db.execute(delete(AuditLog).where(AuditLog.id.in_([log.id for log in logs])))
+        db.commit()
+        db.expunge_all()
+        archived_rows += len(logs)
+        chunks += len(groups)
+
+    print(f"Archived {archived_rows} audit log rows into {chunks} chunks (before {before.isoformat()})")
+    return {"archived_rows": archived_rows, "chunks": chunks, "before": before.isoformat()}
+
+def get_archives(db: Session, event_id: int = None):
+    AuditLogArchive = models.AuditLogArchive
+    query = db.query(
+        AuditLogArchive.id, AuditLogArchive.event_id, AuditLogArchive.period, AuditLogArchive.row_count,
+        AuditLogArchive.first_timestamp, AuditLogArchive.last_timestamp, AuditLogArchive.created_at
     )
-    return create_audit_log(db, log)    
\ No newline at end of file
+    if event_id is not None:
+        query = query.filter(AuditLogArchive.event_id == event_id)
+    return [dict(row._mapping) for row in query.order_by(AuditLogArchive.period.desc(), AuditLogArchive.id.desc())]
+
+def get_archived_rows(db: Session, archive_id: int):
+    archive = db.query(models.AuditLogArchive).filter(models.AuditLogArchive.id == archive_id).first()
+    if archive is None:
+        return None
+    return archive, json.loads(zlib.decompress(archive.payload))
@@ -1,6 +1,10 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from app.core.database import get_db
+from app.core.config import settings
+from app.auth.dependencies import get_current_user
+from datetime import datetime, timedelta
+from typing import Optional
 from . import repository, schemas, models
 
 router = APIRouter(prefix="/audit-log", tags=["AuditLog"])
@@ -16,6 +20,55 @@ def get_all_audit_logs(event_id: int = None, db: Session = Depends(get_db)):
         query = query.filter(models.AuditLog.event_id == event_id)
     return query.order_by(models.AuditLog.timestamp.desc()).all()
 
+@router.get("/query", response_model=schemas.AuditLogPage)
+def query_audit_logs(
+    event_id: Optional[int] = None,
+    entity_type: Optional[str] = None,
+    entity_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    action: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = Query(100, ge=1, le=repository.AUDIT_PAGE_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """היסטוריית שינויים בדפים, מהחדש לישן. את next_cursor שולחים כ-cursor כדי לקבל את הדף הבא"""
+    try:
+        items, next_cursor = repository.query_audit_logs(
+            db, event_id=event_id, entity_type=entity_type, entity_id=entity_id, user_id=user_id,
+            action=action, since=since, until=until, limit=limit, cursor=cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"items": [schemas.AuditLogOut.model_validate(item) for item in items], "next_cursor": next_cursor}
+
+@router.post("/archive")
+def archive_audit_logs(
+    older_than_days: int = Query(settings.AUDIT_ARCHIVE_AFTER_DAYS, ge=1),
+    event_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """העברת רשומות לוג ישנות לארכיון החודשי הדחוס (מנהל מערכת בלבד)"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="אין לך הרשאה לפעולה זו")
+    before = datetime.now() - timedelta(days=older_than_days)
+    return repository.archive_audit_logs(db, before, event_id=event_id)
+
+@router.get("/archive", response_model=list[schemas.AuditLogArchiveOut])
+def get_audit_log_archives(event_id: Optional[int] = None, db: Session = Depends(get_db)):
+    return repository.get_archives(db, event_id)
+
+@router.get("/archive/{archive_id}")
+def get_audit_log_archive(archive_id: int, db: Session = Depends(get_db)):
+    """הרשומות של חבילת ארכיון אחת, אחרי פריסה"""
+    result = repository.get_archived_rows(db, archive_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="חבילת ארכיון לא נמצאה")
+    archive, rows = result
+    return {"id": archive.id, "event_id": archive.event_id, "period": archive.period, "items": rows}
+
 
 def log_change(db: Session, user_id: int, action: str, entity_type: str, entity_id: int, field: str, old_value: str, new_value: str, event_id: int = None):
     log = schemas.AuditLogCreate(
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 class AuditLogBase(BaseModel):
@@ -21,4 +21,16 @@ class AuditLogOut(AuditLogBase):
     timestamp: datetime
 
     class Config:
-        orm_mode = True
\ No newline at end of file
+        from_attributes = True
+class AuditLogPage(BaseModel):
+    items: List[AuditLogOut]
+    next_cursor: Optional[str] = None
+
+class AuditLogArchiveOut(BaseModel):
+    id: int
+    event_id: Optional[int]
+    period: str
+    row_count: int
+    first_timestamp: Optional[datetime]
+    last_timestamp: Optional[datetime]
+    created_at: Optional[datetime]
@@ -3,8 +3,8 @@ from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
 from app.core.config import settings
 from app.auth.schemas import TokenData
-from app.users.models import User
-from app.core.database import SessionLocal
+from app.auth.principal import principal_cache
+from app.core.database import get_db
 from sqlalchemy.orm import Session
 
 
@@ -14,13 +14,6 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 SECRET_KEY = settings.SECRET_KEY
 ALGORITHM = settings.ALGORITHM
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
 ):
     credentials_exception = HTTPException(
@@ -36,7 +29,11 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     except JWTError:
         raise credentials_exception
 
-    user = db.query(User).filter(User.id == int(user_id)).first()
-    if user is None:
+    try:
+        user = principal_cache.get(db, int(user_id))
+    except ValueError:
+        raise credentials_exception
+    # משתמש שהושבת לא יכול להמשיך עם טוקן שהונפק לפני ההשבתה
+    if user is None or user.is_active is False:
         raise credentials_exception
     return user
@@ -0,0 +1,79 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.users.models import User
+
+
+class Principal:
+    """
+    המשתמש המחובר כפי שנטען מהמסד - עותק קבוע של העמודות, לא אובייקט ORM,
+    כך שאפשר לשתף אותו בין בקשות ו-sessions.
+    """
+    __slots__ = ("id", "username", "full_name", "email", "role", "is_active", "id_number")
+
+    def __init__(self, id: int, username: str, full_name: str, email: str, role: str,
+                 is_active: Optional[bool], id_number: Optional[str]):
+        self.id = id
+        self.username = username
+        self.full_name = full_name
+        self.email = email
+        self.role = role
+        self.is_active = is_active
+        self.id_number = id_number
+
+    @property
+    def display_name(self) -> str:
+        return self.full_name or self.username or f"משתמש {self.id}"
+
+
+class PrincipalCache:
+    """
+    LRU קצר-מועד של משתמשים לפי ה-sub שבטוקן: בקשות רצופות של אותו משתמש (עורך הישיבה, עדכוני מוזמנים)
+    לא ניגשות לטבלת users. שינוי, השבתה או מחיקה של משתמש קוראים ל-invalidate.
+    """
+
+    def __init__(self, ttl_seconds: int, max_entries: int):
+        self.ttl = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, Tuple[Principal, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, db: Session, user_id: int) -> Optional[Principal]:
+        now = time.monotonic()
+        with self._lock:
+            cached = self._entries.get(user_id)
+            if cached is not None:
+                if cached[1] > now:
+                    self._entries.move_to_end(user_id)
+                    return cached[0]
+                del self._entries[user_id]
+
+        row = db.query(
+            User.id, User.username, User.full_name, User.email, User.role, User.is_active, User.id_number
+        ).filter(User.id == user_id).first()
+        if row is None:
+            # משתמש שלא קיים לא נשמר - כדי שמשתמש חדש עם אותו id ייטען מיד
+            return None
+        principal = Principal(*row)
+
+        with self._lock:
+            self._entries[user_id] = (principal, now + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return principal
+
+    def invalidate(self, user_id: Optional[int] = None):
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+
+principal_cache = PrincipalCache(settings.PRINCIPAL_CACHE_TTL_SECONDS, settings.PRINCIPAL_CACHE_SIZE)
@@ -1,23 +1,18 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from app.core.database import SessionLocal
+from app.core.database import get_db
 from app.guests import schemas as guest_schemas, repository as guest_repository, models as guest_models
 from app.events import models as event_models, repository as event_repository
 from app.greetings import schemas as greeting_schemas, service as greeting_service
 from app.seatings import models as seating_models
+from app.seatings.card_generation import card_qr_payload
+from app.seatings.qr_cache import qr_cache, qr_url
 from app.tables import models as table_models
 from typing import List, Optional
 from datetime import datetime, timedelta
 
 router = APIRouter(prefix="/bot", tags=["Bot"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.get("/event/{event_id}")
 def get_event_info_for_bot(event_id: int, db: Session = Depends(get_db)):
     """קבלת מידע על אירוע לבוט"""
@@ -263,6 +258,9 @@ def get_guest_ticket(guest_id: int, db: Session = Depends(get_db)):
     
     # שליפת פרטי השולחן
     table = db.query(table_models.Table).filter(table_models.Table.id == seating.table_id).first()
+
+    # אותה תמונת QR כמו בכרטיס הישיבה - מהמטמון, ונוצרת רק אם עוד לא קיימת
+    qr_reference = qr_cache.get_or_render(card_qr_payload(guest.event_id, guest.first_name, guest.last_name, guest.phone))
     
     return {
         "guest_id": guest.id,
@@ -270,7 +268,8 @@ def get_guest_ticket(guest_id: int, db: Session = Depends(get_db)):
         "has_seating": True,
         "table_number": table.table_number if table else None,
         "seat_number": seating.seat_number,
-        "event_id": guest.event_id
+        "event_id": guest.event_id,
+        "qr_url": qr_url(qr_reference)
     }
 
 @router.get("/event/{event_id}/tickets")
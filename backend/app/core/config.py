@@ -14,6 +14,67 @@ class Settings(BaseSettings):
     NEDARIM_PLUS_API_VALID: str = ""  # טקסט אימות
     NEDARIM_PLUS_CALLBACK_IP: str = "18.194.219.73"  # IP של נדרים פלוס לאימות
 
+    # Database pool
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: int = 30  # שניות המתנה לחיבור פנוי
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_TIMEOUT_MS: int = 30000
+    ASYNC_DATABASE_URL: str = ""  # ברירת מחדל: אותו מסד דרך postgresql+asyncpg
+
+    # WebSocket broadcast
+    WS_SEND_QUEUE_SIZE: int = 256  # הודעות ממתינות לחיבור לפני שמנתקים קליינט איטי
+    WS_SEND_TIMEOUT_SECONDS: float = 10.0
+    WS_DELTA_WINDOW_MS: int = 100  # חלון צבירת עדכוני תפוסה לחיבורי delta
+    WS_REPLAY_BUFFER_SIZE: int = 1000  # הודעות אחרונות לכל אירוע לשחזור אחרי ניתוק
+    WS_REPLAY_SPILL: bool = False  # שמירת הודעות הזרם גם בטבלת realtime_replay_messages לפערים ארוכים
+    WS_REPLAY_SPILL_INTERVAL_MS: int = 500
+    WS_REPLAY_SPILL_TTL_MINUTES: int = 60
+    REALTIME_PUBSUB_BACKEND: str = "memory"  # memory / postgres / redis - נדרש postgres או redis כשמריצים כמה workers; loopback = Redis מדומה בתוך התהליך לבדיקות
+    REALTIME_PUBSUB_CHANNEL: str = "realtime_events"
+    REALTIME_PUBSUB_DSN: str = ""  # ברירת מחדל: מסד הנתונים הראשי
+    REDIS_URL: str = "redis://localhost:6379/0"
+
+    # Seating cards PDF
+    CARD_FONT_PATH: str = ""  # קובץ TTF עם תמיכה בעברית לכרטיסי הישיבה
+    QR_CACHE_DIR: str = "uploads/qr"  # תמונות QR לפי hash התוכן, משותפות לכרטיסים, לבוט ולייצוא
+    QR_CACHE_MEMORY_ITEMS: int = 2048
+    CARD_RENDER_WORKERS: int = 0  # תהליכים לרינדור QR. 0 = לפי מספר המעבדים (עד 4), מספר שלילי = בלי pool
+
+    # Auth
+    PRINCIPAL_CACHE_TTL_SECONDS: int = 60  # כמה זמן משתמש מחובר נשמר בזיכרון בין בקשות (גם לשמות בלוג)
+    PRINCIPAL_CACHE_SIZE: int = 1024
+    PERMISSION_CACHE_TTL_SECONDS: int = 60  # הרשאות המשתמש באירועים, לבדיקות הרשאה ולרשימת האירועים
+    PERMISSION_CACHE_SIZE: int = 1024
+
+    # Seating reports
+    SEATING_PROJECTION_CACHE_SIZE: int = 64  # אירועים שתמונת הישיבה שלהם נשמרת בזיכרון
+
+    # Hall designer
+    HALL_SPATIAL_CACHE_SIZE: int = 64  # אולמות (אירוע + סוג אולם) שהאינדקס המרחבי שלהם נשמר בזיכרון
+    HALL_GRID_CELL_SIZE: int = 240  # גודל תא ברשת, ביחידות של x/y במעצב
+
+    # Guest search
+    GUEST_SEARCH_CACHE_SIZE: int = 64  # אירועים שאינדקס החיפוש שלהם נשמר בזיכרון
+
+    # Background jobs
+    JOB_WORKERS: int = 2  # משימות שרצות במקביל; השאר ממתינות בתור
+    JOB_MAX_PENDING: int = 20
+    JOB_ARTIFACT_DIR: str = "data/jobs"
+    JOB_ARTIFACT_TTL_MINUTES: int = 60
+
+    # Audit log
+    AUDIT_LOG_ASYNC: bool = False  # כתיבת הלוג ב-thread ברקע אחרי ה-commit, במקום בתוך הטרנזקציה
+    AUDIT_FLUSH_INTERVAL_MS: int = 200
+    AUDIT_FLUSH_MAX_BATCH: int = 500
+    AUDIT_ARCHIVE_AFTER_DAYS: int = 180  # ברירת המחדל של POST /audit-log/archive
+
+    # Check-in write-behind
+    CHECKIN_JOURNAL_PATH: str = "data/checkin_journal.jsonl"  # יומן מקומי לכניסות שאושרו ועוד לא נכתבו; כל worker כותב ל-checkin_journal.<n>.jsonl
+    CHECKIN_FLUSH_INTERVAL_MS: int = 5
+    CHECKIN_FLUSH_MAX_BATCH: int = 500
+
     class Config:
         env_file = ".env"
 
@@ -0,0 +1,36 @@
+import hashlib
+import json
+from datetime import date, datetime
+from typing import Optional
+
+try:
+    import orjson
+except ImportError:  # orjson אופציונלי - בלעדיו נופלים ל-json הרגיל
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(data) -> bytes:
+    """סריאליזציה ישירה ל-bytes של dict/list עם ערכים פשוטים ו-datetime, בלי מעבר דרך Pydantic"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def etag_for(body: bytes) -> str:
+    return '"%s"' % hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """בדיקת If-None-Match מול ה-ETag הנוכחי (כולל רשימה, * ו-W/)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
@@ -1,6 +1,7 @@
 from sqlalchemy.orm import Session
 from app.events import models, schemas
 from app.audit_log.repository import log_change
+from app.permissions.cache import permission_cache
 
 def create_event(db: Session, event: schemas.EventCreate, admin_id: int, user_id: int = None):
     db_event = models.Event(**event.dict(), admin_id=admin_id)
@@ -71,4 +72,6 @@ def delete_event(db: Session, event_id: int, user_id: int = None):
         )
         db.delete(db_event)
         db.commit()
+        permission_cache.invalidate_event(event_id)
+        invalidate_event_caches(event_id)
     return db_event
@@ -1,20 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from app.events import repository, schemas
-from app.core.database import SessionLocal
+from app.core.database import get_db
 from app.auth.dependencies import get_current_user  # ✅ הוספת current_user
 from app.permissions.utils import check_event_permission
+from app.permissions.cache import permission_cache
 from app.core.config import settings
 
 router = APIRouter(prefix="/events", tags=["Events"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 # ✅ יצירת אירוע – עם admin_id לפי המשתמש המחובר
 @router.post("/", response_model=schemas.EventOut)
 def create_event(
@@ -36,9 +30,8 @@ def get_my_events(
     if current_user.role == 'admin':
         return repository.get_all_events(db)
     elif current_user.role == 'viewer':
-        from app.permissions.models import UserEventPermission
         from app.events import models
-        event_ids = [p.event_id for p in db.query(UserEventPermission).filter_by(user_id=current_user.id).all()]
+        event_ids = list(permission_cache.roles_for_user(db, current_user.id))
         if not event_ids:
             return []
         return db.query(models.Event).filter(models.Event.id.in_(event_ids)).all()
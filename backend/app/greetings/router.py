@@ -1,18 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from app.core.database import SessionLocal
+from app.core.database import get_db
 from app.greetings import schemas, service
 from app.auth.dependencies import get_current_user
 
 router = APIRouter(prefix="/greetings", tags=["Greetings"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.post("/", response_model=schemas.GreetingOut)
 def create_greeting(greeting: schemas.GreetingCreate, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
     """יצירת ברכה חדשה"""
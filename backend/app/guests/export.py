@@ -0,0 +1,156 @@
+import csv
+import io
+import tempfile
+from typing import Iterator, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.core.database import SessionLocal
+from app.guests import models
+from app.guests.search import name_filter
+
+# שורות בכל שליפה מה-cursor בצד השרת, ובכל חלק של תשובת ה-CSV
+EXPORT_FETCH_SIZE = 1000
+XLSX_CHUNK_SIZE = 64 * 1024
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+CSV_MEDIA_TYPE = "text/csv; charset=utf-8"
+
+# העמודות הקבועות בקובץ: (כותרת, עמודה במודל, עיצוב הערך)
+EXPORT_COLUMNS = (
+    ("שם פרטי", models.Guest.first_name, None),
+    ("שם משפחה", models.Guest.last_name, None),
+    ("טלפון", models.Guest.phone, lambda value: value or ""),
+    ("מייל", models.Guest.email, lambda value: value or ""),
+    ("תעודת זהות", models.Guest.id_number, lambda value: value or ""),
+    ("מין", models.Guest.gender, None),
+    ("אישור הגעה", models.Guest.confirmed_arrival, lambda value: "כן" if value else "לא"),
+    ("אירוע", models.Guest.event_id, None),
+)
+
+
+def _guest_query(db: Session, event_id: Optional[int], name: Optional[str], gender: Optional[str], confirmed_only: Optional[bool]):
+    query = select(models.Guest.id, *[column for _, column, _ in EXPORT_COLUMNS])
+    if event_id:
+        query = query.where(models.Guest.event_id == event_id)
+    if name:
+        query = query.where(name_filter(db, event_id, name))
+    if gender:
+        query = query.where(models.Guest.gender == gender)
+    if confirmed_only is not None:
+        query = query.where(models.Guest.confirmed_arrival == confirmed_only)
+    return query.order_by(models.Guest.id)
+
+
+def iter_export_rows(db: Session, event_id: Optional[int] = None, name: Optional[str] = None,
+                     gender: Optional[str] = None, confirmed_only: Optional[bool] = None,
+                     custom_fields: bool = False) -> Iterator[list]:
+    """
+    שורת כותרת ואחריה שורה לכל מוזמן. המוזמנים נקראים מ-cursor בצד השרת בחלקים של EXPORT_FETCH_SIZE,
+    ולכל חלק נטענים ערכי השדות הדינמיים שלו בשאילתה אחת - הזיכרון לא תלוי במספר המוזמנים.
+    שדות דינמיים שייכים לאירוע, ולכן נוספים רק כשמסננים לפי event_id.
+    """
+    fields = []
+    if custom_fields and event_id:
+        fields = db.query(models.GuestCustomField.id, models.GuestCustomField.name).filter(
+            models.GuestCustomField.event_id == event_id
+        ).order_by(models.GuestCustomField.id).all()
+    field_positions = {field.id: position for position, field in enumerate(fields)}
+    formatters = [formatter for _, _, formatter in EXPORT_COLUMNS]
+
+    yield [title for title, _, _ in EXPORT_COLUMNS] + [field.name for field in fields]
+
+    result = db.execute(
+        _guest_query(db, event_id, name, gender, confirmed_only).execution_options(yield_per=EXPORT_FETCH_SIZE)
+    )
+    for partition in result.partitions():
+        values = {}
+        if fields:
+            guest_ids = [row[0] for row in partition]
+            # מהחדש לישן - כשיש כמה ערכים לאותו תא נשאר הראשון שנשמר
+            for guest_id, field_id, value in db.execute(
+                select(models.GuestFieldValue.guest_id, models.GuestFieldValue.custom_field_id, models.GuestFieldValue.value)
+                .where(models.GuestFieldValue.guest_id.in_(guest_ids), models.GuestFieldValue.custom_field_id.in_(list(field_positions)))
+                .order_by(models.GuestFieldValue.id.desc())
+            ):
+                values.setdefault(guest_id, [""] * len(fields))[field_positions[field_id]] = value or ""
+
+        for row in partition:
+            line = [formatter(value) if formatter else value for formatter, value in zip(formatters, row[1:])]
+            if fields:
+                line.extend(values.get(row[0]) or [""] * len(fields))
+            yield line
+
+
+def iter_csv(rows: Iterator[list]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    # BOM - כדי שאקסל יזהה UTF-8 ויציג עברית
+    buffer.write("\ufeff")
+    writer = csv.writer(buffer)
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % EXPORT_FETCH_SIZE == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def iter_xlsx(rows: Iterator[list]) -> Iterator[bytes]:
+    """
+    openpyxl במצב write-only: כל שורה נכתבת לקובץ זמני ולא נשמרת בזיכרון.
+    ה-zip של ה-xlsx נבנה רק בסוף, ואז הקובץ נשלח בחלקים מהדיסק.
+    """
+    from openpyxl import Workbook  # Local import - only needed for xlsx exports
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Guests")
+    for row in rows:
+        sheet.append(row)
+    with tempfile.TemporaryFile() as output:
+        workbook.save(output)
+        output.seek(0)
+        while True:
+            chunk = output.read(XLSX_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+def _encode(rows: Iterator[list], file_format: str) -> Iterator[bytes]:
+    return iter_csv(rows) if file_format == "csv" else iter_xlsx(rows)
+
+
+def iter_guest_export(file_format: str = "xlsx", **filters) -> Iterator[bytes]:
+    """גוף התשובה של /guests/export - עם session משלו, כי הוא רץ תוך כדי שליחת התשובה"""
+    db = SessionLocal()
+    try:
+        yield from _encode(iter_export_rows(db, **filters), file_format)
+    finally:
+        db.close()
+
+
+def write_guest_export(db: Session, path: str, file_format: str = "xlsx", **filters) -> int:
+    """כתיבת הייצוא לקובץ (לג'ובים ברקע). מחזיר את מספר המוזמנים"""
+    count = -1  # בלי שורת הכותרת
+    def counted(rows):
+        nonlocal count
+        for row in rows:
+            count += 1
+            yield row
+
+    with open(path, "wb") as f:
+        for chunk in _encode(counted(iter_export_rows(db, **filters)), file_format):
+            f.write(chunk)
+    return count
+
+
+def export_filename(file_format: str) -> str:
+    return "guests.csv" if file_format == "csv" else "guests.xlsx"
+
+
+def export_media_type(file_format: str) -> str:
+    return CSV_MEDIA_TYPE if file_format == "csv" else XLSX_MEDIA_TYPE
+
@@ -0,0 +1,310 @@
+import csv
+import io
+from typing import BinaryIO, Dict, Iterator, List, Optional, Set, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import delete, insert, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.audit_log.repository import log_changes
+from app.guests import models, schemas
+from app.realtime.event_caches import invalidate_event_caches
+from app.tableHead.models import TableHead
+
+# שורות בכל חבילה: אימות, שאילתת קיימים ו-INSERT/UPDATE מרובי שורות - וטרנזקציה אחת
+IMPORT_BATCH_SIZE = 500
+
+# כותרות מוכרות בקובץ (כולל הכותרות של ייצוא האקסל ושל הטבלה עם השדות הדינמיים) -> שדה במוזמן
+HEADER_ALIASES = {
+    "first_name": "first_name", "שם פרטי": "first_name", "שם": "first_name",
+    "last_name": "last_name", "שם משפחה": "last_name",
+    "id_number": "id_number", "תעודת זהות": "id_number", "ת.ז": "id_number", "ת\"ז": "id_number",
+    "phone": "phone", "טלפון": "phone", "נייד": "phone",
+    "email": "email", "מייל": "email", "אימייל": "email",
+    "address": "address", "כתובת": "address",
+    "gender": "gender", "מין": "gender", "מגדר": "gender",
+    "confirmed_arrival": "confirmed_arrival", "אישור הגעה": "confirmed_arrival",
+    "referral_source": "referral_source", "מקור הפניה": "referral_source",
+    "whatsapp_number": "whatsapp_number", "וואטסאפ": "whatsapp_number",
+    "table_head_id": "table_head_id",
+}
+
+TRUE_VALUES = {"כן", "yes", "true", "1", "v", "✓", "מאשר", "מגיע"}
+FALSE_VALUES = {"לא", "no", "false", "0", ""}
+
+
+class ImportFileError(Exception):
+    """קובץ שאי אפשר לקרוא (פורמט לא נתמך, בלי שורת כותרת, חסרות עמודות חובה)"""
+
+
+def _cell_text(value) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    text = str(value).strip()
+    return text or None
+
+
+def _iter_xlsx(file: BinaryIO) -> Iterator[tuple]:
+    from openpyxl import load_workbook  # Local import - only needed for xlsx uploads
+
+    # read_only: השורות נקראות מה-XML תוך כדי, בלי לטעון את כל הגיליון לזיכרון
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def _iter_csv(file: BinaryIO) -> Iterator[tuple]:
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", errors="replace", newline="")
+    sample = text.read(4096)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    for row in csv.reader(text, dialect):
+        yield tuple(row)
+
+
+def iter_rows(filename: str, file: BinaryIO) -> Tuple[List[str], Iterator[Tuple[int, tuple]]]:
+    """כותרות הקובץ ואיטרטור על שורות הנתונים (מספר שורה כפי שמופיע בקובץ, ערכים)"""
+    name = (filename or "").lower()
+    if name.endswith((".xlsx", ".xlsm")):
+        rows = _iter_xlsx(file)
+    elif name.endswith((".csv", ".txt")):
+        rows = _iter_csv(file)
+    else:
+        raise ImportFileError("פורמט קובץ לא נתמך - יש להעלות xlsx או csv")
+
+    for header_row_number, header in enumerate(rows, 1):
+        if any(_cell_text(cell) for cell in header):
+            break
+    else:
+        raise ImportFileError("הקובץ ריק")
+
+    headers = [_cell_text(cell) or "" for cell in header]
+
+    def data_rows():
+        for row_number, row in enumerate(rows, header_row_number + 1):
+            if any(_cell_text(cell) is not None for cell in row):
+                yield row_number, row
+
+    return headers, data_rows()
+
+
+def _normalize(field: str, raw) -> Optional[object]:
+    text = _cell_text(raw)
+    if field == "id_number" and text and isinstance(raw, (int, float)) and text.isdigit():
+        # תא מספרי באקסל מאבד את האפסים המובילים של ת"ז
+        return text.zfill(9)
+    if field in ("phone", "whatsapp_number") and text and isinstance(raw, (int, float)) and len(text) == 9:
+        return "0" + text
+    if field == "confirmed_arrival":
+        if text is None:
+            return None
+        lowered = text.lower()
+        if lowered in TRUE_VALUES:
+            return True
+        if lowered in FALSE_VALUES:
+            return False
+        raise ValueError(f"ערך לא מוכר לאישור הגעה: {text}")
+    if field == "table_head_id":
+        return int(text) if text else None
+    return text
+
+
+def _field_label(name: str) -> str:
+    # שדות טופס נשמרים עם קידומת "[form|o=0001] " - בקובץ מופיעה רק התווית
+    if name.startswith("[") and "] " in name:
+        return name.split("] ", 1)[1]
+    return name
+
+
+class GuestImporter:
+    """
+    ייבוא מוזמנים מקובץ: קריאה בזרימה, אימות בחבילות, upsert לפי (event_id, id_number) -
+    מוזמן קיים מתעדכן רק בעמודות שמופיעות בקובץ ויש בהן ערך - והכנסת ערכי השדות הדינמיים.
+    """
+
+    def __init__(self, db: Session, event_id: int, user_id: Optional[int] = None, dry_run: bool = False):
+        self.db = db
+        self.event_id = event_id
+        self.user_id = user_id
+        self.dry_run = dry_run
+        self.result = {
+            "total_rows": 0, "created": 0, "updated": 0, "failed": 0,
+            "errors": [], "ignored_columns": [], "custom_fields": [], "dry_run": dry_run
+        }
+        self._seen_id_numbers: Dict[str, int] = {}
+        self._table_head_ids: Set[int] = set()
+
+    def _map_headers(self, headers: List[str]):
+        fields = {}
+        custom_columns = {}
+        custom_fields = self.db.query(models.GuestCustomField.id, models.GuestCustomField.name).filter(
+            models.GuestCustomField.event_id == self.event_id
+        ).all()
+        by_name = {}
+        for field in custom_fields:
+            by_name.setdefault(field.name, field.id)
+            by_name.setdefault(_field_label(field.name), field.id)
+
+        for position, header in enumerate(headers):
+            if not header:
+                continue
+            target = HEADER_ALIASES.get(header) or HEADER_ALIASES.get(header.lower())
+            if target and target not in fields.values():
+                fields[position] = target
+            elif header in by_name:
+                custom_columns[position] = by_name[header]
+                self.result["custom_fields"].append(header)
+            else:
+                self.result["ignored_columns"].append(header)
+
+        missing = {"first_name", "last_name", "id_number", "gender"} - set(fields.values())
+        if missing:
+            raise ImportFileError(f"חסרות עמודות חובה: {', '.join(sorted(missing))}")
+        if "table_head_id" in fields.values():
+            self._table_head_ids = set(self.db.execute(
+                select(TableHead.id).where(TableHead.event_id == self.event_id)
+            ).scalars())
+        return fields, custom_columns
+
+    def _parse_row(self, row_number: int, row: tuple, fields: dict, custom_columns: dict):
+        values = {}
+        errors = []
+        for position, field in fields.items():
+            try:
+                values[field] = _normalize(field, row[position] if position < len(row) else None)
+            except ValueError as e:
+                errors.append(str(e))
+        custom_values = {}
+        for position, field_id in custom_columns.items():
+            text = _cell_text(row[position]) if position < len(row) else None
+            if text is not None:
+                custom_values[field_id] = text
+
+        table_head_id = values.get("table_head_id")
+        if table_head_id is not None and table_head_id not in self._table_head_ids:
+            # אחרת מפתח זר שגוי מפיל את כל החבילה במסד
+            errors.append(f"ראש שולחן {table_head_id} לא קיים באירוע")
+
+        id_number = values.get("id_number")
+        if not id_number:
+            errors.append("חסרה תעודת זהות")
+        elif id_number in self._seen_id_numbers:
+            errors.append(f"תעודת זהות כפולה בקובץ (שורה {self._seen_id_numbers[id_number]})")
+        else:
+            self._seen_id_numbers[id_number] = row_number
+
+        guest = None
+        if not errors:
+            try:
+                guest = schemas.GuestCreate(event_id=self.event_id, **{k: v for k, v in values.items() if v is not None})
+            except ValidationError as e:
+                errors.extend(f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in e.errors())
+        if errors:
+            self.result["failed"] += 1
+            self.result["errors"].append({"row": row_number, "id_number": id_number, "errors": errors})
+            return None
+        # בעדכון נכנסות רק עמודות מהקובץ שיש בהן ערך
+        present = {field for field, value in values.items() if value is not None}
+        return guest, present, custom_values
+
+    def _apply_batch(self, batch: list):
+        Guest = models.Guest
+        id_numbers = [guest.id_number for guest, _, _ in batch]
+        existing = dict(self.db.execute(
+            select(Guest.id_number, Guest.id).where(Guest.event_id == self.event_id, Guest.id_number.in_(id_numbers))
+        ).all())
+
+        new_items = [item for item in batch if item[0].id_number not in existing]
+        updated_items = [item for item in batch if item[0].id_number in existing]
+        if self.dry_run:
+            self.result["created"] += len(new_items)
+            self.result["updated"] += len(updated_items)
+            return
+
+        guest_ids = dict(existing)
+        audit_entries = []
+        if new_items:
+            rows = self.db.execute(
+                insert(Guest).returning(Guest.id, Guest.id_number, sort_by_parameter_order=True),
+                [guest.model_dump() for guest, _, _ in new_items]
+            ).all()
+            for row, (guest, _, _) in zip(rows, new_items):
+                guest_ids[row.id_number] = row.id
+                audit_entries.append({
+                    "action": "create", "entity_type": "Guest", "entity_id": row.id, "field": "first_name",
+                    "old_value": "", "new_value": f"מוזמן חדש (ייבוא): {guest.first_name} {guest.last_name}"
+                })
+        if updated_items:
+            self.db.execute(update(Guest), [
+                {"id": existing[guest.id_number], **guest.model_dump(include=present)}
+                for guest, present, _ in updated_items
+            ])
+            for guest, present, _ in updated_items:
+                audit_entries.append({
+                    "action": "update", "entity_type": "Guest", "entity_id": existing[guest.id_number],
+                    "field": "import", "old_value": "",
+                    "new_value": f"עודכן מייבוא: {', '.join(sorted(present))}"
+                })
+
+        pairs = [
+            (guest_ids[guest.id_number], field_id, value)
+            for guest, _, custom_values in batch for field_id, value in custom_values.items()
+        ]
+        if pairs:
+            FieldValue = models.GuestFieldValue
+            self.db.execute(delete(FieldValue).where(
+                tuple_(FieldValue.guest_id, FieldValue.custom_field_id).in_([(g, f) for g, f, _ in pairs])
+            ))
+            self.db.execute(insert(FieldValue), [
+                {"guest_id": guest_id, "custom_field_id": field_id, "value": value}
+                for guest_id, field_id, value in pairs
+            ])
+
+        log_changes(self.db, self.user_id, audit_entries, event_id=self.event_id)
+        self.db.commit()
+        self.result["created"] += len(new_items)
+        self.result["updated"] += len(updated_items)
+
+    def run(self, filename: str, file: BinaryIO) -> dict:
+        headers, rows = iter_rows(filename, file)
+        fields, custom_columns = self._map_headers(headers)
+
+        batch = []
+        try:
+            for row_number, row in rows:
+                self.result["total_rows"] += 1
+                parsed = self._parse_row(row_number, row, fields, custom_columns)
+                if parsed:
+                    batch.append((row_number, *parsed))
+                if len(batch) >= IMPORT_BATCH_SIZE:
+                    self._apply_safely(batch)
+                    batch = []
+            if batch:
+                self._apply_safely(batch)
+        finally:
+            # כל חבילה נשמרת בנפרד - גם אם חבילה מאוחרת נכשלה (timeout, ניתוק), הקודמות כבר במסד
+            if not self.dry_run and (self.result["created"] or self.result["updated"]):
+                invalidate_event_caches(self.event_id)
+        return self.result
+
+    def _apply_safely(self, batch: list):
+        try:
+            self._apply_batch([item[1:] for item in batch])
+        except IntegrityError as e:
+            # למשל מוזמן עם אותה ת"ז שנוסף במקביל - החבילה לא נשמרה, השאר ממשיכות
+            self.db.rollback()
+            print(f"Guest import batch failed for event {self.event_id}: {e}")
+            for row_number, guest, _, _ in batch:
+                self.result["failed"] += 1
+                self.result["errors"].append({
+                    "row": row_number, "id_number": guest.id_number,
+                    "errors": ["החבילה לא נשמרה בגלל התנגשות במסד - נסו לייבא שוב"]
+                })
@@ -3,6 +3,7 @@ from app.guests import models, schemas
 from app.seatings import models as seating_models
 from sqlalchemy.exc import IntegrityError
 from app.audit_log.repository import log_change
+from app.realtime.event_caches import invalidate_event_caches
 from sqlalchemy import and_
 
 # Guests
@@ -12,6 +13,7 @@ def create_guest(db: Session, guest: schemas.GuestCreate, user_id: int = None):
     try:
         db.commit()
         db.refresh(db_guest)
+        invalidate_event_caches(db_guest.event_id)
         # תיעוד בלוג
         log_change(
             db=db,
@@ -44,36 +46,68 @@ def create_custom_field(db: Session, field: schemas.CustomFieldCreate):
     db.refresh(db_field)
     return db_field
 
-def get_guests_with_fields(db: Session, event_id: int):
-    # שליפת כל האורחים לאירוע
-    guests = db.query(models.Guest).filter(models.Guest.event_id == event_id).all()
-    # שליפת כל השדות הדינמיים של האירוע
-    custom_fields = db.query(models.GuestCustomField).filter(models.GuestCustomField.event_id == event_id).all()
+# העמודות הקבועות בטבלת המוזמנים עם השדות הדינמיים: (שם העמודה, עמודה במודל)
+GUEST_GRID_COLUMNS = (
+    ("id", models.Guest.id),
+    ("שם", models.Guest.first_name),
+    ("שם משפחה", models.Guest.last_name),
+    ("טלפון", models.Guest.phone),
+    ("אימייל", models.Guest.email),
+    ("תעודת זהות", models.Guest.id_number),
+    ("table_head_id", models.Guest.table_head_id),
+    ("gender", models.Guest.gender),
+    ("confirmed_arrival", models.Guest.confirmed_arrival),
+)
 
-    # רשימה להחזרה
-    result = []
-    for guest in guests:
-        guest_data = {
-            "id": guest.id,
-            "שם": guest.first_name,
-            "שם משפחה": guest.last_name,
-            "טלפון": guest.phone,
-            "אימייל": guest.email,
-            "תעודת זהות": guest.id_number,
-            "table_head_id": guest.table_head_id, 
-            # תוסיפי פה כל שדה קבוע שתרצי להציג
-            "gender": guest.gender,
-            "confirmed_arrival": guest.confirmed_arrival,
-        }
-        # עוברת על כל שדה דינמי ומוסיפה ערך (אם קיים)
-        for field in custom_fields:
-            value_obj = db.query(models.GuestFieldValue).filter_by(
-                guest_id=guest.id,
-                custom_field_id=field.id
-            ).first()
-            guest_data[field.name] = value_obj.value if value_obj else ""
-        result.append(guest_data)
-    return result
+def get_guests_with_fields_columns(db: Session, event_id: int) -> dict:
+    """
+    טבלת המוזמנים עם השדות הדינמיים בפורמט עמודות: שמות העמודות ומערך ערכים לכל עמודה.
+    שלוש שאילתות בסך הכל (מוזמנים, שדות, כל הערכים של האירוע) - הערכים מפוזרים ישר למקום שלהם
+    בעמודה לפי אינדקס המוזמן והשדה, בלי שאילתה לכל תא.
+    """
+    guest_rows = db.query(*[column for _, column in GUEST_GRID_COLUMNS]).filter(
+        models.Guest.event_id == event_id
+    ).order_by(models.Guest.id).all()
+    custom_fields = db.query(models.GuestCustomField.id, models.GuestCustomField.name).filter(
+        models.GuestCustomField.event_id == event_id
+    ).order_by(models.GuestCustomField.id).all()
+
+    row_count = len(guest_rows)
+    data = [list(values) for values in zip(*guest_rows)] if guest_rows else [[] for _ in GUEST_GRID_COLUMNS]
+    guest_positions = {guest_id: position for position, guest_id in enumerate(data[0])}
+    field_positions = {field.id: position for position, field in enumerate(custom_fields)}
+    field_columns = [[""] * row_count for _ in custom_fields]
+
+    if custom_fields and guest_rows:
+        values = db.query(
+            models.GuestFieldValue.guest_id, models.GuestFieldValue.custom_field_id, models.GuestFieldValue.value
+        ).join(
+            models.Guest, models.Guest.id == models.GuestFieldValue.guest_id
+        ).filter(
+            models.Guest.event_id == event_id
+        ).order_by(models.GuestFieldValue.id.desc())
+        # מהחדש לישן, כך שכשיש כמה ערכים לאותו תא נשאר הראשון שנשמר (כמו ה-first() הקודם)
+        for guest_id, field_id, value in values:
+            field_position = field_positions.get(field_id)
+            guest_position = guest_positions.get(guest_id)
+            if field_position is not None and guest_position is not None:
+                field_columns[field_position][guest_position] = value if value else ""
+
+    return {
+        "columns": [name for name, _ in GUEST_GRID_COLUMNS] + [field.name for field in custom_fields],
+        "data": data + field_columns,
+        "row_count": row_count
+    }
+
+def iter_guests_with_fields(db: Session, event_id: int):
+    """שורות הטבלה (dict לכל מוזמן) מתוך הפורמט העמודתי"""
+    grid = get_guests_with_fields_columns(db, event_id)
+    columns = grid["columns"]
+    for values in zip(*grid["data"]):
+        yield dict(zip(columns, values))
+
+def get_guests_with_fields(db: Session, event_id: int):
+    return list(iter_guests_with_fields(db, event_id))
 
 def get_custom_fields(db: Session, event_id: int, form_key: str | None = None):
     q = db.query(models.GuestCustomField).filter(models.GuestCustomField.event_id == event_id)
@@ -122,6 +156,7 @@ def update_guest(db: Session, guest_id: int, guest: schemas.GuestUpdate, user_id
     
     db.commit()
     db.refresh(db_guest)
+    invalidate_event_caches(db_guest.event_id)
     return db_guest
 
 def delete_guest(db: Session, guest_id: int, user_id: int = None):
@@ -146,6 +181,7 @@ def delete_guest(db: Session, guest_id: int, user_id: int = None):
         )
         db.delete(db_guest)
         db.commit()
+        invalidate_event_caches(db_guest.event_id)
     return db_guest
 
 def update_guests_with_default_gender(db: Session, event_id: int):
@@ -168,6 +204,7 @@ def update_guests_with_default_gender(db: Session, event_id: int):
     
     if updated_count > 0:
         db.commit()
+        invalidate_event_caches(event_id)
         print(f"עודכנו {updated_count} מוזמנים עם מגדר ברירת מחדל")
     
     return updated_count
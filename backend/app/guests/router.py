@@ -1,13 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File, Form
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
-from app.core.database import SessionLocal
+from app.core.database import get_db
 from app.guests import schemas, repository, models
-from app.seatings import models as seating_models
-from app.tables import models as table_models
 from typing import Optional
-from fastapi.responses import StreamingResponse
-import pandas as pd
+from fastapi.responses import Response, StreamingResponse
+from app.core import fast_json
 import io
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
@@ -16,16 +14,13 @@ from reportlab.lib.units import inch
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from app.auth.dependencies import get_current_user
+from app.guests.importer import GuestImporter, ImportFileError
+from app.guests import export as guest_export
+from app.guests import seating_image
+from app.guests.search import guest_search_cache, name_filter
 
 router = APIRouter(prefix="/guests", tags=["Guests"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 def _encode_prefixed_name(form_key: str | None, order_index: int | None, label: str, required: bool = False) -> str:
     # Prefix format: [form|o=0001|r=1] Label  (r=1 -> required)
     # or [form|r=1] Label / [form] Label when parts are missing
@@ -72,6 +67,28 @@ def create_guest(guest: schemas.GuestCreate, db: Session = Depends(get_db), curr
         raise HTTPException(status_code=400, detail="Guest with same ID number already exists for this event")
     return result
 
+@router.post("/events/{event_id}/import")
+def import_guests(
+    event_id: int,
+    file: UploadFile = File(...),
+    dry_run: bool = Form(False),
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """
+    ייבוא מוזמנים מקובץ xlsx / csv. מוזמן עם ת"ז שכבר קיימת באירוע מתעדכן, אחרת נוצר;
+    עמודות ששמן כשם שדה דינמי של האירוע נשמרות כערכי השדה. שורות שגויות מדווחות ב-errors ולא עוצרות את השאר.
+    dry_run=true - רק אימות וספירה, בלי לשמור.
+    """
+    try:
+        return GuestImporter(db, event_id, user_id=current_user.id, dry_run=dry_run).run(file.filename, file.file)
+    except ImportFileError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        db.rollback()
+        print(f"שגיאה בייבוא מוזמנים: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"שגיאה בייבוא מוזמנים: {str(e)}")
+
 @router.put("/{guest_id}", response_model=schemas.GuestOut)
 def update_guest(guest_id: int, guest: schemas.GuestUpdate, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
     result = repository.update_guest(db, guest_id, guest, user_id=current_user.id)
@@ -153,13 +170,46 @@ def filter_guests(
     if event_id:
         query = query.filter(models.Guest.event_id == event_id)
     if name:
-        query = query.filter(models.Guest.full_name.ilike(f"%{name}%"))
+        query = query.filter(name_filter(db, event_id, name))
     if phone:
         query = query.filter(models.Guest.phone.ilike(f"%{phone}%"))
 
     return query.all()
 
 
+@router.get("/events/{event_id}/search")
+def search_guests(
+    event_id: int,
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    חיפוש מוזמנים באירוע לפי שם, טלפון (גם ארבע ספרות אחרונות) או ת"ז - כולל חלקי מילה ושגיאות כתיב,
+    בלי תלות בניקוד ובאותיות סופיות. התוצאות ממוינות לפי התאמה; את next_cursor שולחים כ-cursor לדף הבא.
+    """
+    try:
+        return guest_search_cache.get(db, event_id).search(q, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/events/{event_id}/search/prefix")
+def search_guests_prefix(
+    event_id: int,
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=50),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """השלמה תוך כדי הקלדה: רק מילים שמתחילות במה שהוקלד, ספרות בתחילת הטלפון / ת"ז או בסוף הטלפון"""
+    try:
+        return guest_search_cache.get(db, event_id).search(q, limit, cursor, fuzzy=False)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 
 
 @router.get("/export")
@@ -168,45 +218,19 @@ def export_guests_to_excel(
     name: Optional[str] = None,
     gender: Optional[str] = None,
     confirmed_only: Optional[bool] = None,
-    db: Session = Depends(get_db)
+    format: str = Query("xlsx", pattern="^(xlsx|csv)$"),
+    custom_fields: bool = False
 ):
-    query = db.query(models.Guest)
-    
-    # פילטרים
-    if event_id:
-        query = query.filter(models.Guest.event_id == event_id)
-    if name:
-        query = query.filter(models.Guest.first_name.ilike(f"%{name}%"))
-    if gender:
-        query = query.filter(models.Guest.gender == gender)
-    if confirmed_only is not None:
-        query = query.filter(models.Guest.confirmed_arrival == confirmed_only)
-
-    guests = query.all()
-
-    data = [
-        {
-            "שם פרטי": g.first_name,
-            "שם משפחה": g.last_name,
-            "טלפון": g.phone or "",
-            "מייל": g.email or "",
-            "תעודת זהות": g.id_number or "",
-            "מין": g.gender,
-            "אישור הגעה": "כן" if g.confirmed_arrival else "לא",
-            "אירוע": g.event_id
-        }
-        for g in guests
-    ]
-
-    df = pd.DataFrame(data)
-    stream = io.BytesIO()
-    df.to_excel(stream, index=False, engine="openpyxl")
-    stream.seek(0)
-
+    """
+    ייצוא המוזמנים ל-xlsx (ברירת מחדל) או csv. הקובץ נבנה תוך כדי קריאה מהמסד ונשלח בחלקים;
+    custom_fields=true (עם event_id) מוסיף עמודה לכל שדה דינמי של האירוע.
+    """
     return StreamingResponse(
-        stream,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": "attachment; filename=guests.xlsx"}
+        guest_export.iter_guest_export(
+            format, event_id=event_id, name=name, gender=gender, confirmed_only=confirmed_only, custom_fields=custom_fields
+        ),
+        media_type=guest_export.export_media_type(format),
+        headers={"Content-Disposition": f"attachment; filename={guest_export.export_filename(format)}"}
     )
 
 @router.get("/export-pdf")
@@ -223,7 +247,7 @@ def export_guests_to_pdf(
     if event_id:
         query = query.filter(models.Guest.event_id == event_id)
     if name:
-        query = query.filter(models.Guest.first_name.ilike(f"%{name}%"))
+        query = query.filter(name_filter(db, event_id, name))
     if gender:
         query = query.filter(models.Guest.gender == gender)
     if confirmed_only is not None:
@@ -304,170 +328,43 @@ def export_seating_image(
     """
     ייצוא תמונה של מפת הישיבה עם פילטרים
     """
-    # קביעת סוג אולם לפי מגדר (אם נשלח): גברים -> 'm', נשים -> 'w'
-    hall_type_filter = None
-    if gender:
-        try:
-            g = gender.lower()
-            if g == 'male':
-                hall_type_filter = 'm'
-            elif g == 'female':
-                hall_type_filter = 'w'
-        except Exception:
-            hall_type_filter = None
-
-    # שליפת שולחנות לאירוע (ולפי סוג אולם אם צוין)
-    tables_query = db.query(table_models.Table).filter(table_models.Table.event_id == event_id)
-    if hall_type_filter:
-        tables_query = tables_query.filter(table_models.Table.hall_type == hall_type_filter)
-    tables = tables_query.all()
-    
-    # שליפת מוזמנים לאירוע
-    guests_query = db.query(models.Guest).filter(models.Guest.event_id == event_id)
-    if gender:
-        guests_query = guests_query.filter(models.Guest.gender == gender)
-    guests = guests_query.all()
-    
-    # שליפת מקומות ישיבה - מוגבלים לשולחנות שנבחרו
-    table_ids = [t.id for t in tables]
-    seatings = []
-    if table_ids:
-        seatings = db.query(seating_models.Seating).filter(
-            seating_models.Seating.event_id == event_id,
-            seating_models.Seating.table_id.in_(table_ids)
-        ).all()
-    
-    # Debug info
-    print(f"Found {len(tables)} tables for event {event_id}")
-    print(f"Found {len(guests)} guests for event {event_id}")
-    print(f"Found {len(seatings)} seatings for event {event_id}")
-    
-    # בדיקה אם יש מוזמנים
-    if len(guests) == 0:
-        # אם אין מוזמנים, נציג הודעה
-        img_width = 800
-        img_height = 400
-        img = Image.new('RGB', (img_width, img_height), color='white')
-        draw = ImageDraw.Draw(img)
-        
-        draw.text((img_width//2, img_height//2), f"No guests found for event {event_id}", 
-                 fill='red', anchor='mm')
-        
-        buffer = io.BytesIO()
-        img.save(buffer, format='PNG')
-        buffer.seek(0)
-        
-        return StreamingResponse(
-            buffer,
-            media_type="image/png",
-            headers={"Content-Disposition": f"attachment; filename=seating-map-{event_id}.png"}
-        )
-    
-    # יצירת תמונה
-    from PIL import Image, ImageDraw, ImageFont
-    import os
-    
-    # גודל התמונה
-    img_width = 1800
-    img_height = 1200
-    img = Image.new('RGB', (img_width, img_height), color='white')
-    draw = ImageDraw.Draw(img)
-    
-    # ניסיון לטעון פונט גדול יותר
-    try:
-        # ניסיון לטעון פונט מערכת
-        font = ImageFont.truetype("arial.ttf", 16)
-        title_font = ImageFont.truetype("arial.ttf", 20)
-    except:
-        # אם לא מצליח, נשתמש בפונט ברירת מחדל
-        font = ImageFont.load_default()
-        title_font = ImageFont.load_default()
-    
-    # כותרת
-    title = f"Seating Map - Event {event_id}"
-    if gender:
-        title += f" ({gender})"
-    draw.text((img_width//2, 50), title, fill='black', anchor='mm', font=title_font)
-    
-    # קנה מידה לפי x,y אם קיימים
-    margin_x = 120
-    margin_y = 160
-    default_table_size = 110
-    has_positions = any(t.x is not None and t.y is not None for t in tables)
-
-    if has_positions:
-        xs = [t.x for t in tables if t.x is not None]
-        ys = [t.y for t in tables if t.y is not None]
-        min_x, max_x = min(xs), max(xs)
-        min_y, max_y = min(ys), max(ys)
-        span_x = max(1.0, max_x - min_x)
-        span_y = max(1.0, max_y - min_y)
-        scale_x = (img_width - 2 * margin_x) / span_x
-        scale_y = (img_height - 2 * margin_y) / span_y
-        scale = min(scale_x, scale_y)
-    
-    for i, table in enumerate(tables):
-        # מיקום
-        if has_positions and table.x is not None and table.y is not None:
-            x = margin_x + (table.x - min_x) * scale
-            y = margin_y + (table.y - min_y) * scale
-        else:
-            # פריסה רשתית אם אין קואורדינטות
-            row = i // 6
-            col = i % 6
-            x = margin_x + col * (default_table_size + 140)
-            y = margin_y + row * (default_table_size + 120)
-
-        size = default_table_size
-        # חישוב תפוסה לפני ציור כדי שנוכל לפלטר שולחנות
-        table_seatings = [s for s in seatings if s.table_id == table.id]
-        occupied = 0
-        for seating in table_seatings:
-            guest = db.query(models.Guest).filter(models.Guest.id == seating.guest_id).first()
-            if guest and (gender is None or guest.gender == gender):
-                occupied += 1
-        capacity = getattr(table, 'size', len(table_seatings) or 0)
-        empty = max(0, capacity - occupied)
-
-        # סינון: רק שולחנות ריקים (אפס תפוסים)
-        if only_empty_tables and occupied > 0:
-            continue
-        # סינון: רק שולחנות עם מקומות פנויים (לא מלאים)
-        if only_available_tables and empty == 0:
-            continue
-
-        # ציור שולחן לפי צורה (אחרי הסינון)
-        if getattr(table, 'shape', 'circular') == 'rectangular':
-            w = size * 1.4
-            h = size * 0.8
-            draw.rectangle([x - w/2, y - h/2, x + w/2, y + h/2], outline='blue', width=3)
-  
-        else:
-            draw.ellipse([x - size/2, y - size/2, x + size/2, y + size/2], outline='blue', width=3)
-
-        # מספר שולחן
-        draw.text((x, y), f"Table {table.table_number}", fill='blue', anchor='mm')
-
-        # טקסט סטטיסטי ליד השולחן
-        info = f"{occupied}/{capacity}"
-        draw.text((x, y + size/2 + 16), info, fill='darkgreen', anchor='mm', font=font)
-        if show_empty_seats:
-            draw.text((x, y + size/2 + 34), f"Empty: {empty}", fill='red', anchor='mm', font=font)
-    
-    # שמירת התמונה
-    buffer = io.BytesIO()
-    img.save(buffer, format='PNG')
-    buffer.seek(0)
-    
+    content = seating_image.seating_image_bytes(
+        db, event_id, gender, show_empty_seats, show_occupied_seats, only_empty_tables, only_available_tables
+    )
     return StreamingResponse(
-        buffer,
+        io.BytesIO(content),
         media_type="image/png",
         headers={"Content-Disposition": f"attachment; filename=seating-map-{event_id}.png"}
     )
 
+# שורות בכל חלק של תשובת with-fields המוזרמת
+GRID_STREAM_CHUNK_ROWS = 500
+
 @router.get("/event/{event_id}/with-fields")
-def get_guests_with_fields(event_id: int, db: Session = Depends(get_db)):
-    return repository.get_guests_with_fields(db, event_id)
+def get_guests_with_fields(event_id: int, format: str = Query("rows", pattern="^(rows|columns)$"), db: Session = Depends(get_db)):
+    """
+    המוזמנים עם השדות הדינמיים. format=rows (ברירת מחדל) - רשימת אובייקטים כמו תמיד, נשלחת בחלקים;
+    format=columns - {columns, data, row_count}: שמות העמודות ומערך ערכים לכל עמודה, קומפקטי לטבלאות גדולות.
+    """
+    grid = repository.get_guests_with_fields_columns(db, event_id)
+    if format == "columns":
+        return Response(content=fast_json.dumps(grid), media_type="application/json")
+
+    def iter_json():
+        columns = grid["columns"]
+        rows = zip(*grid["data"])
+        yield b"["
+        first = True
+        while True:
+            chunk = [dict(zip(columns, values)) for _, values in zip(range(GRID_STREAM_CHUNK_ROWS), rows)]
+            if not chunk:
+                break
+            body = fast_json.dumps(chunk)[1:-1]
+            yield body if first else b"," + body
+            first = False
+        yield b"]"
+
+    return StreamingResponse(iter_json(), media_type="application/json")
 
 @router.post("/update-gender-defaults/{event_id}")
 def update_guests_with_default_gender_endpoint(event_id: int, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
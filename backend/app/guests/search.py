@@ -0,0 +1,326 @@
+import base64
+import json
+import re
+import threading
+import unicodedata
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.guests.models import Guest
+from app.realtime.checkin_index import normalize_phone
+
+_FINAL_LETTERS = str.maketrans("ךםןףץ", "כמנפצ")
+# גרש, גרשיים ומרכאות נמחקים (ג'ורג' -> גורג), כל שאר הסימנים מפרידים בין מילים
+_QUOTES = re.compile("['\"`׳״‘’“”]")
+_SEPARATORS = re.compile(r"[\W_]+")
+# ניקוד וטעמים (ואחרי NFKD גם סימנים מעל אותיות לטיניות). מקף, פסק וסוף פסוק נשארים - הם מפרידים
+_MARKS = re.compile("[\u0300-\u036f\u0591-\u05bd\u05bf\u05c1\u05c2\u05c4\u05c5\u05c7]")
+
+# ציונים לכל מילה בחיפוש - הגבוה ביותר מבין השדות של המוזמן
+EXACT_SCORE = 1.0
+PREFIX_SCORE = 0.8
+PHONE_SUFFIX_SCORE = 0.85  # ארבע הספרות האחרונות של הטלפון
+SUBSTRING_SCORE = 0.6
+FUZZY_WEIGHT = 0.5
+# כמו ברירת המחדל של pg_trgm
+SIMILARITY_THRESHOLD = 0.3
+MIN_SUFFIX_DIGITS = 3
+
+
+@lru_cache(maxsize=8192)
+def normalize_text(value: Optional[str]) -> str:
+    """
+    צורה אחידה לחיפוש: בלי ניקוד וטעמים, אותיות סופיות כרגילות (ם -> מ), בלי גרשים,
+    אותיות קטנות, וסימני פיסוק / מקף כרווח.
+    """
+    text = value or ""
+    if not text.isascii():
+        # NFKD מפרק גם אותיות עם ניקוד מובנה (כמו שׁ ב-U+FB2A) לאות + סימן
+        text = _MARKS.sub("", unicodedata.normalize("NFKD", text))
+    text = _QUOTES.sub("", text).translate(_FINAL_LETTERS).casefold()
+    return _SEPARATORS.sub(" ", text).strip()
+
+
+@lru_cache(maxsize=8192)
+def trigrams(word: str) -> FrozenSet[str]:
+    """טריגרמים בסגנון pg_trgm - עם ריפוד בתחילת המילה ובסופה"""
+    padded = f"  {word} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def similarity(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a or not b:
+        return 0.0
+    shared = len(a & b)
+    return shared / (len(a) + len(b) - shared)
+
+
+def _phone_variants(phone: Optional[str]) -> Tuple[str, ...]:
+    digits = normalize_phone(phone)
+    if not digits:
+        return ()
+    # +972-50-... ו-050-... הם אותו מספר
+    if digits.startswith("972"):
+        return digits, "0" + digits[3:]
+    return (digits,)
+
+
+def encode_cursor(key: tuple) -> str:
+    return base64.urlsafe_b64encode(json.dumps(key, ensure_ascii=False).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        score, name, guest_id = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        return float(score), str(name), int(guest_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError("cursor לא תקין") from e
+
+
+class SearchEntry:
+    __slots__ = ("id", "first_name", "last_name", "phone", "id_number", "sort_name", "tokens", "token_trigrams", "digits")
+
+    def __init__(self, id: int, first_name: str, last_name: str, phone: Optional[str], id_number: Optional[str]):
+        self.id = id
+        self.first_name = first_name
+        self.last_name = last_name
+        self.phone = phone
+        self.id_number = id_number
+        first = normalize_text(first_name)
+        last = normalize_text(last_name)
+        self.sort_name = f"{last} {first}".strip()
+        self.tokens = tuple(dict.fromkeys((first + " " + last).split()))
+        self.token_trigrams = tuple(trigrams(token) for token in self.tokens)
+        phones = _phone_variants(phone)
+        id_digits = normalize_phone(id_number)
+        # (ספרות, האם טלפון)
+        self.digits = tuple((digits, True) for digits in phones) + (((id_digits, False),) if id_digits else ())
+
+    def as_dict(self, score: float) -> dict:
+        return {
+            "id": self.id,
+            "first_name": self.first_name,
+            "last_name": self.last_name,
+            "phone": self.phone,
+            "id_number": self.id_number,
+            "score": score,
+        }
+
+
+class GuestSearchIndex:
+    """
+    אינדקס החיפוש של מוזמני אירוע: רשימות ממוינות של מילים וספרות לחיפוש לפי התחלה (bisect),
+    ספרות הטלפון הפוכות לחיפוש לפי סוף, ורשימות טריגרמים של השמות לחיפוש חלקי ושגיאות כתיב.
+    """
+
+    def __init__(self, event_id: int, entries: List[SearchEntry]):
+        self.event_id = event_id
+        self.entries = entries
+        words = []
+        digits = []
+        phone_suffixes = []
+        postings: Dict[str, Set[int]] = {}
+        for position, entry in enumerate(entries):
+            for token, grams in zip(entry.tokens, entry.token_trigrams):
+                words.append((token, position))
+                for gram in grams:
+                    postings.setdefault(gram, set()).add(position)
+            for value, is_phone in entry.digits:
+                digits.append((value, position))
+                if is_phone:
+                    phone_suffixes.append((value[::-1], position))
+        words.sort()
+        digits.sort()
+        phone_suffixes.sort()
+        self._words = words
+        self._digits = digits
+        self._phone_suffixes = phone_suffixes
+        self._postings = postings
+
+    @classmethod
+    def load(cls, db: Session, event_id: int) -> "GuestSearchIndex":
+        rows = db.execute(
+            select(Guest.id, Guest.first_name, Guest.last_name, Guest.phone, Guest.id_number)
+            .where(Guest.event_id == event_id).order_by(Guest.id)
+        ).all()
+        return cls(event_id, [SearchEntry(*row) for row in rows])
+
+    @staticmethod
+    def _prefix_positions(keys: list, prefix: str) -> Set[int]:
+        start = bisect_left(keys, (prefix,))
+        end = bisect_right(keys, (prefix + "\uffff",))
+        return {position for _, position in keys[start:end]}
+
+    def _candidates(self, term: str, fuzzy: bool) -> Set[int]:
+        if term.isdigit():
+            if fuzzy:
+                # ספרות באמצע מספר - מעבר ישיר על הערכים זול יותר מטריגרמים לכל טלפון
+                return {position for value, position in self._digits if term in value}
+            positions = self._prefix_positions(self._digits, term)
+            if len(term) >= MIN_SUFFIX_DIGITS:
+                positions |= self._prefix_positions(self._phone_suffixes, term[::-1])
+            return positions
+        positions = self._prefix_positions(self._words, term)
+        if fuzzy and len(term) >= 3:
+            for gram in trigrams(term):
+                positions |= self._postings.get(gram, set())
+        return positions
+
+    @staticmethod
+    def _term_score(entry: SearchEntry, term: str, term_grams: FrozenSet[str], fuzzy: bool) -> float:
+        best = 0.0
+        if term.isdigit():
+            for value, is_phone in entry.digits:
+                if value == term:
+                    return EXACT_SCORE
+                if is_phone and len(term) >= MIN_SUFFIX_DIGITS and value.endswith(term):
+                    best = max(best, PHONE_SUFFIX_SCORE)
+                elif value.startswith(term):
+                    best = max(best, PREFIX_SCORE)
+                elif fuzzy and term in value:
+                    best = max(best, SUBSTRING_SCORE)
+            return best
+        for token, grams in zip(entry.tokens, entry.token_trigrams):
+            if token == term:
+                return EXACT_SCORE
+            if token.startswith(term):
+                # התחלה ארוכה יותר קרובה יותר למילה המלאה
+                best = max(best, PREFIX_SCORE + 0.1 * len(term) / len(token))
+            elif fuzzy:
+                if term in token:
+                    best = max(best, SUBSTRING_SCORE)
+                else:
+                    sim = similarity(term_grams, grams)
+                    if sim >= SIMILARITY_THRESHOLD:
+                        best = max(best, FUZZY_WEIGHT * sim)
+        return best
+
+    def match(self, query: str, fuzzy: bool = True) -> List[Tuple[tuple, SearchEntry]]:
+        """
+        כל המוזמנים שמתאימים לכל המילים בחיפוש, ממוינים לפי ציון (ממוצע הציונים של המילים),
+        שם ו-id. מחזיר (מפתח מיון, מוזמן) - המפתח משמש גם כ-cursor.
+        """
+        terms = list(dict.fromkeys(normalize_text(query).split()))
+        if not terms:
+            return []
+        # המילה הארוכה ביותר נותנת בדרך כלל את קבוצת המועמדים הקטנה ביותר
+        terms.sort(key=len, reverse=True)
+        candidates = self._candidates(terms[0], fuzzy)
+        for term in terms[1:]:
+            if not candidates:
+                break
+            candidates &= self._candidates(term, fuzzy)
+
+        term_grams = [trigrams(term) for term in terms]
+        results = []
+        for position in candidates:
+            entry = self.entries[position]
+            total = 0.0
+            for term, grams in zip(terms, term_grams):
+                score = self._term_score(entry, term, grams, fuzzy)
+                if not score:
+                    break
+                total += score
+            else:
+                score = round(total / len(terms), 4)
+                results.append(((-score, entry.sort_name, entry.id), entry))
+        results.sort(key=lambda item: item[0])
+        return results
+
+    def search(self, query: str, limit: int = 20, cursor: Optional[str] = None, fuzzy: bool = True) -> dict:
+        results = self.match(query, fuzzy)
+        start = 0
+        if cursor:
+            score, name, guest_id = decode_cursor(cursor)
+            start = bisect_right([key for key, _ in results], (-score, name, guest_id))
+        page = results[start:start + limit]
+        next_cursor = None
+        if start + limit < len(results):
+            last_key = page[-1][0]
+            next_cursor = encode_cursor([-last_key[0], last_key[1], last_key[2]])
+        return {
+            "items": [entry.as_dict(-key[0]) for key, entry in page],
+            "total": len(results),
+            "next_cursor": next_cursor,
+        }
+
+    def name_match_ids(self, query: str) -> List[int]:
+        """
+        מוזמנים שכל מילה בחיפוש מופיעה בשם הפרטי או בשם המשפחה שלהם (אחרי נרמול) - בלי שגיאות כתיב ובלי טלפון,
+        כמו ה-ilike של name_filter. לסינון ולייצוא, שבהם תוצאה "קרובה" היא מוזמן שאף אחד לא ביקש.
+        """
+        terms = sorted(dict.fromkeys(normalize_text(query).split()), key=len, reverse=True)
+        if not terms:
+            return []
+        matched: Optional[Set[int]] = None
+        for term in terms:
+            if len(term) >= 3:
+                # כל טריגרם פנימי של המילה מופיע גם בטריגרמים של שם שמכיל אותה
+                positions = self._postings.get(term[:3], set())
+                for i in range(1, len(term) - 2):
+                    positions = positions & self._postings.get(term[i:i + 3], set())
+                found = {p for p in positions if any(term in token for token in self.entries[p].tokens)}
+            else:
+                found = {p for token, p in self._words if term in token}
+            matched = found if matched is None else matched & found
+            if not matched:
+                return []
+        return [self.entries[p].id for p in sorted(matched)]
+
+
+class GuestSearchCache:
+    """LRU של אינדקסי חיפוש לפי אירוע - כתיבות של מוזמנים קוראות ל-invalidate"""
+
+    def __init__(self, max_events: int):
+        self.max_events = max_events
+        self._indexes: "OrderedDict[int, GuestSearchIndex]" = OrderedDict()
+        self._generations: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, db: Session, event_id: int) -> GuestSearchIndex:
+        with self._lock:
+            index = self._indexes.get(event_id)
+            if index is not None:
+                self._indexes.move_to_end(event_id)
+                return index
+            generation = self._generations.get(event_id, 0)
+
+        index = GuestSearchIndex.load(db, event_id)
+
+        with self._lock:
+            # כתיבה שהתבצעה בזמן הטעינה - האינדקס אולי לא כולל אותה, לא שומרים
+            if self._generations.get(event_id, 0) == generation:
+                self._indexes[event_id] = index
+                while len(self._indexes) > self.max_events:
+                    self._indexes.popitem(last=False)
+        return index
+
+    def invalidate(self, event_id: Optional[int]):
+        if event_id is None:
+            return
+        with self._lock:
+            self._generations[event_id] = self._generations.get(event_id, 0) + 1
+            self._indexes.pop(event_id, None)
+
+
+guest_search_cache = GuestSearchCache(settings.GUEST_SEARCH_CACHE_SIZE)
+
+
+def name_filter(db: Session, event_id: Optional[int], name: str):
+    """
+    תנאי סינון לפי שם לשאילתות על Guest: כל מילה צריכה להופיע בשם הפרטי או בשם המשפחה.
+    כשיש אירוע - דרך אינדקס החיפוש (שמתעלם גם מניקוד ומאותיות סופיות), אחרת ilike.
+    """
+    if event_id:
+        return Guest.id.in_(guest_search_cache.get(db, event_id).name_match_ids(name))
+    words = name.split() or [name]
+    return and_(*[
+        or_(Guest.first_name.ilike(f"%{word}%"), Guest.last_name.ilike(f"%{word}%"))
+        for word in words
+    ])
@@ -0,0 +1,160 @@
+import io
+from typing import Optional
+
+from PIL import Image, ImageDraw, ImageFont
+from sqlalchemy.orm import Session
+
+from app.guests import models
+from app.seatings import models as seating_models
+from app.tables import models as table_models
+
+
+def seating_image_bytes(db: Session, event_id: int, gender: Optional[str] = None,
+                        show_empty_seats: Optional[bool] = True, show_occupied_seats: Optional[bool] = True,
+                        only_empty_tables: Optional[bool] = False, only_available_tables: Optional[bool] = False) -> bytes:
+    """PNG של מפת הישיבה עם פילטרים (משמש את ה-route ואת הג'ובים ברקע)"""
+    # קביעת סוג אולם לפי מגדר (אם נשלח): גברים -> 'm', נשים -> 'w'
+    hall_type_filter = None
+    if gender:
+        try:
+            g = gender.lower()
+            if g == 'male':
+                hall_type_filter = 'm'
+            elif g == 'female':
+                hall_type_filter = 'w'
+        except Exception:
+            hall_type_filter = None
+
+    # שליפת שולחנות לאירוע (ולפי סוג אולם אם צוין)
+    tables_query = db.query(table_models.Table).filter(table_models.Table.event_id == event_id)
+    if hall_type_filter:
+        tables_query = tables_query.filter(table_models.Table.hall_type == hall_type_filter)
+    tables = tables_query.all()
+    
+    # שליפת מוזמנים לאירוע
+    guests_query = db.query(models.Guest).filter(models.Guest.event_id == event_id)
+    if gender:
+        guests_query = guests_query.filter(models.Guest.gender == gender)
+    guests = guests_query.all()
+    
+    # שליפת מקומות ישיבה - מוגבלים לשולחנות שנבחרו
+    table_ids = [t.id for t in tables]
+    seatings = []
+    if table_ids:
+        seatings = db.query(seating_models.Seating).filter(
+            seating_models.Seating.event_id == event_id,
+            seating_models.Seating.table_id.in_(table_ids)
+        ).all()
+    
+    # Debug info
+    print(f"Found {len(tables)} tables for event {event_id}")
+    print(f"Found {len(guests)} guests for event {event_id}")
+    print(f"Found {len(seatings)} seatings for event {event_id}")
+    
+    # בדיקה אם יש מוזמנים
+    if len(guests) == 0:
+        # אם אין מוזמנים, נציג הודעה
+        img_width = 800
+        img_height = 400
+        img = Image.new('RGB', (img_width, img_height), color='white')
+        draw = ImageDraw.Draw(img)
+        
+        draw.text((img_width//2, img_height//2), f"No guests found for event {event_id}", 
+                 fill='red', anchor='mm')
+        
+        buffer = io.BytesIO()
+        img.save(buffer, format='PNG')
+        return buffer.getvalue()
+    
+    # יצירת תמונה
+    # גודל התמונה
+    img_width = 1800
+    img_height = 1200
+    img = Image.new('RGB', (img_width, img_height), color='white')
+    draw = ImageDraw.Draw(img)
+    
+    # ניסיון לטעון פונט גדול יותר
+    try:
+        # ניסיון לטעון פונט מערכת
+        font = ImageFont.truetype("arial.ttf", 16)
+        title_font = ImageFont.truetype("arial.ttf", 20)
+    except:
+        # אם לא מצליח, נשתמש בפונט ברירת מחדל
+        font = ImageFont.load_default()
+        title_font = ImageFont.load_default()
+    
+    # כותרת
+    title = f"Seating Map - Event {event_id}"
+    if gender:
+        title += f" ({gender})"
+    draw.text((img_width//2, 50), title, fill='black', anchor='mm', font=title_font)
+    
+    # קנה מידה לפי x,y אם קיימים
+    margin_x = 120
+    margin_y = 160
+    default_table_size = 110
+    has_positions = any(t.x is not None and t.y is not None for t in tables)
+
+    if has_positions:
+        xs = [t.x for t in tables if t.x is not None]
+        ys = [t.y for t in tables if t.y is not None]
+        min_x, max_x = min(xs), max(xs)
+        min_y, max_y = min(ys), max(ys)
+        span_x = max(1.0, max_x - min_x)
+        span_y = max(1.0, max_y - min_y)
+        scale_x = (img_width - 2 * margin_x) / span_x
+        scale_y = (img_height - 2 * margin_y) / span_y
+        scale = min(scale_x, scale_y)
+    
+    for i, table in enumerate(tables):
+        # מיקום
+        if has_positions and table.x is not None and table.y is not None:
+            x = margin_x + (table.x - min_x) * scale
+            y = margin_y + (table.y - min_y) * scale
+        else:
+            # פריסה רשתית אם אין קואורדינטות
+            row = i // 6
+            col = i % 6
+            x = margin_x + col * (default_table_size + 140)
+            y = margin_y + row * (default_table_size + 120)
+
+        size = default_table_size
+        # חישוב תפוסה לפני ציור כדי שנוכל לפלטר שולחנות
+        table_seatings = [s for s in seatings if s.table_id == table.id]
+        occupied = 0
+        for seating in table_seatings:
+            guest = db.query(models.Guest).filter(models.Guest.id == seating.guest_id).first()
+            if guest and (gender is None or guest.gender == gender):
+                occupied += 1
+        capacity = getattr(table, 'size', len(table_seatings) or 0)
+        empty = max(0, capacity - occupied)
+
+        # סינון: רק שולחנות ריקים (אפס תפוסים)
+        if only_empty_tables and occupied > 0:
+            continue
+        # סינון: רק שולחנות עם מקומות פנויים (לא מלאים)
+        if only_available_tables and empty == 0:
+            continue
+
+        # ציור שולחן לפי צורה (אחרי הסינון)
+        if getattr(table, 'shape', 'circular') == 'rectangular':
+            w = size * 1.4
+            h = size * 0.8
+            draw.rectangle([x - w/2, y - h/2, x + w/2, y + h/2], outline='blue', width=3)
+  
+        else:
+            draw.ellipse([x - size/2, y - size/2, x + size/2, y + size/2], outline='blue', width=3)
+
+        # מספר שולחן
+        draw.text((x, y), f"Table {table.table_number}", fill='blue', anchor='mm')
+
+        # טקסט סטטיסטי ליד השולחן
+        info = f"{occupied}/{capacity}"
+        draw.text((x, y + size/2 + 16), info, fill='darkgreen', anchor='mm', font=font)
+        if show_empty_seats:
+            draw.text((x, y + size/2 + 34), f"Empty: {empty}", fill='red', anchor='mm', font=font)
+    
+    # שמירת התמונה
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
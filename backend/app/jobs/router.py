@@ -0,0 +1,63 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse
+from app.auth.dependencies import get_current_user
+from app.jobs import tasks  # noqa: F401 - רישום סוגי המשימות
+from app.jobs.runner import JobQueueFull, job_runner
+from app.jobs.schemas import JobSubmit
+
+router = APIRouter(prefix="/jobs", tags=["Jobs"])
+
+
+def _get_own_job(job_id: str, current_user) -> dict:
+    job = job_runner.get(job_id)
+    # משימה של משתמש אחר מוצגת כלא קיימת (מנהל מערכת רואה הכל)
+    if not job or (job.get("user_id") not in (None, current_user.id) and current_user.role != "admin"):
+        raise HTTPException(status_code=404, detail="משימה לא נמצאה")
+    return job
+
+
+@router.post("/", status_code=202)
+def submit_job(body: JobSubmit, current_user = Depends(get_current_user)):
+    """הרצת ייצוא / יצירת כרטיסים ברקע. ההתקדמות דרך GET /jobs/{id}/progress"""
+    try:
+        return job_runner.submit(body.kind, body.event_id, body.params, user_id=current_user.id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"{e}. סוגים אפשריים: {', '.join(job_runner.kinds())}")
+    except JobQueueFull:
+        raise HTTPException(status_code=429, detail="יותר מדי משימות ממתינות, נסו שוב בעוד מספר דקות")
+
+
+@router.get("/event/{event_id}")
+def get_event_jobs(event_id: int, current_user = Depends(get_current_user)):
+    jobs = job_runner.list_for_event(event_id)
+    if current_user.role != "admin":
+        jobs = [job for job in jobs if job["user_id"] in (None, current_user.id)]
+    return jobs
+
+
+@router.get("/{job_id}")
+def get_job(job_id: str, current_user = Depends(get_current_user)):
+    return _get_own_job(job_id, current_user)
+
+
+@router.get("/{job_id}/progress")
+def get_job_progress(job_id: str, current_user = Depends(get_current_user)):
+    job = _get_own_job(job_id, current_user)
+    return {"id": job["id"], "status": job["status"], "progress": job["progress"], "message": job["message"],
+            "download_url": job["download_url"]}
+
+
+@router.post("/{job_id}/cancel")
+def cancel_job(job_id: str, current_user = Depends(get_current_user)):
+    _get_own_job(job_id, current_user)
+    return job_runner.cancel(job_id)
+
+
+@router.get("/{job_id}/download")
+def download_job_artifact(job_id: str, current_user = Depends(get_current_user)):
+    _get_own_job(job_id, current_user)
+    artifact = job_runner.artifact(job_id)
+    if artifact is None:
+        raise HTTPException(status_code=404, detail="הקובץ לא מוכן או שפג תוקפו")
+    path, filename, media_type = artifact
+    return FileResponse(path, media_type=media_type, filename=filename)
@@ -0,0 +1,296 @@
+import asyncio
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional
+
+from fastapi import HTTPException
+
+from app.core.config import settings
+from app.realtime.websocket_manager import websocket_manager
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+FINISHED_STATUSES = {JOB_SUCCEEDED, JOB_FAILED, JOB_CANCELLED}
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, kind: str, event_id: int, params: dict, user_id: Optional[int]):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.event_id = event_id
+        self.params = params
+        self.user_id = user_id
+        self.status = JOB_QUEUED
+        self.progress = 0
+        self.message: Optional[str] = None
+        self.error: Optional[str] = None
+        self.result: Optional[dict] = None
+        self.filename: Optional[str] = None
+        self.media_type: Optional[str] = None
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.cancel_requested = threading.Event()
+        self.future = None
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "event_id": self.event_id,
+            "user_id": self.user_id,
+            "status": self.status,
+            "progress": self.progress,
+            "message": self.message,
+            "error": self.error,
+            "result": self.result,
+            "filename": self.filename,
+            "media_type": self.media_type,
+            "download_url": f"/jobs/{self.id}/download" if self.filename and self.status == JOB_SUCCEEDED else None,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class JobContext:
+    """מה שמשימה מקבלת: דיווח התקדמות, בדיקת ביטול ונתיב לקובץ התוצר"""
+
+    def __init__(self, runner: "JobRunner", job: Job):
+        self.runner = runner
+        self.job = job
+
+    def check_cancelled(self):
+        if self.job.cancel_requested.is_set():
+            raise JobCancelled()
+
+    def progress(self, percent: int, message: Optional[str] = None):
+        self.check_cancelled()
+        self.job.progress = max(0, min(100, int(percent)))
+        if message is not None:
+            self.job.message = message
+
+    def artifact_path(self, filename: str, media_type: str) -> str:
+        self.job.filename = filename
+        self.job.media_type = media_type
+        directory = self.runner._job_dir(self.job.id)
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, filename)
+
+    def write_artifact(self, filename: str, media_type: str, content: bytes):
+        with open(self.artifact_path(filename, media_type), "wb") as f:
+            f.write(content)
+
+
+class JobRunner:
+    """
+    הרצת ייצואים ויצירת כרטיסים ברקע, ב-pool חסום של threads.
+    התוצרים נשמרים בדיסק לזמן מוגבל, ובסיום נשלחת הודעה לערוץ ה-WebSocket של האירוע.
+    """
+
+    def __init__(self):
+        self.directory = settings.JOB_ARTIFACT_DIR
+        self._tasks: Dict[str, tuple] = {}
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._last_cleanup = 0.0
+
+    def task(self, kind: str, params: tuple = ()):
+        """רישום סוג משימה. params - הפרמטרים שמותר לקבל מהקליינט"""
+        def decorator(handler: Callable[[JobContext, Any, int, dict], Optional[dict]]):
+            self._tasks[kind] = (handler, set(params))
+            return handler
+        return decorator
+
+    def kinds(self) -> list:
+        return sorted(self._tasks)
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+
+    async def stop(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+            for job in self._jobs.values():
+                job.cancel_requested.set()
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=settings.JOB_WORKERS, thread_name_prefix="job")
+        return self._executor
+
+    def _job_dir(self, job_id: str) -> str:
+        return os.path.join(self.directory, job_id)
+
+    def submit(self, kind: str, event_id: int, params: Optional[dict] = None, user_id: Optional[int] = None,
+               trusted: bool = False) -> dict:
+        """
+        הוספת משימה לתור. פרמטרים מהקליינט מסוננים לפי מה שהמשימה הגדירה;
+        trusted=True לקריאות פנימיות שמעבירות גם ערכים מהשרת (למשל נתיב לוגו שהועלה).
+        """
+        if kind not in self._tasks:
+            raise ValueError(f"סוג משימה לא מוכר: {kind}")
+        params = dict(params or {})
+        if not trusted:
+            allowed = self._tasks[kind][1]
+            params = {key: value for key, value in params.items() if key in allowed}
+        self.cleanup_expired()
+
+        job = Job(kind, event_id, params, user_id)
+        with self._lock:
+            pending = sum(1 for j in self._jobs.values() if j.status not in FINISHED_STATUSES)
+            if pending >= settings.JOB_MAX_PENDING:
+                raise JobQueueFull()
+            self._jobs[job.id] = job
+            job.future = self._get_executor().submit(self._run, job)
+        self._save_meta(job)
+        print(f"Job {job.id} ({kind}) queued for event {event_id}")
+        return job.to_dict()
+
+    def _run(self, job: Job):
+        from app.core.database import SessionLocal  # Local import to keep the runner importable without a DB
+
+        if job.cancel_requested.is_set():
+            self._finish(job, JOB_CANCELLED)
+            return
+        job.status = JOB_RUNNING
+        job.started_at = datetime.utcnow()
+        handler, _ = self._tasks[job.kind]
+        db = SessionLocal()
+        try:
+            job.result = handler(JobContext(self, job), db, job.event_id, job.params)
+            job.progress = 100
+            self._finish(job, JOB_SUCCEEDED)
+        except JobCancelled:
+            db.rollback()
+            self._finish(job, JOB_CANCELLED)
+        except Exception as e:
+            db.rollback()
+            job.error = str(e.detail) if isinstance(e, HTTPException) else str(e)
+            print(f"Job {job.id} ({job.kind}) failed: {job.error}")
+            self._finish(job, JOB_FAILED)
+        finally:
+            db.close()
+
+    def _finish(self, job: Job, status: str):
+        job.status = status
+        job.finished_at = datetime.utcnow()
+        if status != JOB_SUCCEEDED:
+            shutil.rmtree(self._job_dir(job.id), ignore_errors=True)
+            job.filename = None
+        self._save_meta(job)
+        self._notify(job)
+
+    def _save_meta(self, job: Job):
+        # קובץ מצב ליד התוצר, כדי ש-worker אחר יוכל להחזיר סטטוס ולהגיש את הקובץ
+        try:
+            directory = self._job_dir(job.id)
+            os.makedirs(directory, exist_ok=True)
+            tmp_path = os.path.join(directory, f"job.json.{threading.get_ident()}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(job.to_dict(), f, ensure_ascii=False)
+            os.replace(tmp_path, os.path.join(directory, "job.json"))
+        except OSError as e:
+            print(f"Failed to save job {job.id} state: {e}")
+
+    def _load_meta(self, job_id: str) -> Optional[dict]:
+        if not job_id.isalnum():
+            return None
+        path = os.path.join(self._job_dir(job_id), "job.json")
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def _notify(self, job: Job):
+        if self._loop is None or self._loop.is_closed():
+            return
+        message = {
+            "type": "job_finished",
+            "job_id": job.id,
+            "kind": job.kind,
+            "status": job.status,
+            "download_url": job.to_dict()["download_url"],
+            "error": job.error,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+        asyncio.run_coroutine_threadsafe(websocket_manager.broadcast_to_event(job.event_id, message), self._loop)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        self.cleanup_expired()
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        return self._load_meta(job_id)
+
+    def list_for_event(self, event_id: int) -> list:
+        with self._lock:
+            jobs = [job.to_dict() for job in self._jobs.values() if job.event_id == event_id]
+        return sorted(jobs, key=lambda j: j["created_at"], reverse=True)
+
+    def cancel(self, job_id: str) -> Optional[dict]:
+        job = self._jobs.get(job_id)
+        if job is None:
+            return self._load_meta(job_id)
+        if job.status in FINISHED_STATUSES:
+            return job.to_dict()
+        job.cancel_requested.set()
+        # משימה שעוד בתור מבוטלת מיד; משימה שרצה עוצרת בנקודת ההתקדמות הבאה
+        if job.future is not None and job.future.cancel():
+            self._finish(job, JOB_CANCELLED)
+        return job.to_dict()
+
+    def artifact(self, job_id: str) -> Optional[tuple]:
+        meta = self.get(job_id)
+        if not meta or meta["status"] != JOB_SUCCEEDED or not meta.get("filename"):
+            return None
+        path = os.path.join(self._job_dir(job_id), meta["filename"])
+        if not os.path.exists(path):
+            return None
+        return path, meta["filename"], meta["media_type"]
+
+    def cleanup_expired(self):
+        """מחיקת תוצרים ומשימות שהסתיימו לפני יותר מ-JOB_ARTIFACT_TTL_MINUTES (לכל היותר פעם בדקה)"""
+        now = time.time()
+        if now - self._last_cleanup < 60:
+            return
+        self._last_cleanup = now
+        ttl = timedelta(minutes=settings.JOB_ARTIFACT_TTL_MINUTES)
+        cutoff = now - ttl.total_seconds()
+        with self._lock:
+            for job_id, job in list(self._jobs.items()):
+                if job.finished_at is not None and datetime.utcnow() - job.finished_at > ttl:
+                    del self._jobs[job_id]
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if name not in self._jobs and os.path.getmtime(path) < cutoff:
+                    shutil.rmtree(path, ignore_errors=True)
+            except OSError:
+                continue
+
+
+job_runner = JobRunner()
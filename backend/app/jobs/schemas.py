@@ -0,0 +1,8 @@
+from pydantic import BaseModel
+from typing import Any, Dict
+
+
+class JobSubmit(BaseModel):
+    kind: str  # seating_cards / seating_cards_pdf / seating_map_pdf / guests_excel / seating_image
+    event_id: int
+    params: Dict[str, Any] = {}
@@ -0,0 +1,65 @@
+from sqlalchemy import func
+
+from app.guests import export as guest_export
+from app.guests import seating_image
+from app.jobs.runner import JobContext, job_runner
+from app.seatings import documents as seating_documents
+from app.seatings import repository as seating_repository
+from app.seatings.models import SeatingCard
+
+# סוגי המשימות שאפשר להריץ ברקע. כל משימה מקבלת session משלה ומחזירה סיכום קצר (או None)
+
+
+@job_runner.task("seating_cards", params=("force_recreate",))
+def generate_seating_cards_job(ctx: JobContext, db, event_id: int, params: dict):
+    cards = seating_repository.generate_cards_for_event(
+        db, event_id, params.get("logo_path"), bool(params.get("force_recreate")),
+        progress_callback=lambda state: ctx.progress(state.get("percent", 0), state.get("status"))
+    )
+    return {"cards": len(cards)}
+
+
+@job_runner.task("seating_cards_pdf")
+def seating_cards_pdf_job(ctx: JobContext, db, event_id: int, params: dict):
+    total = db.query(func.count(SeatingCard.id)).filter(SeatingCard.event_id == event_id).scalar()
+    if not total:
+        raise ValueError("לא נמצאו כרטיסי ישיבה לאירוע זה")
+    path = ctx.artifact_path(f"seating_cards_{event_id}.pdf", "application/pdf")
+    with open(path, "wb") as f:
+        for chunk in seating_documents.iter_cards_pdf(event_id, on_page=lambda count: ctx.progress(count * 99 // total)):
+            f.write(chunk)
+    return {"pages": total}
+
+
+@job_runner.task("seating_map_pdf", params=("include_empty_seats", "gender_filter", "guest_type_filter", "category_filter"))
+def seating_map_pdf_job(ctx: JobContext, db, event_id: int, params: dict):
+    ctx.progress(10)
+    content, filename = seating_documents.build_seating_map_filtered_pdf(
+        db, event_id, bool(params.get("include_empty_seats")), params.get("gender_filter"),
+        params.get("guest_type_filter"), params.get("category_filter")
+    )
+    ctx.progress(90)
+    ctx.write_artifact(filename, "application/pdf", content)
+
+
+@job_runner.task("guests_excel", params=("name", "gender", "confirmed_only", "format", "custom_fields"))
+def guests_excel_job(ctx: JobContext, db, event_id: int, params: dict):
+    file_format = "csv" if params.get("format") == "csv" else "xlsx"
+    ctx.progress(10)
+    path = ctx.artifact_path(f"guests_{event_id}.{file_format}", guest_export.export_media_type(file_format))
+    count = guest_export.write_guest_export(
+        db, path, file_format, event_id=event_id, name=params.get("name"), gender=params.get("gender"),
+        confirmed_only=params.get("confirmed_only"), custom_fields=bool(params.get("custom_fields"))
+    )
+    return {"guests": count}
+
+
+@job_runner.task("seating_image", params=("gender", "show_empty_seats", "show_occupied_seats", "only_empty_tables", "only_available_tables"))
+def seating_image_job(ctx: JobContext, db, event_id: int, params: dict):
+    ctx.progress(10)
+    content = seating_image.seating_image_bytes(
+        db, event_id, params.get("gender"), params.get("show_empty_seats", True), params.get("show_occupied_seats", True),
+        params.get("only_empty_tables", False), params.get("only_available_tables", False)
+    )
+    ctx.progress(90)
+    ctx.write_artifact(f"seating-map-{event_id}.png", "image/png", content)
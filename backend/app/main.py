@@ -1,9 +1,14 @@
 from fastapi import FastAPI
 from app.core.config import settings
 from app.seatings.models import Seating
-from app.core.database import Base, engine
+from app.core.database import Base, engine, dispose_engines
 import uvicorn
 from fastapi.middleware.cors import CORSMiddleware
+from app.realtime.checkin_writer import checkin_writer
+from app.realtime.websocket_manager import websocket_manager
+from app.seatings.card_generation import shutdown_render_pool
+from app.jobs.runner import job_runner
+from app.audit_log.pipeline import audit_drain
 
 # Import the centralized router
 import sys
@@ -30,6 +35,24 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def start_realtime():
+    # מחיל מחדש כניסות מהיומן שלא נכתבו לפני כיבוי/קריסה
+    await checkin_writer.start()
+    await websocket_manager.start()
+    await job_runner.start()
+    if settings.AUDIT_LOG_ASYNC:
+        audit_drain.start()
+
+@app.on_event("shutdown")
+async def stop_realtime():
+    await job_runner.stop()
+    audit_drain.stop()
+    await websocket_manager.stop()
+    await checkin_writer.stop()
+    shutdown_render_pool()
+    await dispose_engines()
+
 @app.get("/")
 def read_root():
     return {"message": "המערכת מוכנה!"}
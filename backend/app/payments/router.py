@@ -25,7 +25,7 @@ async def get_nedarim_plus_config(current_user: User = Depends(get_current_user)
 
 
 @router.post("", response_model=schemas.Payment)
-async def create_payment(
+def create_payment(
     payment: schemas.PaymentCreate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -37,7 +37,7 @@ async def create_payment(
 
 
 @router.get("/event/{event_id}", response_model=List[schemas.Payment])
-async def get_event_payments(
+def get_event_payments(
     event_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -49,7 +49,7 @@ async def get_event_payments(
 
 
 @router.get("/{payment_id}", response_model=schemas.Payment)
-async def get_payment(
+def get_payment(
     payment_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -64,7 +64,7 @@ async def get_payment(
 
 
 @router.post("/webhook/nedarim-plus/regular")
-async def nedarim_plus_webhook_regular(
+def nedarim_plus_webhook_regular(
     request: Request,
     webhook_data: schemas.NedarimPlusWebhookRegular,
     db: Session = Depends(get_db)
@@ -126,7 +126,7 @@ async def nedarim_plus_webhook_regular(
 
 
 @router.post("/webhook/nedarim-plus/keva")
-async def nedarim_plus_webhook_keva(
+def nedarim_plus_webhook_keva(
     request: Request,
     webhook_data: schemas.NedarimPlusWebhookKeva,
     db: Session = Depends(get_db)
@@ -187,7 +187,7 @@ async def nedarim_plus_webhook_keva(
 
 
 @router.patch("/{payment_id}", response_model=schemas.Payment)
-async def update_payment(
+def update_payment(
     payment_id: int,
     update_data: schemas.PaymentUpdate,
     db: Session = Depends(get_db),
@@ -0,0 +1,69 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.permissions.models import UserEventPermission
+
+
+class EventPermissionCache:
+    """
+    ההרשאות של כל משתמש בכל האירועים (event_id -> role_in_event), נטענות בשאילתה אחת למשתמש.
+    בדיקות הרשאה רצופות (מעצב האולם, עריכת שולחנות) ורשימת האירועים של המשתמש נשלפות מכאן.
+    שינויים דרך ה-repository / ה-router של ההרשאות קוראים ל-invalidate; ה-TTL מכסה שינויים מתהליכים אחרים.
+    המילונים המוחזרים משותפים בין בקשות - אסור לשנות אותם.
+    """
+
+    def __init__(self, ttl_seconds: int, max_users: int):
+        self.ttl = ttl_seconds
+        self.max_users = max_users
+        self._roles: "OrderedDict[int, Tuple[Dict[int, str], float]]" = OrderedDict()
+        self._generations: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def roles_for_user(self, db: Session, user_id: int) -> Dict[int, str]:
+        now = time.monotonic()
+        with self._lock:
+            cached = self._roles.get(user_id)
+            if cached is not None and cached[1] > now:
+                self._roles.move_to_end(user_id)
+                return cached[0]
+            generation = self._generations.get(user_id, 0)
+
+        roles = dict(
+            db.query(UserEventPermission.event_id, UserEventPermission.role_in_event)
+            .filter(UserEventPermission.user_id == user_id).all()
+        )
+
+        with self._lock:
+            # הרשאה שהשתנתה בזמן הטעינה - לא שומרים תוצאה שאולי לא כוללת אותה
+            if self._generations.get(user_id, 0) == generation:
+                self._roles[user_id] = (roles, now + self.ttl)
+                self._roles.move_to_end(user_id)
+                while len(self._roles) > self.max_users:
+                    self._roles.popitem(last=False)
+        return roles
+
+    def role_for(self, db: Session, user_id: int, event_id: int) -> Optional[str]:
+        return self.roles_for_user(db, user_id).get(event_id)
+
+    def invalidate_user(self, user_id: Optional[int]):
+        if user_id is None:
+            return
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            self._roles.pop(user_id, None)
+
+    def invalidate_event(self, event_id: int):
+        """מחיקת אירוע - כל המשתמשים שהייתה להם הרשאה בו"""
+        with self._lock:
+            for user_id, (roles, _) in list(self._roles.items()):
+                if event_id in roles:
+                    self._generations[user_id] = self._generations.get(user_id, 0) + 1
+                    del self._roles[user_id]
+
+
+permission_cache = EventPermissionCache(settings.PERMISSION_CACHE_TTL_SECONDS, settings.PERMISSION_CACHE_SIZE)
@@ -1,12 +1,14 @@
 from sqlalchemy.orm import Session
 from app.permissions import models, schemas
 from app.audit_log.repository import log_change
+from app.permissions.cache import permission_cache
 
 def create_permission(db: Session, permission: schemas.UserEventPermissionCreate, user_id: int = None):
     db_perm = models.UserEventPermission(**permission.dict())
     db.add(db_perm)
     db.commit()
     db.refresh(db_perm)
+    permission_cache.invalidate_user(db_perm.user_id)
     
     # Log the permission creation
     log_change(
@@ -47,4 +49,5 @@ def delete_permission(db: Session, permission_id: int, current_user_id: int = No
         
         db.delete(perm)
         db.commit()
+        permission_cache.invalidate_user(perm.user_id)
     return perm
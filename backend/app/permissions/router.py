@@ -5,6 +5,7 @@ from app.permissions import schemas, repository
 from pydantic import BaseModel
 from app.permissions.models import UserEventPermission
 from app.auth.dependencies import get_current_user
+from app.permissions.cache import permission_cache
 
 router = APIRouter(prefix="/permissions", tags=["Permissions"])
 
@@ -40,6 +41,7 @@ def update_permission(permission_id: int, update_data: PermissionUpdate, db: Ses
     perm.role_in_event = update_data.role_in_event
     db.commit()
     db.refresh(perm)
+    permission_cache.invalidate_user(perm.user_id)
     
     # Log the permission update
     from app.audit_log.repository import log_change
@@ -0,0 +1,377 @@
+import asyncio
+import json
+import re
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.guests.models import Guest
+from app.seatings.models import Seating
+from app.tables.models import Table
+
+_NON_DIGITS = re.compile(r"\D+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_phone(phone: Optional[str]) -> str:
+    """השארת ספרות בלבד כדי ש-050-1234567 ו-0501234567 ימופו לאותו מפתח"""
+    return _NON_DIGITS.sub("", phone or "")
+
+
+def normalize_name(first_name: Optional[str], last_name: Optional[str]) -> Tuple[str, str]:
+    first = _WHITESPACE.sub(" ", (first_name or "").strip()).casefold()
+    last = _WHITESPACE.sub(" ", (last_name or "").strip()).casefold()
+    return first, last
+
+
+class TableEntry:
+    __slots__ = ("id", "table_number", "size", "occupied")
+
+    def __init__(self, id: int, table_number: int, size: int, occupied: int = 0):
+        self.id = id
+        self.table_number = table_number
+        self.size = size
+        self.occupied = occupied
+
+
+class GuestEntry:
+    __slots__ = (
+        "id", "first_name", "last_name", "phone", "qr_code", "check_in_time",
+        "seating_id", "table_id", "seat_number", "is_occupied",
+    )
+
+    def __init__(self, id: int, first_name: str, last_name: str, phone: Optional[str],
+                 qr_code: Optional[str], check_in_time: Optional[datetime]):
+        self.id = id
+        self.first_name = first_name
+        self.last_name = last_name
+        self.phone = phone
+        self.qr_code = qr_code
+        self.check_in_time = check_in_time
+        self.seating_id = None
+        self.table_id = None
+        self.seat_number = None
+        self.is_occupied = False
+
+    @property
+    def has_seating(self) -> bool:
+        return self.seating_id is not None
+
+
+class EventChangeLog:
+    """
+    מונה גרסאות לשינויי צ'ק-אין של אירוע, לסנכרון סורקים אופליין.
+    כל שינוי במוזמן מקבל גרסה עולה; סורק ששמר גרסה מקבל רק את המוזמנים שהשתנו מאז.
+    epoch מתחלף כשהאינדקס נבנה מחדש (עריכת מוזמנים / שולחנות) - ואז נדרש snapshot מלא.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.epoch = uuid.uuid4().hex
+            self.version = 0
+            self._guest_versions: "OrderedDict[int, int]" = OrderedDict()
+
+    def record(self, guest_id: int):
+        with self._lock:
+            self.version += 1
+            self._guest_versions.pop(guest_id, None)
+            self._guest_versions[guest_id] = self.version
+
+    def changed_since(self, since: int) -> List[int]:
+        """מזהי המוזמנים שהשתנו אחרי הגרסה since (לפי סדר השינוי)"""
+        with self._lock:
+            changed = []
+            for guest_id, version in reversed(self._guest_versions.items()):
+                if version <= since:
+                    break
+                changed.append(guest_id)
+        changed.reverse()
+        return changed
+
+
+class CheckInIndex:
+    """
+    אינדקס צ'ק-אין בזיכרון לאירוע אחד.
+    נטען פעם אחת (שלוש שאילתות) ומאפשר זיהוי מוזמן לפי QR ב-O(1) ללא פניה למסד הנתונים.
+    """
+
+    def __init__(self, event_id: int):
+        self.event_id = event_id
+        self.loaded_at = datetime.utcnow()
+        self.guests: Dict[int, GuestEntry] = {}
+        self.tables: Dict[int, TableEntry] = {}
+        self.by_phone: Dict[str, int] = {}
+        self.by_name: Dict[Tuple[str, str], int] = {}
+        self.by_qr_code: Dict[str, int] = {}
+        self.changes: Optional[EventChangeLog] = None
+
+    @classmethod
+    def from_rows(cls, event_id: int, guest_rows, seating_rows, table_rows) -> "CheckInIndex":
+        index = cls(event_id)
+        for row in table_rows:
+            index.tables[row.id] = TableEntry(row.id, row.table_number, row.size or 0)
+        for row in guest_rows:
+            index._add_guest(GuestEntry(row.id, row.first_name, row.last_name, row.phone, row.qr_code, row.check_in_time))
+        for row in seating_rows:
+            entry = index.guests.get(row.guest_id)
+            if not entry or entry.seating_id is not None:
+                continue
+            entry.seating_id = row.id
+            entry.table_id = row.table_id
+            entry.seat_number = row.seat_number
+            entry.is_occupied = bool(row.is_occupied)
+            table = index.tables.get(row.table_id)
+            if table and entry.is_occupied:
+                table.occupied += 1
+        return index
+
+    @classmethod
+    def load(cls, db: Session, event_id: int) -> "CheckInIndex":
+        guest_rows = db.query(
+            Guest.id, Guest.first_name, Guest.last_name, Guest.phone, Guest.qr_code, Guest.check_in_time
+        ).filter(Guest.event_id == event_id).order_by(Guest.id).all()
+        seating_rows = db.query(
+            Seating.id, Seating.guest_id, Seating.table_id, Seating.seat_number, Seating.is_occupied
+        ).filter(Seating.event_id == event_id).order_by(Seating.id).all()
+        table_rows = db.query(
+            Table.id, Table.table_number, Table.size
+        ).filter(Table.event_id == event_id).all()
+        return cls.from_rows(event_id, guest_rows, seating_rows, table_rows)
+
+    def _add_guest(self, entry: GuestEntry):
+        self.guests[entry.id] = entry
+        # כמו ב-first() המקורי - המוזמן הראשון (לפי id) זוכה במפתח
+        phone = normalize_phone(entry.phone)
+        if phone:
+            self.by_phone.setdefault(phone, entry.id)
+        name = normalize_name(entry.first_name, entry.last_name)
+        if name[0] and name[1]:
+            self.by_name.setdefault(name, entry.id)
+        if entry.qr_code:
+            self.by_qr_code.setdefault(entry.qr_code, entry.id)
+
+    def resolve(self, qr_code: str) -> Optional[GuestEntry]:
+        """זיהוי מוזמן לפי תוכן ה-QR: JSON חדש, פורמט GUEST_<id>_EVENT_<id> ישן או Guest.qr_code"""
+        guest_id = None
+
+        # נסיון 1: פורמט JSON חדש שמכיל פרטי מוזמן
+        if qr_code.strip().startswith("{"):
+            try:
+                payload = json.loads(qr_code)
+            except ValueError:
+                payload = None
+            if isinstance(payload, dict):
+                qr_event_id = payload.get("event_id")
+                try:
+                    mismatch = bool(qr_event_id) and int(qr_event_id) != int(self.event_id)
+                except (TypeError, ValueError):
+                    mismatch = True
+                if mismatch:
+                    raise HTTPException(status_code=400, detail="קוד QR לא תואם לאירוע זה")
+                phone = normalize_phone(payload.get("phone"))
+                if phone:
+                    guest_id = self.by_phone.get(phone)
+                if guest_id is None:
+                    name = normalize_name(payload.get("first_name"), payload.get("last_name"))
+                    if name[0] and name[1]:
+                        guest_id = self.by_name.get(name)
+
+        # נסיון 2: פורמט טקסט הישן GUEST_<id>_EVENT_<id>
+        if guest_id is None and qr_code.startswith("GUEST_") and "_EVENT_" in qr_code:
+            parts = qr_code.split("_")
+            try:
+                if len(parts) < 4:
+                    raise ValueError(qr_code)
+                legacy_guest_id = int(parts[1])
+                legacy_event_id = int(parts[3])
+            except ValueError:
+                raise HTTPException(status_code=400, detail="פורמט קוד QR לא תקין")
+            if legacy_event_id != self.event_id:
+                raise HTTPException(status_code=400, detail="קוד QR לא תואם לאירוע זה")
+            if legacy_guest_id in self.guests:
+                guest_id = legacy_guest_id
+
+        # נסיון 3: חיפוש לפי Guest.qr_code ההיסטורי
+        if guest_id is None:
+            guest_id = self.by_qr_code.get(qr_code)
+
+        return self.guests.get(guest_id) if guest_id is not None else None
+
+    def occupancy_after_check_in(self, entry: GuestEntry) -> Optional[Tuple[TableEntry, int]]:
+        """מחזיר את השולחן ואת מספר המקומות התפוסים בו אחרי כניסת המוזמן (בלי לשנות את האינדקס)"""
+        table = self.tables.get(entry.table_id) if entry.has_seating else None
+        if not table:
+            return None
+        return table, table.occupied + (0 if entry.is_occupied else 1)
+
+    def mark_checked_in(self, entry: GuestEntry, check_in_time: datetime):
+        """עדכון האינדקס אחרי שהכניסה אושרה (נרשמה ביומן הכתיבה)"""
+        if entry.check_in_time is None:
+            entry.check_in_time = check_in_time
+            self._record_change(entry)
+        self.mark_seat_occupied(entry)
+
+    def mark_seat_occupied(self, entry: GuestEntry):
+        if entry.has_seating and not entry.is_occupied:
+            entry.is_occupied = True
+            table = self.tables.get(entry.table_id)
+            if table:
+                table.occupied += 1
+            self._record_change(entry)
+
+    def _record_change(self, entry: GuestEntry):
+        if self.changes is not None:
+            self.changes.record(entry.id)
+
+    def stats(self) -> dict:
+        return {
+            "event_id": self.event_id,
+            "loaded_at": self.loaded_at.isoformat(),
+            "guests": len(self.guests),
+            "tables": len(self.tables),
+            "checked_in": sum(1 for g in self.guests.values() if g.check_in_time),
+            "occupied_seats": sum(t.occupied for t in self.tables.values()),
+        }
+
+
+class CheckInIndexManager:
+    """
+    ניהול אינדקסי הצ'ק-אין של כל האירועים בתהליך.
+    טעינה אחת בכל פעם לכל אירוע, ואינדקס שנשמר לא מוחלף - כניסות שסומנו בו היו הולכות לאיבוד.
+    """
+
+    def __init__(self):
+        self._indexes: Dict[int, CheckInIndex] = {}
+        self._change_logs: Dict[int, EventChangeLog] = {}
+        self._generations: Dict[int, int] = {}
+        self._load_locks: Dict[int, threading.Lock] = {}
+        self._async_load_locks: Dict[int, asyncio.Lock] = {}
+        # כניסות שנרשמו ב-workers אחרים ואולי עוד לא הגיעו למסד: event_id -> guest_id -> check_in_time
+        self._remote_check_ins: Dict[int, Dict[int, str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, event_id: int) -> Optional[CheckInIndex]:
+        return self._indexes.get(event_id)
+
+    def load(self, db: Session, event_id: int) -> CheckInIndex:
+        """
+        בונה את האינדקס מהמסד ושומר אותו, אלא אם טעינה מקבילה כבר שמרה אינדקס (אז הוא מוחזר)
+        או שהיה invalidate בזמן הבנייה (אז האינדקס מוחזר בלי להישמר, והטעינה הבאה תבנה מחדש).
+        """
+        with self._lock:
+            generation = self._generations.get(event_id, 0)
+
+        index = CheckInIndex.load(db, event_id)
+        self._prune_remote(index)
+        # כניסות שאושרו אבל עוד ממתינות בתור הכתיבה לא מופיעות במסד - מחילים אותן על האינדקס
+        self._apply_pending(index)
+        # מחברים את יומן השינויים רק אחרי ההחלה, כדי שהרשומות הממתינות לא ייחשבו שינויים חדשים
+        index.changes = self.change_log(event_id)
+
+        with self._lock:
+            current = self._indexes.get(event_id)
+            if current is not None:
+                return current
+            if self._generations.get(event_id, 0) != generation:
+                return index
+            self._indexes[event_id] = index
+            # כניסות שנכנסו לתור בזמן הבנייה
+            self._apply_pending(index)
+        print(f"Check-in index loaded for event {event_id}: {len(index.guests)} guests, {len(index.tables)} tables")
+        return index
+
+    def _apply_pending(self, index: CheckInIndex):
+        from app.realtime.checkin_writer import checkin_writer  # Local import to avoid circular dependency
+        records = [(r["guest_id"], r["check_in_time"]) for r in checkin_writer.pending_for_event(index.event_id)]
+        records.extend(list(self._remote_check_ins.get(index.event_id, {}).items()))
+        for guest_id, check_in_time in records:
+            entry = index.guests.get(guest_id)
+            if entry:
+                index.mark_checked_in(entry, datetime.fromisoformat(check_in_time))
+
+    def _prune_remote(self, index: CheckInIndex):
+        """כניסה מרוחקת שכבר מופיעה במסד (או שהמוזמן נמחק) כבר לא צריכה להישמר"""
+        with self._lock:
+            remote = self._remote_check_ins.get(index.event_id)
+            if not remote:
+                return
+            for guest_id in list(remote):
+                entry = index.guests.get(guest_id)
+                if entry is None or entry.check_in_time is not None:
+                    del remote[guest_id]
+
+    def apply_remote_check_ins(self, event_id: int, check_ins: List[Tuple[int, str]]):
+        """כניסות שנרשמו ב-worker אחר - מסומנות באינדקס הטעון ונשמרות לטעינה הבאה עד שיגיעו למסד"""
+        with self._lock:
+            remote = self._remote_check_ins.setdefault(event_id, {})
+            for guest_id, check_in_time in check_ins:
+                remote.setdefault(guest_id, check_in_time)
+            index = self._indexes.get(event_id)
+        if index is None:
+            return
+        for guest_id, check_in_time in check_ins:
+            entry = index.guests.get(guest_id)
+            if entry:
+                index.mark_checked_in(entry, datetime.fromisoformat(check_in_time))
+
+    def _load_lock(self, event_id: int) -> threading.Lock:
+        with self._lock:
+            return self._load_locks.setdefault(event_id, threading.Lock())
+
+    def _async_load_lock(self, event_id: int) -> asyncio.Lock:
+        # run_sync רץ ב-thread של ה-event loop - נעילת threading שם הייתה חוסמת את כל הלולאה
+        with self._lock:
+            return self._async_load_locks.setdefault(event_id, asyncio.Lock())
+
+    def get_or_load(self, db: Session, event_id: int) -> CheckInIndex:
+        index = self._indexes.get(event_id)
+        if index is None:
+            # סריקות "קרות" מקבילות מחכות לטעינה אחת במקום לבנות כל אחת אינדקס משלה
+            with self._load_lock(event_id):
+                index = self._indexes.get(event_id)
+                if index is None:
+                    index = self.load(db, event_id)
+        return index
+
+    async def get_or_load_async(self, db: AsyncSession, event_id: int) -> CheckInIndex:
+        """כמו get_or_load, לנתיבים אסינכרוניים - הטעינה רצה על חיבור asyncpg בלי לחסום את ה-event loop"""
+        index = self._indexes.get(event_id)
+        if index is None:
+            async with self._async_load_lock(event_id):
+                index = self._indexes.get(event_id)
+                if index is None:
+                    index = await db.run_sync(self.load, event_id)
+        return index
+
+    def change_log(self, event_id: int) -> EventChangeLog:
+        with self._lock:
+            log = self._change_logs.get(event_id)
+            if log is None:
+                log = self._change_logs[event_id] = EventChangeLog()
+            return log
+
+    def invalidate(self, event_id: Optional[int]):
+        """נקרא אחרי כתיבות של מוזמנים / מקומות ישיבה / שולחנות - הטעינה הבאה תבנה את האינדקס מחדש"""
+        if event_id is None:
+            return
+        with self._lock:
+            # טעינה שרצה עכשיו אולי לא כוללת את הכתיבה - היא לא תישמר
+            self._generations[event_id] = self._generations.get(event_id, 0) + 1
+            self._indexes.pop(event_id, None)
+            log = self._change_logs.get(event_id)
+        if log is not None:
+            # הסורקים יקבלו epoch חדש ויטענו snapshot מלא
+            log.reset()
+
+
+checkin_index_manager = CheckInIndexManager()
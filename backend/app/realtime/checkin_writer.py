@@ -0,0 +1,404 @@
+import asyncio
+import json
+import os
+import re
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import bindparam, case, insert, update
+from sqlalchemy.exc import DataError, IntegrityError
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.guests.models import Guest
+from app.realtime.models import AttendanceLog, RealTimeNotification
+from app.seatings.models import Seating
+
+try:
+    import fcntl
+except ImportError:  # Windows - אין נעילת קבצים, מתאים רק ל-worker יחיד
+    fcntl = None
+
+_guests = Guest.__table__
+_seatings = Seating.__table__
+_attendance_logs = AttendanceLog.__table__
+_notifications = RealTimeNotification.__table__
+
+# כניסה חדשה: מעדכנים מוזמן + מקום ישיבה ויוצרים לוג נוכחות והתראות
+KIND_CHECK_IN = "check_in"
+# מוזמן שכבר נכנס אבל המקום שלו לא סומן כתפוס
+KIND_SEAT_OCCUPIED = "seat_occupied"
+
+
+class CheckInWriter:
+    """
+    כתיבה נדחית (write-behind) של תופעות הלוואי של צ'ק-אין.
+
+    כל סריקה נרשמת קודם ביומן מקומי (append-only + fsync קבוצתי) ורק אז מקבלת אישור,
+    וכל כמה מילישניות הרשומות הממתינות נכתבות למסד הנתונים בטרנזקציה אחת
+    עם INSERT/UPDATE מרובי שורות. אחרי קריסה, רשומות שלא נשמרו מוחלות מחדש מהיומן.
+    רשומה שהמסד דוחה (מוזמן או שולחן שנמחקו בינתיים) עוברת לקובץ dead letter ולא עוצרת את השאר.
+
+    כל תהליך (worker של uvicorn) כותב ליומן משלו: <name>.<n>.jsonl, עם נעילה בלעדית על הקובץ.
+    בהפעלה כל תהליך לוקח את היומן הפנוי הראשון, ויומנים פנויים נוספים (של workers שנפלו) מוחלים ומקוצרים.
+    """
+
+    def __init__(self, journal_path: str, flush_interval_ms: int = 5, max_batch: int = 500):
+        self.base_path = journal_path
+        # היומן של התהליך הזה - נקבע ב-start לפי היומן הפנוי הראשון
+        self.journal_path = journal_path
+        self.commit_path = f"{journal_path}.commit"
+        self.dead_letter_path = f"{os.path.splitext(journal_path)[0]}.dead.jsonl"
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_batch = max_batch
+        self._journal = None
+        self._seq = 0
+        self._synced_seq = 0
+        self._committed_seq = 0
+        self._sync_task: Optional[asyncio.Future] = None
+        self._pending: List[dict] = []
+        self._flusher: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+        self._failures = 0
+        self._dead_letters = 0
+
+    # ---------- מחזור חיים ----------
+
+    async def start(self):
+        if self._flusher is not None:
+            return
+        slot = 0
+        while not self._open_journal(self._slot_path(slot)):
+            slot += 1
+        remaining = await self._recover()
+        if remaining:
+            # תקלה במסד לא מפילה את השרת - הרשומות נשארות ביומן וה-flusher ימשיך לנסות
+            self._pending.extend(remaining)
+        await self._sweep_orphans()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._flusher = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._flusher is None:
+            return
+        # לא מבטלים את ה-flusher: כתיבה שכבר רצה ב-thread עלולה לעשות commit אחרי הביטול,
+        # והניקוז למטה היה כותב את אותה מנה שוב. מחכים שהסבב הנוכחי יסתיים
+        self._stopping = True
+        self._wakeup.set()
+        await self._flusher
+        self._flusher = None
+        # ניקוז אחרון לפני כיבוי
+        while self._pending:
+            if not await self._flush_once():
+                break
+        if self._journal:
+            self._journal.close()
+            self._journal = None
+
+    # ---------- API ----------
+
+    async def submit(self, record: dict) -> int:
+        """רישום ביומן והמתנה ל-fsync. אחרי החזרה הכניסה נחשבת מאושרת גם אם התהליך קורס"""
+        return await self.submit_many([record])
+
+    async def submit_many(self, records: List[dict]) -> int:
+        """רישום מנה של רשומות (למשל סנכרון של סורק אופליין) עם fsync אחד לכולן"""
+        if not records:
+            return self._seq
+        if self._flusher is None:
+            await self.start()
+        for record in records:
+            self._seq += 1
+            record["seq"] = self._seq
+            self._journal.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._pending.append(record)
+        await self._wait_durable(records[-1]["seq"])
+        if len(self._pending) >= self.max_batch:
+            self._wakeup.set()
+        return records[-1]["seq"]
+
+    def pending_for_event(self, event_id: int) -> List[dict]:
+        """רשומות שאושרו אבל עוד לא נכתבו - לטעינת אינדקס הצ'ק-אין בלי לאבד אותן"""
+        return [r for r in list(self._pending) if r["event_id"] == event_id]
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "last_seq": self._seq,
+            "synced_seq": self._synced_seq,
+            "committed_seq": self._committed_seq,
+            "consecutive_failures": self._failures,
+            "dead_letters": self._dead_letters,
+        }
+
+    # ---------- יומן ----------
+
+    def _slot_path(self, slot: int) -> str:
+        root, ext = os.path.splitext(self.base_path)
+        return f"{root}.{slot}{ext}"
+
+    def _open_journal(self, path: str) -> bool:
+        """פותח ונועל את היומן. False אם תהליך אחר מחזיק בו"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        journal = open(path, "a+", encoding="utf-8")
+        if fcntl is not None:
+            try:
+                # הנעילה משתחררת לבד כשהתהליך מסתיים, גם בקריסה
+                fcntl.flock(journal.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                journal.close()
+                return False
+        self.journal_path = path
+        self.commit_path = f"{path}.commit"
+        try:
+            with open(self.commit_path, "r", encoding="utf-8") as f:
+                self._committed_seq = int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            self._committed_seq = 0
+        self._journal = journal
+        self._seq = self._synced_seq = self._committed_seq
+        return True
+
+    async def _recover(self) -> List[dict]:
+        """
+        מחיל מחדש רשומות מהיומן שלא סומנו כנשמרות, ומקצר אותו.
+        מחזיר את הרשומות שלא נכתבו בגלל תקלה זמנית במסד - הן נשארות ביומן.
+        """
+        replay = self._read_uncommitted()
+        written = 0
+        if replay:
+            print(f"Check-in journal {self.journal_path}: replaying {len(replay)} uncommitted check-ins")
+            try:
+                written = await asyncio.to_thread(self._persist, replay)
+            except Exception as e:
+                print(f"Check-in journal {self.journal_path}: replay failed: {e}")
+            if written:
+                self._mark_committed(replay[written - 1]["seq"])
+        remaining = replay[written:]
+        if not remaining:
+            self._compact()
+        return remaining
+
+    async def _sweep_orphans(self):
+        """יומנים שאף תהליך לא נועל - של workers שנפלו או שכבר לא רצים. מחילים ומשחררים"""
+        directory = os.path.dirname(self.base_path) or "."
+        root, ext = os.path.splitext(os.path.basename(self.base_path))
+        # גם היומן בשם הבסיסי, מגרסה שבה כל התהליכים כתבו לקובץ אחד
+        pattern = re.compile(rf"{re.escape(root)}(\.\d+)?{re.escape(ext)}")
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if not pattern.fullmatch(name) or os.path.abspath(path) == os.path.abspath(self.journal_path):
+                continue
+            orphan = CheckInWriter(self.base_path, max_batch=self.max_batch)
+            if not orphan._open_journal(path):
+                continue
+            try:
+                if await orphan._recover():
+                    print(f"Check-in journal {path}: not fully replayed, will retry on next start")
+            finally:
+                # הקובץ נשאר (ריק) - מחיקה הייתה מאפשרת לתהליך אחר לנעול קובץ שכבר אינו בתיקייה
+                orphan._journal.close()
+
+    def _read_uncommitted(self) -> List[dict]:
+        records = []
+        self._journal.seek(0)
+        for line in self._journal:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # שורה אחרונה שנכתבה חלקית לפני קריסה - לא אושרה ללקוח
+                continue
+            self._seq = max(self._seq, record["seq"])
+            if record["seq"] > self._committed_seq:
+                records.append(record)
+        self._synced_seq = self._seq
+        return records
+
+    async def _wait_durable(self, seq: int):
+        # fsync קבוצתי: כל הסריקות שנכתבו בזמן fsync אחד ממתינות ל-fsync הבא יחד
+        while self._synced_seq < seq:
+            if self._sync_task is None:
+                self._sync_task = asyncio.ensure_future(self._fsync())
+            await asyncio.shield(self._sync_task)
+
+    async def _fsync(self):
+        try:
+            target = self._seq
+            self._journal.flush()
+            await asyncio.to_thread(os.fsync, self._journal.fileno())
+            self._synced_seq = max(self._synced_seq, target)
+        finally:
+            self._sync_task = None
+
+    def _mark_committed(self, seq: int):
+        self._committed_seq = max(self._committed_seq, seq)
+        tmp_path = f"{self.commit_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(str(self._committed_seq))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.commit_path)
+
+    def _compact(self):
+        """כשאין רשומות ממתינות - היומן כולו נשמר במסד ואפשר לקצר אותו"""
+        if self._pending or self._committed_seq < self._seq:
+            return
+        self._journal.seek(0)
+        self._journal.truncate()
+        self._journal.flush()
+
+    # ---------- כתיבה למסד ----------
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._pending and not self._stopping:
+                await self._flush_once()
+
+    async def _flush_once(self) -> bool:
+        batch = self._pending[:self.max_batch]
+        try:
+            written = await asyncio.to_thread(self._persist, batch)
+        except Exception as e:
+            self._failures += 1
+            print(f"Check-in flush failed ({self._failures}): {e}")
+            # הרשומות נשארות ביומן ובתור - ננסה שוב בהמשך עם השהייה הולכת וגדלה
+            await asyncio.sleep(min(self.flush_interval * (2 ** self._failures), 5))
+            return False
+        self._failures = 0
+        del self._pending[:written]
+        self._mark_committed(batch[written - 1]["seq"])
+        self._compact()
+        # תקלה זמנית באמצע הכתיבה רשומה-רשומה - השאר נשארות בתור לסבב הבא
+        return written == len(batch)
+
+    def _persist(self, records: List[dict]) -> int:
+        """
+        כותב את הרשומות ומחזיר כמה מהן, מההתחלה, טופלו (נכתבו או הועברו ל-dead letter).
+        אם המנה נכשלה - כתיבה רשומה-רשומה, כדי שרשומה אחת שהמסד דוחה לא תחסום את כל הבאות אחריה.
+        """
+        try:
+            self._write_batch(records)
+            return len(records)
+        except Exception as e:
+            print(f"Check-in batch of {len(records)} failed, retrying record by record: {str(e).splitlines()[0]}")
+
+        written = 0
+        for record in records:
+            try:
+                self._write_batch([record])
+            except (IntegrityError, DataError) as e:
+                # הרשומה עצמה לא תקינה מול המסד (למשל מפתח זר למוזמן / שולחן שנמחק) - ניסיון חוזר לא יעזור
+                self._dead_letter(record, e)
+            except Exception:
+                # תקלה זמנית (חיבור, timeout) - עוצרים כאן, והשאר יכתבו בסבב הבא
+                if written == 0:
+                    raise
+                return written
+            written += 1
+        return written
+
+    def _dead_letter(self, record: dict, error: Exception):
+        message = str(error).splitlines()[0]
+        print(f"Check-in record {record['seq']} (guest {record.get('guest_id')}) moved to dead letter: {message}")
+        entry = {"record": record, "error": message, "failed_at": datetime.now().isoformat()}
+        with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._dead_letters += 1
+
+    def _write_batch(self, records: List[dict]):
+        db = SessionLocal()
+        try:
+            # הכניסה נרשמת רק למוזמן שעוד לא נכנס - גם אם worker אחר סרק אותו במקביל (כל worker עם אינדקס משלו),
+            # וגם בהפעלה מחדש אחרי קריסה: רשומה שכבר נכתבה לא תעדכן שוב את המוזמן ולא תיצור לוג כפול
+            first_check_in: Dict[int, datetime] = {}
+            for record in records:
+                if record["kind"] == KIND_CHECK_IN:
+                    first_check_in.setdefault(record["guest_id"], datetime.fromisoformat(record["check_in_time"]))
+            checked_in = set()
+            if first_check_in:
+                checked_in = set(db.execute(
+                    update(_guests)
+                    .where(_guests.c.id.in_(first_check_in), _guests.c.check_in_time.is_(None))
+                    .values(
+                        check_in_time=case(first_check_in, value=_guests.c.id),
+                        last_scan_time=case(first_check_in, value=_guests.c.id),
+                    )
+                    .returning(_guests.c.id)
+                ).scalars())
+                duplicates = sum(1 for r in records if r["kind"] == KIND_CHECK_IN) - len(checked_in)
+                if duplicates:
+                    print(f"Check-in writer: {duplicates} check-ins skipped - guest already checked in")
+
+            seating_rows, log_rows, notification_rows = [], [], []
+            for record in records:
+                check_in_time = datetime.fromisoformat(record["check_in_time"])
+                if record["kind"] == KIND_CHECK_IN:
+                    if record["guest_id"] not in checked_in:
+                        continue
+                    # רשומה אחת לכל מוזמן, גם אם נסרק פעמיים באותה מנה
+                    checked_in.discard(record["guest_id"])
+                if record.get("seating_id"):
+                    seating_rows.append({
+                        "b_seating_id": record["seating_id"],
+                        "b_occupied_at": check_in_time,
+                        "b_occupied_by": record["guest_id"],
+                    })
+                if record["kind"] != KIND_CHECK_IN:
+                    continue
+                log_rows.append({
+                    "guest_id": record["guest_id"],
+                    "event_id": record["event_id"],
+                    "check_in_time": check_in_time,
+                    "check_out_time": None,
+                    "scanned_by": record.get("scanned_by"),
+                    "qr_code_data": record.get("qr_code"),
+                    "status": "checked_in",
+                    "notes": None,
+                })
+                for notification in record.get("notifications", []):
+                    notification_rows.append({
+                        "event_id": record["event_id"],
+                        "notification_type": notification["notification_type"],
+                        "guest_id": notification.get("guest_id"),
+                        "table_id": notification.get("table_id"),
+                        "message": notification["message"],
+                        "created_at": check_in_time,
+                        "is_read": False,
+                        "severity": notification.get("severity", "info"),
+                        "priority": 1,
+                        "persistent": notification.get("persistent", False),
+                    })
+
+            if seating_rows:
+                db.execute(
+                    update(_seatings)
+                    .where(_seatings.c.id == bindparam("b_seating_id"))
+                    .values(is_occupied=True, occupied_at=bindparam("b_occupied_at"), occupied_by=bindparam("b_occupied_by")),
+                    seating_rows
+                )
+            if log_rows:
+                db.execute(insert(_attendance_logs), log_rows)
+            if notification_rows:
+                db.execute(insert(_notifications), notification_rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+checkin_writer = CheckInWriter(
+    settings.CHECKIN_JOURNAL_PATH,
+    flush_interval_ms=settings.CHECKIN_FLUSH_INTERVAL_MS,
+    max_batch=settings.CHECKIN_FLUSH_MAX_BATCH,
+)
@@ -0,0 +1,72 @@
+import asyncio
+import json
+from typing import List, Optional
+
+from app.guests.search import guest_search_cache
+from app.realtime.checkin_index import checkin_index_manager
+from app.realtime.websocket_manager import TARGET_CACHE, websocket_manager
+from app.seatings.projection import seating_projection_cache
+from app.tables.spatial import hall_spatial_cache
+
+# כניסות בכל הודעה - כדי להישאר מתחת למגבלת ה-NOTIFY של פוסטגרס
+CHECK_INS_PER_MESSAGE = 50
+
+
+def invalidate_event_caches(event_id: Optional[int]):
+    """
+    נקרא אחרי כל כתיבה של מוזמנים / מקומות ישיבה / שולחנות / ראשי שולחן / אלמנטים באולם.
+    מנקה את כל המטמונים של האירוע בתהליך הזה ומפיץ את הניקוי לשאר ה-workers דרך ה-pub/sub.
+    """
+    if event_id is None:
+        return
+    _invalidate_local(event_id)
+    _publish(event_id, {"op": "invalidate"})
+
+
+def publish_check_ins(event_id: int, records: List[dict]):
+    """כניסות שנרשמו ביומן של ה-worker הזה - שאר ה-workers מסמנים אותן באינדקס שלהם"""
+    check_ins = [[r["guest_id"], r["check_in_time"]] for r in records]
+    for start in range(0, len(check_ins), CHECK_INS_PER_MESSAGE):
+        _publish(event_id, {"op": "check_in", "check_ins": check_ins[start:start + CHECK_INS_PER_MESSAGE]})
+
+
+def apply_remote(event_id: int, payload: str):
+    """הודעת מטמון מ-worker אחר"""
+    message = json.loads(payload)
+    if message["op"] == "invalidate":
+        _invalidate_local(event_id)
+    elif message["op"] == "check_in":
+        checkin_index_manager.apply_remote_check_ins(event_id, [(g, t) for g, t in message["check_ins"]])
+
+
+def _invalidate_local(event_id: int):
+    checkin_index_manager.invalidate(event_id)
+    seating_projection_cache.invalidate(event_id)
+    guest_search_cache.invalidate(event_id)
+    hall_spatial_cache.invalidate(event_id)
+
+
+def _publish(event_id: int, message: dict):
+    pubsub = websocket_manager.pubsub
+    loop = websocket_manager.loop
+    if pubsub.name == "memory" or loop is None or loop.is_closed():
+        return
+    publish = pubsub.publish(event_id, json.dumps(message), TARGET_CACHE)
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    # רוב הכתיבות רצות ב-threadpool של FastAPI - הפרסום עובר ל-event loop של השרת
+    if running is loop:
+        future = loop.create_task(publish)
+    else:
+        future = asyncio.run_coroutine_threadsafe(publish, loop)
+    future.add_done_callback(_report_publish_error)
+
+
+def _report_publish_error(future):
+    if future.cancelled():
+        return
+    error = future.exception()
+    if error is not None:
+        print(f"Cache invalidation publish failed: {error}")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Text
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Text, Index
 from sqlalchemy.orm import relationship
 from app.core.database import Base
 from datetime import datetime
@@ -32,4 +32,15 @@ class RealTimeNotification(Base):
     persistent = Column(Boolean, default=False)  # התראות שלא נעלמות אוטומטית
     event = relationship("Event", back_populates="realtime_notifications")
     guest = relationship("Guest", back_populates="realtime_notifications")
-    table = relationship("Table", back_populates="realtime_notifications") 
\ No newline at end of file
+    table = relationship("Table", back_populates="realtime_notifications") 
+class RealtimeReplayMessage(Base):
+    """הודעות זרם ה-WebSocket לשחזור פערים ארוכים (WS_REPLAY_SPILL) - לא התראות"""
+    __tablename__ = "realtime_replay_messages"
+    id = Column(Integer, primary_key=True, index=True)
+    event_id = Column(Integer, nullable=False)
+    stream_id = Column(String(32), nullable=False)
+    seq = Column(Integer, nullable=False)
+    target = Column(String(16), nullable=False)
+    payload = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    __table_args__ = (Index("ix_realtime_replay_messages_stream_seq", "event_id", "stream_id", "seq"),)
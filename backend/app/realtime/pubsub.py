@@ -0,0 +1,244 @@
+import asyncio
+import json
+import uuid
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+from app.core.config import settings
+
+# מגבלת payload של NOTIFY בפוסטגרס היא 8000 בתים
+PG_NOTIFY_MAX_BYTES = 7900
+
+MessageHandler = Callable[[int, str, str], Awaitable[None]]
+
+
+def _encode(origin: str, event_id: int, payload: str, target: str) -> str:
+    return json.dumps({"o": origin, "e": event_id, "p": payload, "t": target})
+
+
+def _decode(origin: str, data) -> Optional[tuple]:
+    if isinstance(data, bytes):
+        data = data.decode("utf-8")
+    envelope = json.loads(data)
+    # הודעה שחוזרת מה-pub/sub אלינו כבר נשלחה לחיבורים המקומיים
+    if envelope.get("o") == origin:
+        return None
+    return int(envelope["e"]), envelope["p"], envelope.get("t", "all")
+
+
+class InProcessPubSub:
+    """ברירת מחדל לתהליך יחיד - ההודעה כבר נשלחה לחיבורים המקומיים ואין למי להעביר"""
+
+    name = "memory"
+
+    async def start(self, handler: MessageHandler):
+        self.handler = handler
+
+    async def publish(self, event_id: int, payload: str, target: str):
+        pass
+
+    async def stop(self):
+        pass
+
+
+class PostgresPubSub:
+    """הפצה בין workers ושרתים דרך LISTEN/NOTIFY של פוסטגרס (asyncpg)"""
+
+    name = "postgres"
+
+    def __init__(self, dsn: str, channel: str):
+        self.dsn = dsn
+        self.channel = channel
+        self.worker_id = uuid.uuid4().hex
+        self._listen_conn = None
+        self._publish_conn = None
+        self._handler: Optional[MessageHandler] = None
+        self._reconnect_task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    async def start(self, handler: MessageHandler):
+        self._handler = handler
+        await self._connect()
+
+    async def _connect(self):
+        import asyncpg
+
+        self._listen_conn = await asyncpg.connect(self.dsn)
+        self._listen_conn.add_termination_listener(self._on_terminated)
+        await self._listen_conn.add_listener(self.channel, self._on_notify)
+        self._publish_conn = await asyncpg.connect(self.dsn)
+        print(f"Realtime pub/sub listening on postgres channel '{self.channel}'")
+
+    def _on_notify(self, connection, pid, channel, data):
+        message = _decode(self.worker_id, data)
+        if message:
+            asyncio.ensure_future(self._handler(*message))
+
+    def _on_terminated(self, connection):
+        if not self._stopping and self._reconnect_task is None:
+            self._reconnect_task = asyncio.ensure_future(self._reconnect())
+
+    async def _reconnect(self):
+        delay = 0.5
+        try:
+            while not self._stopping:
+                try:
+                    await self._close_connections()
+                    await self._connect()
+                    return
+                except Exception as e:
+                    print(f"Realtime pub/sub reconnect failed: {e}")
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, 10)
+        finally:
+            self._reconnect_task = None
+
+    async def publish(self, event_id: int, payload: str, target: str):
+        data = _encode(self.worker_id, event_id, payload, target)
+        if len(data.encode("utf-8")) > PG_NOTIFY_MAX_BYTES:
+            print(f"Realtime message for event {event_id} too large for NOTIFY, delivered locally only")
+            return
+        await self._publish_conn.execute("SELECT pg_notify($1, $2)", self.channel, data)
+
+    async def _close_connections(self):
+        for conn in (self._listen_conn, self._publish_conn):
+            if conn is not None and not conn.is_closed():
+                await conn.close()
+        self._listen_conn = self._publish_conn = None
+
+    async def stop(self):
+        self._stopping = True
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+        await self._close_connections()
+
+
+class RedisPubSub:
+    """
+    הפצה דרך Redis PUBLISH/SUBSCRIBE (redis.asyncio).
+    כל שרת תואם Redis מתאים; לבדיקות ולפיתוח בלי שרת - LoopbackPubSub.
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str, channel: str):
+        self.url = url
+        self.channel = channel
+        self.worker_id = uuid.uuid4().hex
+        self._client = None
+        self._pubsub = None
+        self._reader: Optional[asyncio.Task] = None
+
+    def _create_client(self):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("REALTIME_PUBSUB_BACKEND=redis דורש את החבילה redis (pip install redis)")
+        return redis.from_url(self.url)
+
+    async def start(self, handler: MessageHandler):
+        self._client = self._create_client()
+        self._pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        await self._pubsub.subscribe(self.channel)
+        self._reader = asyncio.create_task(self._read(handler))
+        print(f"Realtime pub/sub subscribed to {self.name} channel '{self.channel}'")
+
+    async def _read(self, handler: MessageHandler):
+        while True:
+            try:
+                async for item in self._pubsub.listen():
+                    if item.get("type") != "message":
+                        continue
+                    message = _decode(self.worker_id, item["data"])
+                    if message:
+                        await handler(*message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # החיבור נפל - redis-py מתחבר מחדש בקריאה הבאה
+                print(f"Realtime pub/sub read failed: {e}")
+                await asyncio.sleep(1)
+
+    async def publish(self, event_id: int, payload: str, target: str):
+        await self._client.publish(self.channel, _encode(self.worker_id, event_id, payload, target))
+
+    async def stop(self):
+        if self._reader is not None:
+            self._reader.cancel()
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+        if self._client is not None:
+            await self._client.aclose()
+
+
+class LoopbackRedis:
+    """
+    תחליף מקומי לשרת Redis: רק PUBLISH / SUBSCRIBE, בתוך התהליך, באותו ממשק של redis.asyncio.
+    כל הלקוחות בתהליך חולקים את הערוצים - כמה WebSocketManager באותו תהליך מתנהגים כמו כמה workers.
+    """
+
+    _channels: Dict[str, Set["LoopbackRedisPubSub"]] = {}
+
+    async def publish(self, channel: str, data) -> int:
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        subscribers = list(self._channels.get(channel, ()))
+        for subscriber in subscribers:
+            subscriber.deliver({"type": "message", "channel": channel.encode("utf-8"), "data": data})
+        return len(subscribers)
+
+    def pubsub(self, ignore_subscribe_messages: bool = False) -> "LoopbackRedisPubSub":
+        return LoopbackRedisPubSub(self._channels, ignore_subscribe_messages)
+
+    async def aclose(self):
+        pass
+
+
+class LoopbackRedisPubSub:
+    def __init__(self, channels: Dict[str, Set["LoopbackRedisPubSub"]], ignore_subscribe_messages: bool):
+        self._channels = channels
+        self._ignore_subscribe_messages = ignore_subscribe_messages
+        self._subscribed: Set[str] = set()
+        self._queue: asyncio.Queue = asyncio.Queue()
+
+    def deliver(self, item: dict):
+        self._queue.put_nowait(item)
+
+    async def subscribe(self, *channels: str):
+        for channel in channels:
+            self._channels.setdefault(channel, set()).add(self)
+            self._subscribed.add(channel)
+            if not self._ignore_subscribe_messages:
+                self.deliver({"type": "subscribe", "channel": channel.encode("utf-8"), "data": len(self._subscribed)})
+
+    async def listen(self):
+        while self._subscribed:
+            yield await self._queue.get()
+
+    async def aclose(self):
+        for channel in self._subscribed:
+            self._channels.get(channel, set()).discard(self)
+        self._subscribed.clear()
+
+
+class LoopbackPubSub(RedisPubSub):
+    """RedisPubSub מול LoopbackRedis - אותו מסלול קוד כמו מול Redis אמיתי, בלי שרת (בדיקות ופיתוח)"""
+
+    name = "loopback"
+
+    def __init__(self, channel: str):
+        super().__init__("", channel)
+
+    def _create_client(self):
+        return LoopbackRedis()
+
+
+def create_pubsub():
+    backend = settings.REALTIME_PUBSUB_BACKEND
+    if backend == "postgres":
+        from app.core.database import DATABASE_URL
+        return PostgresPubSub(settings.REALTIME_PUBSUB_DSN or DATABASE_URL, settings.REALTIME_PUBSUB_CHANNEL)
+    if backend == "redis":
+        return RedisPubSub(settings.REDIS_URL, settings.REALTIME_PUBSUB_CHANNEL)
+    if backend == "loopback":
+        return LoopbackPubSub(settings.REALTIME_PUBSUB_CHANNEL)
+    return InProcessPubSub()
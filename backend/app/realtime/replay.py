@@ -0,0 +1,159 @@
+import asyncio
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, insert, select
+
+from app.core.config import settings
+from app.realtime.models import RealtimeReplayMessage
+
+_replay_messages = RealtimeReplayMessage.__table__
+
+
+def with_seq(payload: str, seq: int) -> str:
+    """הוספת מספר רצף להודעה שכבר עברה סריאליזציה, בלי לפענח אותה מחדש"""
+    if payload == "{}":
+        return '{"seq":%d}' % seq
+    return '{"seq":%d,%s' % (seq, payload[1:])
+
+
+class EventStream:
+    """
+    זרם ההודעות של אירוע בתהליך הנוכחי: מספרי רצף עולים ובאפר טבעתי של ההודעות האחרונות.
+    stream_id מתחלף בכל הפעלה של התהליך - קליינט עם stream_id אחר צריך לטעון מצב מלא.
+    """
+
+    def __init__(self, event_id: int, stream_id: str):
+        self.event_id = event_id
+        self.stream_id = stream_id
+        self.seq = 0
+        self.buffer: deque = deque(maxlen=settings.WS_REPLAY_BUFFER_SIZE)
+
+    def append(self, payload: str, target: str) -> Tuple[int, str]:
+        self.seq += 1
+        sequenced = with_seq(payload, self.seq)
+        self.buffer.append((self.seq, target, sequenced))
+        return self.seq, sequenced
+
+    def oldest_seq(self) -> Optional[int]:
+        return self.buffer[0][0] if self.buffer else None
+
+    def since(self, last_seq: int) -> List[Tuple[int, str, str]]:
+        return [entry for entry in self.buffer if entry[0] > last_seq]
+
+
+class ReplaySpill:
+    """שמירה אופציונלית של הודעות הזרם בטבלת realtime_replay_messages, בכתיבה מרוכזת ברקע"""
+
+    def __init__(self):
+        self._pending: List[dict] = []
+        self._task: Optional[asyncio.Task] = None
+        self._last_cleanup = datetime.utcnow()
+
+    def add(self, stream: EventStream, seq: int, target: str, payload: str):
+        self._pending.append({
+            "event_id": stream.event_id,
+            "stream_id": stream.stream_id,
+            "seq": seq,
+            "target": target,
+            "payload": payload,
+            "created_at": datetime.utcnow(),
+        })
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._flush_later())
+
+    async def _flush_later(self):
+        try:
+            await asyncio.sleep(settings.WS_REPLAY_SPILL_INTERVAL_MS / 1000)
+            rows, self._pending = self._pending, []
+            cleanup = datetime.utcnow() - self._last_cleanup > timedelta(minutes=1)
+            if cleanup:
+                self._last_cleanup = datetime.utcnow()
+            if rows:
+                await asyncio.to_thread(self._write, rows, cleanup)
+        except Exception as e:
+            print(f"Replay spill failed: {e}")
+        finally:
+            self._task = None
+
+    @staticmethod
+    def _write(rows: List[dict], cleanup: bool):
+        from app.core.database import SessionLocal  # Local import to keep the websocket layer importable without a DB
+
+        db = SessionLocal()
+        try:
+            db.execute(insert(_replay_messages), rows)
+            if cleanup:
+                # ניקוי הודעות זרם ישנות - ה-replay נועד לפערים קצרים אחרי ניתוק
+                cutoff = datetime.utcnow() - timedelta(minutes=settings.WS_REPLAY_SPILL_TTL_MINUTES)
+                db.execute(delete(_replay_messages).where(_replay_messages.c.created_at < cutoff))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    @staticmethod
+    def load(event_id: int, stream_id: str, after_seq: int, up_to_seq: int) -> List[Tuple[int, str, str]]:
+        from app.core.database import SessionLocal  # Local import to keep the websocket layer importable without a DB
+
+        db = SessionLocal()
+        try:
+            rows = db.execute(
+                select(_replay_messages.c.seq, _replay_messages.c.target, _replay_messages.c.payload).where(
+                    _replay_messages.c.event_id == event_id,
+                    _replay_messages.c.stream_id == stream_id,
+                    _replay_messages.c.seq > after_seq,
+                    _replay_messages.c.seq <= up_to_seq
+                ).order_by(_replay_messages.c.seq)
+            ).all()
+            return [(row.seq, row.target, row.payload) for row in rows]
+        finally:
+            db.close()
+
+
+class ReplayStreams:
+    """זרמי ההודעות של כל האירועים, ושחזור פער לקליינט שמתחבר מחדש"""
+
+    def __init__(self):
+        self.stream_id = uuid.uuid4().hex[:12]
+        self._streams: Dict[int, EventStream] = {}
+        self.spill = ReplaySpill() if settings.WS_REPLAY_SPILL else None
+
+    def get(self, event_id: int) -> EventStream:
+        stream = self._streams.get(event_id)
+        if stream is None:
+            stream = self._streams[event_id] = EventStream(event_id, self.stream_id)
+        return stream
+
+    def append(self, event_id: int, payload: str, target: str) -> Tuple[int, str]:
+        stream = self.get(event_id)
+        seq, sequenced = stream.append(payload, target)
+        if self.spill is not None:
+            self.spill.add(stream, seq, target, sequenced)
+        return seq, sequenced
+
+    async def missed(self, event_id: int, stream_id: Optional[str], last_seq: int) -> Optional[List[Tuple[int, str, str]]]:
+        """
+        ההודעות שהקליינט פספס אחרי last_seq, או None אם אי אפשר להשלים את הפער
+        (זרם אחר / הפער נפלט מהבאפר ואין שמירה במסד) - ואז הקליינט צריך לטעון מצב מלא.
+        """
+        stream = self.get(event_id)
+        if stream_id != stream.stream_id or last_seq > stream.seq:
+            return None
+        if last_seq == stream.seq:
+            return []
+        oldest = stream.oldest_seq()
+        if oldest is not None and oldest <= last_seq + 1:
+            return stream.since(last_seq)
+        if self.spill is None:
+            return None
+        # החלק הישן של הפער מהמסד, והשאר מהבאפר
+        up_to = (oldest - 1) if oldest is not None else stream.seq
+        older = await asyncio.to_thread(ReplaySpill.load, event_id, stream.stream_id, last_seq, up_to)
+        if not older or older[0][0] != last_seq + 1:
+            return None
+        return older + stream.since(up_to)
@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
 class AttendanceLogBase(BaseModel):
     guest_id: int
@@ -41,4 +41,35 @@ class QRScanResponse(BaseModel):
     status: str
     message: str
     guest: Optional[dict] = None
-    has_seating: Optional[bool] = None 
\ No newline at end of file
+    has_seating: Optional[bool] = None 
+
+class OfflineCheckIn(BaseModel):
+    client_id: str
+    guest_id: Optional[int] = None
+    qr_code: Optional[str] = None
+    scanned_at: Optional[datetime] = None
+
+class OfflineSyncRequest(BaseModel):
+    scanner_id: str
+    epoch: Optional[str] = None
+    since: int = 0
+    check_ins: List[OfflineCheckIn] = []
+
+class OfflineCheckInResult(BaseModel):
+    client_id: str
+    status: str
+    guest_id: Optional[int] = None
+    detail: Optional[str] = None
+
+class SyncDelta(BaseModel):
+    epoch: str
+    version: int
+    reset: bool = False
+    guest_columns: List[str]
+    guests: List[list]
+    table_columns: List[str]
+    tables: List[list]
+
+class OfflineSyncResponse(BaseModel):
+    results: List[OfflineCheckInResult]
+    delta: SyncDelta
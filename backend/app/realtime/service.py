@@ -0,0 +1,299 @@
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from app.realtime.checkin_index import CheckInIndex, GuestEntry, checkin_index_manager
+from app.realtime.checkin_writer import checkin_writer, KIND_CHECK_IN, KIND_SEAT_OCCUPIED
+from app.realtime.event_caches import publish_check_ins
+from app.realtime.websocket_manager import websocket_manager
+
+
+def guest_arrived_message(guest: GuestEntry, table_number: Optional[int]) -> dict:
+    return {
+        "type": "guest_arrived",
+        "guest": {
+            "id": guest.id,
+            "first_name": guest.first_name,
+            "last_name": guest.last_name,
+            "table_id": guest.table_id,
+            "table_number": table_number
+        },
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+
+def table_alert(guest: GuestEntry, table, occupied_seats: int):
+    """התראת תפוסה לשולחן: (notification, websocket_message) או None מתחת ל-80%"""
+    total_seats = table.size
+    occupancy_percentage = (occupied_seats / total_seats) * 100 if total_seats > 0 else 0
+    guest_name = f"{guest.first_name} {guest.last_name}"
+
+    if occupancy_percentage > 100:
+        # התראה על שולחן מלא מדי (יותר מ-100%) - התראה שלא נעלמת אוטומטית
+        notification_type, severity, persistent = "table_overbooked", "error", True
+        message = f"שולחן {table.table_number} מלא מדי! ({occupancy_percentage:.1f}%) - מוזמן {guest_name} נכנס לשולחן מלא מדי"
+    elif occupancy_percentage >= 100:
+        notification_type, severity, persistent = "table_full", "warning", True
+        message = f"שולחן {table.table_number} מלא! מוזמן {guest_name} נכנס לשולחן מלא"
+    elif occupancy_percentage >= 80:
+        notification_type, severity, persistent = "table_almost_full", "info", False
+        message = f"שולחן {table.table_number} כמעט מלא ({occupancy_percentage:.1f}%) - מוזמן {guest_name} נכנס"
+    else:
+        return None
+
+    notification = {
+        "notification_type": notification_type,
+        "guest_id": guest.id,
+        "table_id": table.id,
+        "message": message,
+        "severity": severity,
+        "persistent": persistent
+    }
+    websocket_message = {
+        "type": notification_type,
+        "table": {
+            "id": table.id,
+            "table_number": table.table_number,
+            "occupied_seats": occupied_seats,
+            "total_seats": total_seats,
+            "occupancy_percentage": occupancy_percentage
+        },
+        "guest": {
+            "id": guest.id,
+            "first_name": guest.first_name,
+            "last_name": guest.last_name
+        },
+        "timestamp": datetime.utcnow().isoformat()
+    }
+    return notification, websocket_message
+
+
+class CheckInPlan:
+    """תוצאת צ'ק-אין של מוזמן אחד: סטטוס, רשומת יומן (אם יש מה לכתוב) והודעות WebSocket"""
+
+    def __init__(self, status: str, guest: GuestEntry, table_number: Optional[int],
+                 record: Optional[dict] = None, websocket_messages: Optional[List[dict]] = None):
+        self.status = status
+        self.guest = guest
+        self.table_number = table_number
+        self.record = record
+        self.websocket_messages = websocket_messages or []
+        # מספר התפוסים בשולחן אחרי הכניסה - לעדכוני delta
+        self.table_occupied: Optional[int] = None
+
+
+def plan_check_in(index: CheckInIndex, guest: GuestEntry, qr_code: Optional[str],
+                  check_in_time: Optional[datetime] = None) -> CheckInPlan:
+    """
+    חישוב תופעות הלוואי של כניסת מוזמן ועדכון האינדקס מיד,
+    כך שסריקה נוספת של אותו מוזמן (או מוזמן נוסף באותה מנה) כבר רואה את המצב החדש.
+    """
+    event_id = index.event_id
+    table = index.tables.get(guest.table_id) if guest.has_seating else None
+    table_number = table.table_number if table else None
+
+    if guest.check_in_time:
+        # בדיקה אם ה-seating מעודכן
+        if guest.has_seating and not guest.is_occupied:
+            index.mark_seat_occupied(guest)
+            record = {
+                "kind": KIND_SEAT_OCCUPIED,
+                "event_id": event_id,
+                "guest_id": guest.id,
+                "seating_id": guest.seating_id,
+                "check_in_time": guest.check_in_time.isoformat()
+            }
+            plan = CheckInPlan("already_checked_in", guest, table_number, record, [guest_arrived_message(guest, table_number)])
+            plan.table_occupied = table.occupied if table else None
+            return plan
+        return CheckInPlan("already_checked_in", guest, table_number)
+
+    check_in_time = check_in_time or datetime.utcnow()
+    notifications = []
+    websocket_messages = []
+
+    if guest.has_seating:
+        # בדיקת תפוסת השולחן - לפי מונה התפוסה של האינדקס במקום COUNT(*)
+        occupancy = index.occupancy_after_check_in(guest)
+        if occupancy:
+            alert = table_alert(guest, *occupancy)
+            if alert:
+                notifications.append(alert[0])
+                websocket_messages.append(alert[1])
+
+        # התראה רגילה על כניסת מוזמן
+        notifications.append({
+            "notification_type": "guest_arrived",
+            "guest_id": guest.id,
+            "table_id": guest.table_id,
+            "message": f"מוזמן {guest.first_name} {guest.last_name} נכנס לאירוע",
+            "severity": "info"
+        })
+    else:
+        notifications.append({
+            "notification_type": "guest_arrived_no_seat",
+            "guest_id": guest.id,
+            "message": f"מוזמן {guest.first_name} {guest.last_name} נכנס ללא מקום ישיבה",
+            "severity": "warning"
+        })
+
+    index.mark_checked_in(guest, check_in_time)
+    websocket_messages.append(guest_arrived_message(guest, table_number))
+    # עדכון מוזמן + מקום ישיבה, לוג נוכחות והתראות נכתבים ביומן ומשם למסד בקבוצות
+    record = {
+        "kind": KIND_CHECK_IN,
+        "event_id": event_id,
+        "guest_id": guest.id,
+        "seating_id": guest.seating_id,
+        "check_in_time": check_in_time.isoformat(),
+        "qr_code": qr_code,
+        "notifications": notifications
+    }
+    plan = CheckInPlan("success", guest, table_number, record, websocket_messages)
+    plan.table_occupied = table.occupied if table else None
+    return plan
+
+
+async def commit_check_ins(event_id: int, plans: List[CheckInPlan]):
+    """רישום כל הכניסות ביומן (fsync אחד) ואז שידור העדכונים לדשבורדים"""
+    records = [plan.record for plan in plans if plan.record]
+    if records:
+        try:
+            await checkin_writer.submit_many(records)
+        except Exception:
+            # האינדקס כבר עודכן - בלי רישום ביומן הוא כבר לא משקף את המצב, נטען אותו מחדש
+            checkin_index_manager.invalidate(event_id)
+            raise
+        publish_check_ins(event_id, records)
+    for plan in plans:
+        for websocket_message in plan.websocket_messages:
+            await websocket_manager.broadcast_to_event(event_id, websocket_message)
+        if plan.record:
+            websocket_manager.add_occupancy_delta(
+                event_id,
+                table_id=plan.guest.table_id if plan.table_occupied is not None else None,
+                occupied=plan.table_occupied,
+                arrived_guest_id=plan.guest.id if plan.status == "success" else None
+            )
+
+
+# ---------- סנכרון סורקים אופליין ----------
+
+GUEST_COLUMNS = ["id", "first_name", "last_name", "phone", "qr_code", "table_id", "table_number", "seat_number", "check_in_time", "is_occupied"]
+TABLE_COLUMNS = ["id", "table_number", "size", "occupied"]
+
+
+def _guest_row(index: CheckInIndex, guest: GuestEntry) -> list:
+    table = index.tables.get(guest.table_id) if guest.has_seating else None
+    return [
+        guest.id, guest.first_name, guest.last_name, guest.phone, guest.qr_code,
+        guest.table_id, table.table_number if table else None, guest.seat_number,
+        guest.check_in_time.isoformat() if guest.check_in_time else None, guest.is_occupied
+    ]
+
+
+def _table_row(table) -> list:
+    return [table.id, table.table_number, table.size, table.occupied]
+
+
+def build_sync_delta(index: CheckInIndex, epoch: Optional[str] = None, since: int = 0) -> dict:
+    """
+    מצב האירוע לסורק: רק המוזמנים והשולחנות שהשתנו מאז (epoch, since),
+    או snapshot מלא (reset=True) כשהסורק חדש או שהאינדקס נבנה מחדש מאז הסנכרון הקודם.
+    השורות עמודתיות (רשימות לפי guest_columns / table_columns) כדי לחסוך בגודל התשובה.
+    """
+    changes = index.changes
+    current_epoch, version = changes.epoch, changes.version
+    reset = epoch != current_epoch or since > version
+    if reset:
+        guests = list(index.guests.values())
+        tables = list(index.tables.values())
+    else:
+        guests = [index.guests[guest_id] for guest_id in changes.changed_since(since) if guest_id in index.guests]
+        table_ids = {guest.table_id for guest in guests if guest.has_seating}
+        tables = [index.tables[table_id] for table_id in table_ids if table_id in index.tables]
+    return {
+        "epoch": current_epoch,
+        "version": version,
+        "reset": reset,
+        "guest_columns": GUEST_COLUMNS,
+        "guests": [_guest_row(index, guest) for guest in guests],
+        "table_columns": TABLE_COLUMNS,
+        "tables": [_table_row(table) for table in tables],
+    }
+
+
+class ProcessedScans:
+    """זיכרון מוגבל של client_id שכבר טופלו, כדי ששליחה חוזרת של אותה מנה תחזיר את אותה תשובה"""
+
+    def __init__(self, max_size: int = 50000):
+        self.max_size = max_size
+        self._results: "OrderedDict[Tuple[int, str], dict]" = OrderedDict()
+
+    def get(self, event_id: int, client_id: str) -> Optional[dict]:
+        return self._results.get((event_id, client_id))
+
+    def add(self, event_id: int, client_id: str, result: dict):
+        self._results[(event_id, client_id)] = result
+        while len(self._results) > self.max_size:
+            self._results.popitem(last=False)
+
+
+processed_scans = ProcessedScans()
+
+
+def _scan_time(scanned_at: Optional[datetime], now: datetime) -> datetime:
+    """זמן הסריקה מהסורק, ב-UTC וללא אזור זמן; שעון סורק שרץ קדימה לא יכול לייצר כניסה עתידית"""
+    if scanned_at is None:
+        return now
+    if scanned_at.tzinfo is not None:
+        scanned_at = scanned_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return min(scanned_at, now)
+
+
+async def sync_offline_check_ins(index: CheckInIndex, scanner_id: str, check_ins) -> List[dict]:
+    """
+    החלת מנה של סריקות שנאספו אופליין. כל פריט מזוהה לפי client_id ולכן השליחה אידמפוטנטית;
+    מוזמן שכבר נכנס (מסורק אחר או מהמנה עצמה) מקבל already_checked_in - הכניסה הראשונה קובעת.
+    כל הכניסות נרשמות ביומן עם fsync אחד.
+    """
+    event_id = index.event_id
+    now = datetime.utcnow()
+    results = []
+    plans = []
+    for item in check_ins:
+        previous = processed_scans.get(event_id, item.client_id)
+        if previous is not None:
+            results.append(previous)
+            continue
+
+        try:
+            if item.guest_id is not None:
+                guest = index.guests.get(item.guest_id)
+            elif item.qr_code:
+                guest = index.resolve(item.qr_code)
+            else:
+                guest = None
+        except HTTPException as e:
+            results.append({"client_id": item.client_id, "status": "invalid", "detail": e.detail})
+            continue
+        if guest is None:
+            results.append({"client_id": item.client_id, "status": "not_found", "detail": "מוזמן לא נמצא"})
+            continue
+
+        plan = plan_check_in(index, guest, item.qr_code, _scan_time(item.scanned_at, now))
+        if plan.record:
+            plan.record["scanned_by"] = scanner_id
+        plans.append(plan)
+        result = {"client_id": item.client_id, "status": plan.status, "guest_id": guest.id}
+        results.append(result)
+
+    await commit_check_ins(event_id, plans)
+    # רק אחרי שהמנה נרשמה ביומן - אחרת שליחה חוזרת חייבת להיות מעובדת מחדש
+    for result in results:
+        if "guest_id" in result:
+            processed_scans.add(event_id, result["client_id"], result)
+    print(f"Offline sync from scanner {scanner_id}: {len(check_ins)} scans, {sum(1 for p in plans if p.status == 'success')} new check-ins")
+    return results
@@ -1,33 +1,295 @@
 import asyncio
-from typing import Dict, Set
+import time
+from collections import deque
+from typing import Dict, Optional, Set
 from fastapi import WebSocket
 import json
+from datetime import datetime
+
+from app.core.config import settings
+from app.realtime.pubsub import create_pubsub
+from app.realtime.replay import ReplayStreams
+
+# קוד סגירה לקליינט שלא עומד בקצב - הדשבורד יתחבר מחדש ויטען מצב עדכני
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+# מצב full: כל הודעה נשלחת כמו שהיא. מצב delta: הודעות הצ'ק-אין מוחלפות בעדכון מרוכז ודחוס
+MODE_FULL = "full"
+MODE_DELTA = "delta"
+# יעד הודעה: כולם / רק חיבורי full / רק חיבורי delta
+TARGET_ALL = "all"
+# הודעות בין workers על שינויים במטמונים (invalidate / כניסות) - לא נשלחות לחיבורים
+TARGET_CACHE = "cache"
+CHECKIN_MESSAGE_TYPES = {"guest_arrived", "table_full", "table_almost_full", "table_overbooked"}
+
+
+class PendingDelta:
+    """שינויי תפוסה שהצטברו לאירוע בחלון הנוכחי - מספר התפוסים האחרון לכל שולחן והמוזמנים שהגיעו"""
+
+    __slots__ = ("tables", "arrived", "task")
+
+    def __init__(self):
+        self.tables: Dict[int, int] = {}
+        self.arrived: list = []
+        self.task: Optional[asyncio.Task] = None
+
+
+class ConnectionWriter:
+    """
+    תור שליחה חסום לחיבור אחד, שמרוקן על ידי משימת כתיבה משלו.
+    שידור רק מכניס לתור, כך שטאבלט איטי אחד לא מעכב את שאר הדשבורדים.
+    """
+
+    def __init__(self, manager: "WebSocketManager", websocket: WebSocket, event_id: int):
+        self.manager = manager
+        self.websocket = websocket
+        self.event_id = event_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=settings.WS_SEND_QUEUE_SIZE)
+        self.mode = MODE_FULL
+        # בזמן שחזור פער ההודעות החיות נאספות כאן ונשלחות אחרי ה-replay
+        self.held: Optional[list] = None
+        self.sent = 0
+        self.max_depth = 0
+        self.closed = False
+        self.task = asyncio.create_task(self._run())
+
+    def enqueue(self, payload: str, seq: Optional[int] = None) -> bool:
+        if self.closed:
+            return False
+        if self.held is not None and seq is not None:
+            self.held.append((seq, payload))
+            return True
+        try:
+            self.queue.put_nowait((payload, time.perf_counter()))
+        except asyncio.QueueFull:
+            return False
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+        return True
+
+    async def _run(self):
+        try:
+            while True:
+                payload, enqueued_at = await self.queue.get()
+                await asyncio.wait_for(self.websocket.send_text(payload), timeout=settings.WS_SEND_TIMEOUT_SECONDS)
+                self.sent += 1
+                self.manager._record_latency(time.perf_counter() - enqueued_at)
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            self.manager._drop(self, "send_timeout")
+        except Exception:
+            # החיבור נסגר בצד השני
+            self.manager._drop(self, "send_error")
+
+    async def close(self, code: int = 1000):
+        self.closed = True
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
 
 class WebSocketManager:
     def __init__(self):
         self.active_connections: Dict[int, Set[WebSocket]] = {}
+        self._writers: Dict[WebSocket, ConnectionWriter] = {}
+        self._latencies = deque(maxlen=1000)
+        self._counters = {"broadcasts": 0, "enqueued": 0, "slow_disconnects": 0, "send_errors": 0, "remote_messages": 0, "publish_errors": 0, "replayed_messages": 0, "resyncs": 0}
+        self._pending_deltas: Dict[int, PendingDelta] = {}
+        self.replay = ReplayStreams()
+        self.pubsub = create_pubsub()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        await self.pubsub.start(self._deliver_remote)
+
+    async def stop(self):
+        await self.pubsub.stop()
 
     async def connect(self, websocket: WebSocket, event_id: int):
         await websocket.accept()
         if event_id not in self.active_connections:
             self.active_connections[event_id] = set()
         self.active_connections[event_id].add(websocket)
+        writer = self._writers[websocket] = ConnectionWriter(self, websocket, event_id)
+        # הקליינט שומר את stream_id ואת ה-seq האחרון שקיבל, ושולח אותם ב-resume אחרי ניתוק
+        stream = self.replay.get(event_id)
+        writer.enqueue(json.dumps({"type": "hello", "stream_id": stream.stream_id, "seq": stream.seq}))
 
     def disconnect(self, websocket: WebSocket, event_id: int):
         if event_id in self.active_connections:
             self.active_connections[event_id].discard(websocket)
             if not self.active_connections[event_id]:
                 del self.active_connections[event_id]
+        writer = self._writers.pop(websocket, None)
+        if writer is not None:
+            writer.closed = True
+            if writer.task is not asyncio.current_task():
+                writer.task.cancel()
+
+    def set_mode(self, websocket: WebSocket, mode: str) -> str:
+        writer = self._writers.get(websocket)
+        if writer is None:
+            return MODE_FULL
+        if mode in (MODE_FULL, MODE_DELTA):
+            writer.mode = mode
+        # האישור עובר באותו תור כמו שאר ההודעות, כדי לשמור על הסדר
+        writer.enqueue(json.dumps({"type": "subscribed", "mode": writer.mode}))
+        return writer.mode
+
+    async def resume(self, websocket: WebSocket, event_id: int, stream_id: Optional[str], last_seq: int):
+        """שליחת ההודעות שהקליינט פספס מאז last_seq בהודעת replay אחת, או resync_required"""
+        writer = self._writers.get(websocket)
+        if writer is None:
+            return
+        writer.held = []
+        try:
+            missed = await self.replay.missed(event_id, stream_id, last_seq)
+        except Exception as e:
+            print(f"Replay failed for event {event_id}: {e}")
+            missed = None
+        held, writer.held = writer.held, None
+        stream = self.replay.get(event_id)
+        if missed is None:
+            self._counters["resyncs"] += 1
+            enqueued = writer.enqueue(json.dumps({"type": "resync_required", "stream_id": stream.stream_id, "seq": stream.seq}))
+            replayed_to = last_seq
+        else:
+            messages = [payload for _, target, payload in missed if target == TARGET_ALL or target == writer.mode]
+            replayed_to = missed[-1][0] if missed else last_seq
+            self._counters["replayed_messages"] += len(messages)
+            enqueued = writer.enqueue('{"type":"replay","from":%d,"to":%d,"messages":[%s]}' % (last_seq, replayed_to, ",".join(messages)))
+        for seq, payload in held:
+            if not enqueued:
+                break
+            if seq > replayed_to:
+                enqueued = writer.enqueue(payload, seq)
+        if not enqueued:
+            # התור מלא - הקליינט היה מקבל זרם עם חור; מנתקים, והוא יתחבר מחדש וישחזר מה-seq האחרון שקיבל
+            self._drop(writer, "slow_consumer")
 
     async def broadcast_to_event(self, event_id: int, message: dict):
+        # הודעות צ'ק-אין מגיעות לחיבורי delta דרך add_occupancy_delta, לא כהודעות בודדות
+        target = MODE_FULL if message.get("type") in CHECKIN_MESSAGE_TYPES else TARGET_ALL
+        await self._broadcast(event_id, json.dumps(message), target)
+
+    async def _broadcast(self, event_id: int, payload: str, target: str):
+        # סריאליזציה פעם אחת לכל השידור, לא לכל חיבור
+        self._counters["broadcasts"] += 1
+        self._deliver(event_id, payload, target)
+        # דשבורדים שמחוברים ל-workers / שרתים אחרים מקבלים את ההודעה דרך ה-pub/sub
+        try:
+            await self.pubsub.publish(event_id, payload, target)
+        except Exception as e:
+            self._counters["publish_errors"] += 1
+            print(f"Realtime publish failed for event {event_id}: {e}")
+
+    def add_occupancy_delta(self, event_id: int, table_id: Optional[int] = None, occupied: Optional[int] = None,
+                            arrived_guest_id: Optional[int] = None):
+        """
+        צבירת שינוי תפוסה לחלון הנוכחי של האירוע. בסוף החלון נשלחת הודעת occupancy_delta אחת
+        לכל חיבורי ה-delta, עם מספר התפוסים העדכני לכל שולחן שהשתנה ומזהי המוזמנים שהגיעו.
+        """
+        if self.pubsub.name == "memory" and not self._has_mode(event_id, MODE_DELTA):
+            return
+        pending = self._pending_deltas.get(event_id)
+        if pending is None:
+            pending = self._pending_deltas[event_id] = PendingDelta()
+            pending.task = asyncio.ensure_future(self._flush_delta(event_id))
+        if table_id is not None:
+            pending.tables[table_id] = occupied
+        if arrived_guest_id is not None:
+            pending.arrived.append(arrived_guest_id)
+
+    async def _flush_delta(self, event_id: int):
+        await asyncio.sleep(settings.WS_DELTA_WINDOW_MS / 1000)
+        pending = self._pending_deltas.pop(event_id, None)
+        if pending is None:
+            return
+        message = {
+            "type": "occupancy_delta",
+            "event_id": event_id,
+            "tables": [[table_id, occupied] for table_id, occupied in pending.tables.items()],
+            "arrived": pending.arrived,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+        await self._broadcast(event_id, json.dumps(message, separators=(",", ":")), MODE_DELTA)
+
+    def _has_mode(self, event_id: int, mode: str) -> bool:
+        return any(
+            self._writers[c].mode == mode
+            for c in self.active_connections.get(event_id, ())
+            if c in self._writers
+        )
+
+    async def _deliver_remote(self, event_id: int, payload: str, target: str):
+        self._counters["remote_messages"] += 1
+        if target == TARGET_CACHE:
+            from app.realtime.event_caches import apply_remote  # Local import to avoid circular dependency
+            apply_remote(event_id, payload)
+            return
+        self._deliver(event_id, payload, target)
+
+    def _deliver(self, event_id: int, payload: str, target: str = TARGET_ALL):
+        # כל הודעה לאירוע מקבלת מספר רצף ונשמרת בבאפר לשחזור, גם אם אין כרגע חיבורים
+        seq, payload = self.replay.append(event_id, payload, target)
         if event_id in self.active_connections:
-            dead_connections = set()
-            for connection in self.active_connections[event_id]:
-                try:
-                    await connection.send_text(json.dumps(message))
-                except:
-                    dead_connections.add(connection)
-            for dead_connection in dead_connections:
-                self.disconnect(dead_connection, event_id)
-
-websocket_manager = WebSocketManager() 
\ No newline at end of file
+            for connection in list(self.active_connections[event_id]):
+                writer = self._writers.get(connection)
+                if writer is None:
+                    continue
+                if target != TARGET_ALL and writer.mode != target:
+                    continue
+                if writer.enqueue(payload, seq):
+                    self._counters["enqueued"] += 1
+                else:
+                    # התור מלא - הקליינט רחוק מדי מאחור, מנתקים אותו במקום לצבור זיכרון
+                    self._drop(writer, "slow_consumer")
+
+    def _drop(self, writer: ConnectionWriter, reason: str):
+        if reason == "slow_consumer" or reason == "send_timeout":
+            self._counters["slow_disconnects"] += 1
+        else:
+            self._counters["send_errors"] += 1
+        print(f"WebSocket dropped for event {writer.event_id}: {reason}")
+        self.disconnect(writer.websocket, writer.event_id)
+        asyncio.ensure_future(writer.close(SLOW_CONSUMER_CLOSE_CODE))
+
+    def _record_latency(self, seconds: float):
+        self._latencies.append(seconds)
+
+    def metrics(self) -> dict:
+        latencies = sorted(self._latencies)
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 3)
+
+        events = {}
+        for event_id, connections in self.active_connections.items():
+            writers = [self._writers[c] for c in connections if c in self._writers]
+            depths = [w.queue.qsize() for w in writers]
+            events[event_id] = {
+                "connections": len(writers),
+                "delta_connections": sum(1 for w in writers if w.mode == MODE_DELTA),
+                "queue_depth_total": sum(depths),
+                "queue_depth_max": max(depths, default=0),
+                "queue_depth_peak": max((w.max_depth for w in writers), default=0),
+            }
+        return {
+            "pubsub_backend": self.pubsub.name,
+            "queue_size_limit": settings.WS_SEND_QUEUE_SIZE,
+            "connections": len(self._writers),
+            **self._counters,
+            "send_latency_ms": {
+                "samples": len(latencies),
+                "p50": percentile(0.5),
+                "p99": percentile(0.99),
+                "max": round(latencies[-1] * 1000, 3) if latencies else None,
+            },
+            "events": events,
+        }
+
+websocket_manager = WebSocketManager()
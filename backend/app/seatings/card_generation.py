@@ -0,0 +1,179 @@
+import base64
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from typing import Callable, Dict, List, Optional
+
+import qrcode
+from PIL import Image
+
+from app.core.config import settings
+from app.seatings.qr_cache import DATA_URI_PREFIX, QR_REFERENCE_PREFIX, qr_cache, qr_key
+
+# מתחת לכמות הזאת זול יותר לרנדר בתהליך הנוכחי מאשר לשלוח עבודה ל-pool
+INLINE_RENDER_LIMIT = 64
+RENDER_CHUNK_SIZE = 100
+
+ProgressCallback = Callable[[dict], None]
+
+# הגדרות תמונת ה-QR השמורה - נדרשות גם לקריאת המודולים חזרה מהתמונה
+QR_BOX_SIZE = 10
+QR_PNG_BORDER = 5
+
+
+def card_qr_payload(event_id: int, first_name: str, last_name: str, phone: Optional[str]) -> str:
+    """תוכן ה-QR של מוזמן - ללא פרטי מקום; רק זיהוי מוזמן + אירוע"""
+    return json.dumps({
+        "event_id": event_id,
+        "first_name": first_name,
+        "last_name": last_name,
+        "phone": phone or ""
+    })
+
+
+def _make_qr(data: str, border: int) -> qrcode.QRCode:
+    qr = qrcode.QRCode(version=1, box_size=QR_BOX_SIZE, border=border)
+    qr.add_data(data)
+    qr.make(fit=True)
+    return qr
+
+
+def render_qr_png_bytes(data: str) -> bytes:
+    qr = _make_qr(data, border=QR_PNG_BORDER)
+
+    img = qr.make_image(fill_color="black", back_color="white")
+    buffer = BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def render_qr_matrix(data: str) -> List[List[bool]]:
+    """מודולי ה-QR (בלי שוליים) לציור וקטורי - אותן הגדרות כמו ב-PNG, כך שהקוד זהה"""
+    return _make_qr(data, border=0).get_matrix()
+
+
+def qr_matrix_from_png(png: bytes) -> List[List[bool]]:
+    """מודולי ה-QR מתוך תמונה שנוצרה ב-render_qr_png_bytes (דגימה של מרכז כל מודול)"""
+    image = Image.open(BytesIO(png)).convert("L")
+    modules = image.width // QR_BOX_SIZE - 2 * QR_PNG_BORDER
+    offset = QR_PNG_BORDER * QR_BOX_SIZE + QR_BOX_SIZE // 2
+    return [
+        [image.getpixel((offset + col * QR_BOX_SIZE, offset + row * QR_BOX_SIZE)) < 128 for col in range(modules)]
+        for row in range(modules)
+    ]
+
+
+def render_qr_png(data: str) -> str:
+    """QR Code כ-data URI של PNG"""
+    return f"{DATA_URI_PREFIX}{base64.b64encode(render_qr_png_bytes(data)).decode()}"
+
+
+def _render_qr_batch(payloads: List[str]) -> List[bytes]:
+    # רץ בתהליך עובד - פונקציה ברמת המודול כדי שתעבור pickle
+    return [render_qr_png_bytes(data) for data in payloads]
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            workers = settings.CARD_RENDER_WORKERS or min(4, os.cpu_count() or 1)
+            # לא fork: השרת מריץ threads (event loop, משימות רקע, חיבורי מסד) ו-fork שלהם עלול לתקוע את התהליך הבן
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method))
+        return _executor
+
+
+def shutdown_render_pool():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def cache_qr_codes(payloads: List[str], on_rendered: Optional[Callable[[int], None]] = None) -> List[str]:
+    """
+    הפניות למטמון ה-QR לכל המטענים, בסדר המקורי. רק תמונות שעוד לא במטמון מרונדרות;
+    באירועים גדולים הרינדור מתחלק לחבילות בין תהליכי ה-pool, כך שהוא לא תופס את ה-GIL של השרת.
+    """
+    keys = [qr_key(data) for data in payloads]
+    missing = {}
+    for key, data in zip(keys, payloads):
+        if key not in missing and not qr_cache.contains(key):
+            missing[key] = data
+    done = len(payloads) - len(missing)
+    if on_rendered:
+        on_rendered(done)
+
+    items = list(missing.items())
+    if len(items) <= INLINE_RENDER_LIMIT or settings.CARD_RENDER_WORKERS < 0:
+        for i, (key, data) in enumerate(items, 1):
+            qr_cache.put(key, render_qr_png_bytes(data))
+            if on_rendered and (i % RENDER_CHUNK_SIZE == 0 or i == len(items)):
+                on_rendered(done + i)
+    else:
+        executor = _get_executor()
+        chunks = [items[i:i + RENDER_CHUNK_SIZE] for i in range(0, len(items), RENDER_CHUNK_SIZE)]
+        futures = [executor.submit(_render_qr_batch, [data for _, data in chunk]) for chunk in chunks]
+        for chunk, future in zip(chunks, futures):
+            for (key, _), png in zip(chunk, future.result()):
+                qr_cache.put(key, png)
+            done += len(chunk)
+            if on_rendered:
+                on_rendered(done)
+    return [f"{QR_REFERENCE_PREFIX}{key}" for key in keys]
+
+
+class CardGenerationProgress:
+    """מצב יצירת הכרטיסים לכל אירוע, לתצוגת אחוזים בממשק"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._events: Dict[int, dict] = {}
+
+    def start(self, event_id: int) -> dict:
+        state = {
+            "event_id": event_id,
+            "status": "loading",
+            "total": 0,
+            "rendered": 0,
+            "saved": 0,
+            "percent": 0,
+            "error": None,
+            "started_at": time.time(),
+            "finished_at": None,
+        }
+        with self._lock:
+            self._events[event_id] = state
+        return dict(state)
+
+    def update(self, event_id: int, **changes) -> dict:
+        with self._lock:
+            state = self._events.setdefault(event_id, {"event_id": event_id})
+            state.update(changes)
+            total = state.get("total") or 0
+            if state.get("status") == "done":
+                state["percent"] = 100
+            elif total:
+                # רינדור הוא רוב העבודה; השמירה במסד היא ה-10% האחרונים
+                state["percent"] = min(99, int(state.get("rendered", 0) * 90 / total))
+            if state.get("status") in ("done", "failed"):
+                state["finished_at"] = time.time()
+            return dict(state)
+
+    def get(self, event_id: int) -> Optional[dict]:
+        with self._lock:
+            state = self._events.get(event_id)
+            return dict(state) if state else None
+
+
+card_generation_progress = CardGenerationProgress()
@@ -0,0 +1,350 @@
+import io
+import json
+import os
+from typing import Optional
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import cm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from sqlalchemy.orm import Session
+
+from app.core.database import SessionLocal
+from app.seatings.models import SeatingCard
+from app.seatings.pdf_stream import StreamingPDF
+from app.seatings.projection import seating_projection_cache
+from app.seatings.qr_cache import qr_cache
+
+
+def _reverse_hebrew_text(text):
+    """הופך טקסט עברי לכתיבה נכונה"""
+    # הפיכת כל המשפט
+    return text[::-1]
+
+
+def _event_template_path(event_id: int):
+    # בדיקת תבנית רקע שהועלתה
+    template_path_hint = f"uploads/templates/template_{event_id}.path"
+    if os.path.exists(template_path_hint):
+        try:
+            with open(template_path_hint, 'r', encoding='utf-8') as f:
+                template_path = f.read().strip()
+            if template_path and os.path.exists(template_path):
+                return template_path
+        except Exception as e:
+            print(f"שגיאה בקריאת נתיב תבנית: {e}")
+    return None
+
+
+def _draw_seating_card(pdf: StreamingPDF, page, card_data: dict, qr_reference: Optional[str], template_name, logo_name):
+    # חישוב מיקום הכרטיס (שליש דף מרוכז)
+    card_width = A4[0] * 0.8  # 80% מרוחב הדף
+    card_height = A4[1] * 0.3  # 30% מגובה הדף
+    card_x = (A4[0] - card_width) / 2  # מרכוז אופקי
+    card_y = (A4[1] - card_height) / 2  # מרכוז אנכי
+
+    if template_name:
+        # הרקע מתוך התבנית - XObject משותף לכל העמודים
+        page.image(template_name, card_x, card_y, card_width, card_height)
+    else:
+        # רקע ברירת מחדל
+        page.rect(card_x, card_y, card_width, card_height, fill=colors.white.rgb(), stroke=colors.black.rgb(), line_width=2)
+
+    # לוגו (אם קיים) - בצד שמאל למעלה
+    if logo_name:
+        logo_width = 2*cm
+        logo_height = 2*cm
+        page.image(logo_name, card_x + 1*cm, card_y + card_height - logo_height - 1*cm, logo_width, logo_height)
+
+    # כותרת - במרכז העליון
+    page.text(card_x + card_width / 2, card_y + card_height - 2*cm, _reverse_hebrew_text("כרטיס ישיבה"), 18, colors.darkblue.rgb(), align="center")
+
+    # פרטי המוזמן - יישור לימין
+    text_start_x = card_x + card_width - 2*cm
+    text_y = card_y + card_height - 4*cm
+
+    lines = [
+        f"שלום {card_data['guest_name']}",
+        f"הנך מוזמן לאירוע: {card_data['event_name']}",
+        # מספר שולחן - תיקון המספרים
+        f"מספר שולחן: {str(card_data['table_number'])[::-1]}",
+    ]
+    # מספר כסא - תיקון המספרים
+    if card_data.get('seat_number'):
+        lines.append(f"מספר כסא: {str(card_data['seat_number'])[::-1]}")
+    for line in lines:
+        page.text(text_start_x, text_y, _reverse_hebrew_text(line), 14, colors.black.rgb(), align="right")
+        text_y -= 1*cm
+
+    # QR Code - בצד שמאל למטה, מצויר וקטורית מהתוכן שנשמר בכרטיס (כרטיסים ישנים - מהתמונה השמורה)
+    try:
+        qr_payload = card_data.get("qr_payload")
+        if qr_payload:
+            matrix = qr_cache.matrix_for(qr_payload)
+        else:
+            matrix = qr_cache.matrix_for_stored(card_data.get("qr_code") or qr_reference)
+        if matrix:
+            page.qr(matrix, card_x + 2*cm, card_y + 2*cm, 4*cm, quiet_zone=5)  # שוליים כמו ב-generate_qr_code
+    except Exception as e:
+        print(f"שגיאה בהוספת QR Code: {e}")
+        # נמשיך בלי QR Code אם יש בעיה
+
+
+def iter_cards_pdf(event_id: int, on_page=None):
+    """מחולל PDF: הכותרת והתמונות המשותפות, אחר כך עמוד לכל כרטיס, ובסוף הפונטים וה-xref"""
+    db = SessionLocal()
+    try:
+        pdf = StreamingPDF(A4)
+        yield pdf.header()
+
+        template_name = None
+        template_path = _event_template_path(event_id)
+        if template_path:
+            template_name, chunk = pdf.add_image(template_path)
+            yield chunk
+
+        cards = db.query(
+            SeatingCard.id, SeatingCard.card_data, SeatingCard.qr_code, SeatingCard.logo_path
+        ).filter(
+            SeatingCard.event_id == event_id
+        ).order_by(SeatingCard.id).yield_per(200)
+
+        count = 0
+        for card in cards:
+            logo_name = None
+            if card.logo_path and os.path.exists(card.logo_path):
+                logo_name, chunk = pdf.add_image(card.logo_path)
+                if chunk:
+                    yield chunk
+            page = pdf.new_page()
+            _draw_seating_card(pdf, page, json.loads(card.card_data), card.qr_code, template_name, logo_name)
+            yield page.finish()
+            count += 1
+            if on_page:
+                on_page(count)
+
+        yield pdf.finish()
+        print(f"PDF כרטיסי ישיבה לאירוע {event_id}: {count} עמודים")
+    except Exception as e:
+        # התגובה כבר התחילה - אי אפשר להחזיר שגיאת HTTP, הקובץ יגיע קטוע
+        print(f"שגיאה ביצירת PDF: {e}")
+        raise
+    finally:
+        db.close()
+
+
+def build_seating_map_filtered_pdf(db: Session, event_id: int, include_empty_seats: bool = False,
+                                   gender_filter: Optional[str] = None, guest_type_filter: Optional[str] = None,
+                                   category_filter: Optional[str] = None):
+    """בניית PDF מפת ישיבה עם פילטרים - מחזיר את תוכן הקובץ ושמו (משמש את ה-route ואת הג'ובים ברקע)"""
+    # אותם נתונים כמו בנתיב ה-JSON של המפה המסוננת
+    data = seating_projection_cache.get(db, event_id).filtered_map(
+        include_empty_seats, gender_filter, guest_type_filter, category_filter
+    )
+    seating_map = data["seating_map"]
+    filters = data["filters"]
+    statistics = data["statistics"]
+
+    # יצירת PDF
+    pdf_buffer = io.BytesIO()
+    pdf = canvas.Canvas(pdf_buffer, pagesize=A4)
+
+    # הגדרת פונט עברי
+    try:
+        hebrew_fonts = ['Arial', 'David', 'Times New Roman', 'Helvetica']
+        font_name = 'Helvetica'
+
+        for font in hebrew_fonts:
+            try:
+                pdfmetrics.registerFont(TTFont('Hebrew', f'{font}.ttf'))
+                font_name = 'Hebrew'
+                break
+            except:
+                continue
+    except:
+        font_name = 'Helvetica'
+
+    # פונקציה להפיכת טקסט עברי
+    def reverse_hebrew_text(text):
+        return text[::-1]
+
+    # כותרת ראשית
+    pdf.setFont(font_name, 20)
+    pdf.setFillColor(colors.darkblue)
+    title_text = "מפת ישיבה - דוח מסונן"
+    title_text_fixed = reverse_hebrew_text(title_text)
+    pdf.drawCentredString(A4[0]/2, A4[1]-2*cm, title_text_fixed)
+
+    # פרטי הפילטרים
+    pdf.setFont(font_name, 12)
+    pdf.setFillColor(colors.black)
+    filter_text = "פילטרים: "
+    if filters["include_empty_seats"]:
+        filter_text += "כולל מקומות ריקים, "
+    if filters["gender_filter"]:
+        filter_text += f"מגדר: {filters['gender_filter']}, "
+    if filters["guest_type_filter"]:
+        filter_text += f"סוג מוזמן: {filters['guest_type_filter']}, "
+    if filters["category_filter"]:
+        filter_text += f"קטגוריה: {filters['category_filter']}, "
+
+    if filter_text == "פילטרים: ":
+        filter_text += "כל המוזמנים"
+
+    filter_text_fixed = reverse_hebrew_text(filter_text)
+    pdf.drawString(2*cm, A4[1]-3*cm, filter_text_fixed)
+
+    # סטטיסטיקות
+    stats_text = f"סטטיסטיקות: {statistics['total_tables']} שולחנות, {statistics['total_seats']} מקומות, {statistics['occupied_seats']} תפוסים, {statistics['empty_seats']} ריקים"
+    stats_text_fixed = reverse_hebrew_text(stats_text)
+    pdf.drawString(2*cm, A4[1]-4*cm, stats_text_fixed)
+
+    # מיקום התחלתי לטבלאות
+    current_y = A4[1] - 5*cm
+    tables_per_page = 3
+    current_table_count = 0
+
+    for table_number, table_data in sorted(seating_map.items()):
+        # בדיקה אם צריך דף חדש
+        if current_table_count % tables_per_page == 0 and current_table_count > 0:
+            pdf.showPage()
+            current_y = A4[1] - 2*cm
+            current_table_count = 0
+
+        # כותרת שולחן
+        pdf.setFont(font_name, 16)
+        pdf.setFillColor(colors.darkblue)
+        table_title = f"שולחן {table_number}"
+        table_title_fixed = reverse_hebrew_text(table_title)
+        pdf.drawString(2*cm, current_y, table_title_fixed)
+        current_y -= 1*cm
+
+        # פרטי שולחן
+        pdf.setFont(font_name, 10)
+        pdf.setFillColor(colors.black)
+        capacity_text = f"קיבולת: {table_data['capacity']} מקומות"
+        capacity_text_fixed = reverse_hebrew_text(capacity_text)
+        pdf.drawString(2*cm, current_y, capacity_text_fixed)
+        current_y -= 0.5*cm
+
+        # כותרות עמודות
+        pdf.setFont(font_name, 9)
+        pdf.setFillColor(colors.darkgrey)
+        col_width = (A4[0] - 4*cm) / 5  # 5 עמודות
+
+        headers = ["מקום", "שם", "קטגוריה", "מגדר", "סוג"]
+        headers_fixed = [reverse_hebrew_text(h) for h in headers]
+
+        for i, header in enumerate(headers_fixed):
+            x_pos = 2*cm + i * col_width
+            pdf.drawString(x_pos, current_y, header)
+
+        current_y -= 0.5*cm
+
+        # נתוני מקומות ישיבה
+        pdf.setFont(font_name, 8)
+        pdf.setFillColor(colors.black)
+
+        for seat in table_data["seats"]:
+            # בדיקה אם יש מקום בדף
+            if current_y < 2*cm:
+                pdf.showPage()
+                current_y = A4[1] - 2*cm
+
+            # צבע רקע למקומות ריקים
+            if not seat["is_occupied"]:
+                pdf.setFillColor(colors.lightgrey)
+                pdf.rect(1.5*cm, current_y-0.2*cm, A4[0]-3*cm, 0.4*cm, fill=True)
+                pdf.setFillColor(colors.black)
+
+            # נתוני המקום
+            seat_num = str(seat["seat_number"])
+            guest_name = seat["guest_name"] if seat["guest_name"] else "ריק"
+            category = seat["category"] if seat["category"] else ""
+            gender = seat["gender"] if seat["gender"] else ""
+            guest_type = seat["guest_type"] if seat["guest_type"] else ""
+
+            # הפיכת טקסט עברי
+            seat_num_fixed = seat_num[::-1]
+            guest_name_fixed = reverse_hebrew_text(guest_name)
+            category_fixed = reverse_hebrew_text(category)
+            gender_fixed = reverse_hebrew_text(gender)
+            guest_type_fixed = reverse_hebrew_text(guest_type)
+
+            # הדפסת הנתונים
+            pdf.drawString(2*cm, current_y, seat_num_fixed)
+            pdf.drawString(2*cm + col_width, current_y, guest_name_fixed)
+            pdf.drawString(2*cm + 2*col_width, current_y, category_fixed)
+            pdf.drawString(2*cm + 3*col_width, current_y, gender_fixed)
+            pdf.drawString(2*cm + 4*col_width, current_y, guest_type_fixed)
+
+            current_y -= 0.4*cm
+
+        current_y -= 1*cm  # רווח בין שולחנות
+        current_table_count += 1
+
+    # הוספת פירוט סטטיסטיקות בסוף
+    if statistics["gender_distribution"] or statistics["category_distribution"]:
+        pdf.showPage()
+        current_y = A4[1] - 2*cm
+
+        pdf.setFont(font_name, 16)
+        pdf.setFillColor(colors.darkblue)
+        stats_title = "פירוט סטטיסטיקות"
+        stats_title_fixed = reverse_hebrew_text(stats_title)
+        pdf.drawCentredString(A4[0]/2, current_y, stats_title_fixed)
+        current_y -= 1.5*cm
+
+        # פירוט לפי מגדר
+        if statistics["gender_distribution"]:
+            pdf.setFont(font_name, 12)
+            pdf.setFillColor(colors.darkblue)
+            gender_title = "פירוט לפי מגדר:"
+            gender_title_fixed = reverse_hebrew_text(gender_title)
+            pdf.drawString(2*cm, current_y, gender_title_fixed)
+            current_y -= 0.8*cm
+
+            pdf.setFont(font_name, 10)
+            pdf.setFillColor(colors.black)
+            for gender, count in statistics["gender_distribution"].items():
+                gender_text = f"{gender}: {count} מוזמנים"
+                gender_text_fixed = reverse_hebrew_text(gender_text)
+                pdf.drawString(3*cm, current_y, gender_text_fixed)
+                current_y -= 0.5*cm
+
+            current_y -= 0.5*cm
+
+        # פירוט לפי קטגוריה
+        if statistics["category_distribution"]:
+            pdf.setFont(font_name, 12)
+            pdf.setFillColor(colors.darkblue)
+            category_title = "פירוט לפי קטגוריה:"
+            category_title_fixed = reverse_hebrew_text(category_title)
+            pdf.drawString(2*cm, current_y, category_title_fixed)
+            current_y -= 0.8*cm
+
+            pdf.setFont(font_name, 10)
+            pdf.setFillColor(colors.black)
+            for category, count in statistics["category_distribution"].items():
+                category_text = f"{category}: {count} מוזמנים"
+                category_text_fixed = reverse_hebrew_text(category_text)
+                pdf.drawString(3*cm, current_y, category_text_fixed)
+                current_y -= 0.5*cm
+
+    pdf.save()
+
+    # יצירת שם קובץ עם הפילטרים
+    filename_parts = [f"seating_map_filtered_{event_id}"]
+    if include_empty_seats:
+        filename_parts.append("with_empty")
+    if gender_filter:
+        filename_parts.append(f"gender_{gender_filter}")
+    if guest_type_filter:
+        filename_parts.append(f"type_{guest_type_filter}")
+    if category_filter:
+        filename_parts.append(f"category_{category_filter}")
+
+    filename = "_".join(filename_parts) + ".pdf"
+    return pdf_buffer.getvalue(), filename
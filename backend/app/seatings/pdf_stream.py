@@ -0,0 +1,308 @@
+"""
+כתיבת PDF בזרימה - עמוד אחרי עמוד.
+
+בניגוד ל-reportlab.Canvas שבונה את כל המסמך בזיכרון, כאן כל עמוד נכתב ומוחזר כבתים
+ברגע שהוא מוכן, כך שההורדה מתחילה מיד והזיכרון לא גדל עם מספר הכרטיסים.
+תמונות (תבנית, לוגו) נכתבות פעם אחת כ-XObject משותף, קודי QR מצוירים כמלבנים וקטוריים,
+והפונטים (TrueType מוטמע, עם תתי-קבוצות של התווים שבשימוש) נכתבים בסוף, יחד עם עץ העמודים וה-xref.
+"""
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont, SUBSETN, makeToUnicodeCMap, FF_NONSYMBOLIC, FF_SYMBOLIC
+
+from app.core.config import settings
+
+# פונטים עבריים לנסות לפי הסדר (בנוסף ל-CARD_FONT_PATH מההגדרות)
+HEBREW_FONT_CANDIDATES = [
+    "Arial.ttf", "David.ttf", "Times New Roman.ttf",
+    "C:/Windows/Fonts/arial.ttf", "C:/Windows/Fonts/david.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/truetype/freefont/FreeSans.ttf",
+    "/usr/share/fonts/truetype/culmus/DavidCLM-Medium.ttf",
+]
+
+_ttf_cache: Dict[str, TTFont] = {}
+_ttf_missing = set()
+
+
+def load_ttf(candidates: List[str]) -> Optional[TTFont]:
+    """הפונט הראשון שנמצא - נטען פעם אחת לתהליך"""
+    for path in candidates:
+        if not path or path in _ttf_missing:
+            continue
+        if path in _ttf_cache:
+            return _ttf_cache[path]
+        try:
+            font = TTFont(f"CardFont{len(_ttf_cache)}", path)
+        except Exception:
+            _ttf_missing.add(path)
+            continue
+        _ttf_cache[path] = font
+        return font
+    return None
+
+
+def _escape(data: bytes) -> bytes:
+    return data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)").replace(b"\r", b"\\r")
+
+
+def _fmt(value: float) -> str:
+    return ("%.3f" % value).rstrip("0").rstrip(".") or "0"
+
+
+class StreamingPDF:
+    """מסמך PDF שנכתב בזרימה. כל מתודה שכותבת מחזירה את הבתים שיש לשלוח ללקוח."""
+
+    def __init__(self, page_size: Tuple[float, float] = A4, font_candidates: Optional[List[str]] = None, compress: bool = True):
+        self.page_size = page_size
+        self.compress = compress
+        self._offset = 0
+        self._xref: Dict[int, int] = {}
+        self._next_id = 1
+        self._catalog_id = self._reserve()
+        self._pages_id = self._reserve()
+        self._page_ids: List[int] = []
+        self._images: Dict[str, Tuple[str, int]] = {}
+
+        candidates = [settings.CARD_FONT_PATH] + (font_candidates or HEBREW_FONT_CANDIDATES)
+        self.ttf = load_ttf(candidates)
+        # מספרי האובייקטים של תתי-הקבוצות; ההקצאה עצמה נשמרת ב-TTFont לפי המסמך (כמו ב-reportlab) ונמחקת בסוף
+        self._font_ids: Dict[int, int] = {}
+
+    # ---------- אובייקטים ----------
+
+    def _reserve(self) -> int:
+        obj_id = self._next_id
+        self._next_id += 1
+        return obj_id
+
+    def _object(self, obj_id: int, body: bytes) -> bytes:
+        self._xref[obj_id] = self._offset
+        data = b"%d 0 obj\n" % obj_id + body + b"\nendobj\n"
+        self._offset += len(data)
+        return data
+
+    def _stream(self, obj_id: int, dictionary: str, content: bytes, compress: Optional[bool] = None) -> bytes:
+        if self.compress if compress is None else compress:
+            content = zlib.compress(content, 6)
+            dictionary += " /Filter /FlateDecode"
+        body = b"<< " + dictionary.encode("latin-1") + b" /Length %d >>\nstream\n" % len(content) + content + b"\nendstream"
+        return self._object(obj_id, body)
+
+    def header(self) -> bytes:
+        data = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+        self._offset += len(data)
+        return data
+
+    # ---------- תמונות משותפות ----------
+
+    def add_image(self, path: str) -> Tuple[Optional[str], bytes]:
+        """רישום תמונה כ-XObject פעם אחת למסמך. מחזיר (שם המשאב, בתים לשליחה)"""
+        if path in self._images:
+            return self._images[path][0], b""
+        try:
+            image = Image.open(path)
+            image.load()
+        except Exception as e:
+            print(f"שגיאה בטעינת תמונה {path}: {e}")
+            return None, b""
+
+        chunks = []
+        smask_id = None
+        if image.format == "JPEG" and image.mode in ("RGB", "L"):
+            with open(path, "rb") as f:
+                raw = f.read()
+            color_space = "/DeviceRGB" if image.mode == "RGB" else "/DeviceGray"
+            image_id = self._reserve()
+            chunks.append(self._stream(
+                image_id,
+                f"/Type /XObject /Subtype /Image /Width {image.width} /Height {image.height} "
+                f"/ColorSpace {color_space} /BitsPerComponent 8 /Filter /DCTDecode",
+                raw, compress=False
+            ))
+        else:
+            if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+                image = image.convert("RGBA")
+                smask_id = self._reserve()
+                chunks.append(self._stream(
+                    smask_id,
+                    f"/Type /XObject /Subtype /Image /Width {image.width} /Height {image.height} "
+                    f"/ColorSpace /DeviceGray /BitsPerComponent 8",
+                    image.getchannel("A").tobytes(), compress=True
+                ))
+            image = image.convert("RGB")
+            image_id = self._reserve()
+            smask = f" /SMask {smask_id} 0 R" if smask_id else ""
+            chunks.append(self._stream(
+                image_id,
+                f"/Type /XObject /Subtype /Image /Width {image.width} /Height {image.height} "
+                f"/ColorSpace /DeviceRGB /BitsPerComponent 8{smask}",
+                image.tobytes(), compress=True
+            ))
+        name = f"Im{len(self._images) + 1}"
+        self._images[path] = (name, image_id)
+        return name, b"".join(chunks)
+
+    # ---------- טקסט ----------
+
+    def string_width(self, text: str, size: float) -> float:
+        if self.ttf is not None:
+            return self.ttf.stringWidth(text, size)
+        return pdfmetrics.stringWidth(text, "Helvetica", size)
+
+    def _text_ops(self, text: str, size: float, used_fonts: set) -> bytes:
+        if self.ttf is None:
+            used_fonts.add(0)
+            encoded = text.encode("latin-1", "replace")
+            return b"/F0 %s Tf (%s) Tj " % (_fmt(size).encode(), _escape(encoded))
+        ops = []
+        for subset, chunk in self.ttf.splitString(text, self):
+            if subset not in self._font_ids:
+                self._font_ids[subset] = self._reserve()
+            used_fonts.add(subset)
+            ops.append(b"/F%d %s Tf (%s) Tj " % (subset, _fmt(size).encode(), _escape(chunk)))
+        return b"".join(ops)
+
+    # ---------- עמודים ----------
+
+    def new_page(self) -> "PageCanvas":
+        return PageCanvas(self)
+
+    def _write_page(self, page: "PageCanvas") -> bytes:
+        content_id = self._reserve()
+        page_id = self._reserve()
+        self._page_ids.append(page_id)
+        chunks = [self._stream(content_id, "", b"".join(page.ops))]
+
+        fonts = " ".join(f"/F{n} {self._font_id(n)} 0 R" for n in sorted(page.fonts))
+        images = " ".join(f"/{name} {image_id} 0 R" for name, image_id in self._images.values() if name in page.images)
+        resources = f"/ProcSet [/PDF /Text /ImageB /ImageC] /Font << {fonts} >> /XObject << {images} >>"
+        width, height = self.page_size
+        chunks.append(self._object(page_id, (
+            f"<< /Type /Page /Parent {self._pages_id} 0 R /MediaBox [0 0 {_fmt(width)} {_fmt(height)}] "
+            f"/Resources << {resources} >> /Contents {content_id} 0 R >>"
+        ).encode("latin-1")))
+        return b"".join(chunks)
+
+    def _font_id(self, subset: int) -> int:
+        if subset not in self._font_ids:
+            self._font_ids[subset] = self._reserve()
+        return self._font_ids[subset]
+
+    # ---------- סיום ----------
+
+    def _write_fonts(self) -> bytes:
+        chunks = []
+        if self.ttf is None:
+            if 0 in self._font_ids:
+                chunks.append(self._object(
+                    self._font_ids[0],
+                    b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"
+                ))
+            return b"".join(chunks)
+
+        face = self.ttf.face
+        state = self.ttf.state.pop(self, None)
+        subsets = state.subsets if state is not None else []
+        for n, font_id in sorted(self._font_ids.items()):
+            subset = subsets[n]
+            base_font = (b"".join((SUBSETN(n), b"+", face.name, face.subfontNameX))).decode("latin-1")
+            font_file = face.makeSubset(subset)
+            font_file_id, descriptor_id, cmap_id = self._reserve(), self._reserve(), self._reserve()
+            chunks.append(self._stream(font_file_id, f"/Length1 {len(font_file)}", font_file))
+            flags = (face.flags & ~FF_NONSYMBOLIC) | FF_SYMBOLIC
+            chunks.append(self._object(descriptor_id, (
+                f"<< /Type /FontDescriptor /FontName /{base_font} /Flags {flags} "
+                f"/FontBBox [{' '.join(str(v) for v in face.bbox)}] /ItalicAngle {face.italicAngle} "
+                f"/Ascent {face.ascent} /Descent {face.descent} /CapHeight {face.capHeight} "
+                f"/StemV {face.stemV} /MissingWidth {face.defaultWidth} /FontFile2 {font_file_id} 0 R >>"
+            ).encode("latin-1")))
+            chunks.append(self._stream(cmap_id, "", makeToUnicodeCMap(base_font, subset).encode("latin-1")))
+            widths = " ".join(_fmt(face.getCharWidth(code)) for code in subset)
+            chunks.append(self._object(font_id, (
+                f"<< /Type /Font /Subtype /TrueType /BaseFont /{base_font} /FirstChar 0 /LastChar {len(subset) - 1} "
+                f"/Widths [{widths}] /FontDescriptor {descriptor_id} 0 R /ToUnicode {cmap_id} 0 R >>"
+            ).encode("latin-1")))
+        return b"".join(chunks)
+
+    def finish(self) -> bytes:
+        chunks = [self._write_fonts()]
+        kids = " ".join(f"{page_id} 0 R" for page_id in self._page_ids)
+        chunks.append(self._object(self._pages_id, f"<< /Type /Pages /Kids [{kids}] /Count {len(self._page_ids)} >>".encode("latin-1")))
+        chunks.append(self._object(self._catalog_id, f"<< /Type /Catalog /Pages {self._pages_id} 0 R >>".encode("latin-1")))
+
+        xref_offset = self._offset
+        size = self._next_id
+        lines = [b"xref\n0 %d\n" % size, b"0000000000 65535 f \n"]
+        for obj_id in range(1, size):
+            offset = self._xref.get(obj_id)
+            # מספר שהוזמן ולא נכתב (למשל פונט שלא היה בשימוש) מסומן כפנוי
+            lines.append(b"%010d 00000 n \n" % offset if offset is not None else b"0000000000 65535 f \n")
+        lines.append(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (size, self._catalog_id, xref_offset))
+        chunks.append(b"".join(lines))
+        return b"".join(chunks)
+
+
+class PageCanvas:
+    """פקודות ציור לעמוד אחד - נכתב למסמך עם finish()"""
+
+    def __init__(self, pdf: StreamingPDF):
+        self.pdf = pdf
+        self.ops: List[bytes] = []
+        self.fonts = set()
+        self.images = set()
+
+    def rect(self, x: float, y: float, width: float, height: float,
+             fill: Optional[Tuple[float, float, float]] = None,
+             stroke: Optional[Tuple[float, float, float]] = None, line_width: float = 1):
+        ops = ["q"]
+        if fill is not None:
+            ops.append("%s %s %s rg" % tuple(_fmt(c) for c in fill))
+        if stroke is not None:
+            ops.append("%s %s %s RG %s w" % (*(_fmt(c) for c in stroke), _fmt(line_width)))
+        ops.append("%s %s %s %s re" % (_fmt(x), _fmt(y), _fmt(width), _fmt(height)))
+        ops.append("B" if fill is not None and stroke is not None else ("f" if fill is not None else "S"))
+        ops.append("Q\n")
+        self.ops.append(" ".join(ops).encode("latin-1"))
+
+    def image(self, name: str, x: float, y: float, width: float, height: float):
+        self.images.add(name)
+        self.ops.append(b"q %s 0 0 %s %s %s cm /%s Do Q\n" % (
+            _fmt(width).encode(), _fmt(height).encode(), _fmt(x).encode(), _fmt(y).encode(), name.encode()
+        ))
+
+    def text(self, x: float, y: float, text: str, size: float, color: Tuple[float, float, float] = (0, 0, 0), align: str = "left"):
+        if align != "left":
+            width = self.pdf.string_width(text, size)
+            x -= width / 2 if align == "center" else width
+        self.ops.append(b"q %s %s %s rg BT %s %s Td " % (
+            *(_fmt(c).encode() for c in color), _fmt(x).encode(), _fmt(y).encode()
+        ) + self.pdf._text_ops(text, size, self.fonts) + b"ET Q\n")
+
+    def qr(self, matrix: List[List[bool]], x: float, y: float, size: float, quiet_zone: int = 4):
+        """קוד QR וקטורי: מלבן לבן ורצפים אופקיים של מודולים שחורים כמלבן אחד"""
+        count = len(matrix) + 2 * quiet_zone
+        module = size / count
+        ops = ["q 1 1 1 rg %s %s %s %s re f 0 0 0 rg" % (_fmt(x), _fmt(y), _fmt(size), _fmt(size))]
+        for row_index, row in enumerate(matrix):
+            row_y = y + size - (row_index + quiet_zone + 1) * module
+            col = 0
+            while col < len(row):
+                if not row[col]:
+                    col += 1
+                    continue
+                start = col
+                while col < len(row) and row[col]:
+                    col += 1
+                ops.append("%s %s %s %s re" % (
+                    _fmt(x + (start + quiet_zone) * module), _fmt(row_y), _fmt((col - start) * module), _fmt(module)
+                ))
+        ops.append("f Q\n")
+        self.ops.append(" ".join(ops).encode("latin-1"))
+
+    def finish(self) -> bytes:
+        return self.pdf._write_page(self)
@@ -0,0 +1,275 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.guests.models import Guest
+from app.seatings.models import Seating
+from app.tableHead.models import TableHead
+from app.tables.models import Table
+
+NO_CATEGORY = "ללא קטגוריה"
+# לטבלת השולחנות אין עמודת capacity - זו ברירת המחדל שהדוחות השתמשו בה תמיד
+DEFAULT_TABLE_CAPACITY = 8
+MAX_FILTERED_VIEWS = 32
+
+
+class SeatingProjection:
+    """
+    תמונת הישיבה של אירוע, נטענת פעם אחת: seatings עם המוזמן, השולחן והקטגוריה (ראש השולחן),
+    השולחנות וקטגוריות ראשי השולחן. הדוחות נבנים ממנה ונשמרים, כך שקריאה חוזרת היא שליפה ממילון.
+    המבנים המוחזרים משותפים בין בקשות - אסור לשנות אותם.
+    """
+
+    def __init__(self, event_id: int, seats: list, tables: list, categories: list):
+        self.event_id = event_id
+        self.seats = seats
+        self.tables = tables
+        self.categories = categories
+        self._lock = threading.Lock()
+        self._filtered: "OrderedDict[tuple, dict]" = OrderedDict()
+        self.seating_map = self._build_seating_map()
+        self.guest_list = self._build_guest_list()
+        self.statistics = self._build_statistics()
+        self.filter_options = self._build_filter_options()
+
+    @classmethod
+    def load(cls, db: Session, event_id: int) -> "SeatingProjection":
+        rows = db.query(
+            Seating.id, Seating.table_id, Seating.seat_number,
+            Guest.id.label("guest_id"), Guest.first_name, Guest.last_name, Guest.gender, Guest.phone, Guest.email,
+            Guest.table_head_id, TableHead.category, Table.table_number
+        ).outerjoin(
+            Guest, Guest.id == Seating.guest_id
+        ).outerjoin(
+            TableHead, TableHead.id == Guest.table_head_id
+        ).outerjoin(
+            Table, Table.id == Seating.table_id
+        ).filter(Seating.event_id == event_id).order_by(Seating.id).all()
+
+        seats = [
+            {
+                "seating_id": row.id,
+                "table_id": row.table_id,
+                "table_number": row.table_number,
+                "seat_number": row.seat_number,
+                "guest_id": row.guest_id,
+                "guest_name": f"{row.first_name} {row.last_name}".strip() if row.guest_id is not None else "",
+                "gender": row.gender or "",
+                "phone": row.phone,
+                "email": row.email,
+                "category": row.category or NO_CATEGORY,
+                "table_head_id": row.table_head_id,
+            }
+            for row in rows
+        ]
+        tables = [
+            {"id": t.id, "table_number": t.table_number}
+            for t in db.query(Table.id, Table.table_number).filter(Table.event_id == event_id).order_by(Table.id)
+        ]
+        categories = [
+            category for (category,) in db.query(TableHead.category).filter(TableHead.event_id == event_id)
+            if category
+        ]
+        return cls(event_id, seats, tables, categories)
+
+    def _build_seating_map(self) -> dict:
+        seating_map = {}
+        for seat in self.seats:
+            if seat["guest_id"] is None or seat["table_number"] is None:
+                continue
+            seating_map.setdefault(seat["table_number"], []).append({
+                "guest_name": seat["guest_name"],
+                "seat_number": seat["seat_number"],
+                "category": seat["category"]
+            })
+        return seating_map
+
+    def _build_guest_list(self) -> dict:
+        by_category = {}
+        for seat in self.seats:
+            if seat["guest_id"] is None:
+                continue
+            by_category.setdefault(seat["category"], []).append({
+                "name": seat["guest_name"],
+                "table": seat["table_number"] if seat["table_number"] is not None else seat["table_id"],
+                "seat": seat["seat_number"],
+                "phone": seat["phone"],
+                "email": seat["email"]
+            })
+        return by_category
+
+    def _build_statistics(self) -> dict:
+        total_guests = len(self.seats)
+        tables_used = len({seat["table_id"] for seat in self.seats})
+        return {
+            "total_guests": total_guests,
+            "tables_used": tables_used,
+            # למוזמנים אין שדה קטגוריה משלהם - כולם נספרים ככלליים
+            "categories_distribution": {"כללי": total_guests} if total_guests else {},
+            "average_guests_per_table": total_guests / tables_used if tables_used > 0 else 0
+        }
+
+    def _build_filter_options(self) -> dict:
+        genders = {seat["gender"].lower() for seat in self.seats if seat["gender"]}
+        total_capacity = DEFAULT_TABLE_CAPACITY * len(self.tables)
+        return {
+            "available_filters": {
+                "categories": list(set(self.categories)),
+                "genders": list(genders),
+                "guest_types": []
+            },
+            "seating_statistics": {
+                "total_capacity": total_capacity,
+                "occupied_seats": len(self.seats),
+                "empty_seats": total_capacity - len(self.seats),
+                "total_tables": len(self.tables)
+            }
+        }
+
+    def filtered_map(self, include_empty_seats: bool = False, gender_filter: Optional[str] = None,
+                     guest_type_filter: Optional[str] = None, category_filter: Optional[str] = None) -> dict:
+        """מפת הישיבה לפי פילטרים - כל צירוף פילטרים מחושב פעם אחת"""
+        key = (bool(include_empty_seats), gender_filter, guest_type_filter, category_filter)
+        with self._lock:
+            cached = self._filtered.get(key)
+            if cached is not None:
+                self._filtered.move_to_end(key)
+                return cached
+        result = self._build_filtered_map(*key)
+        with self._lock:
+            self._filtered[key] = result
+            while len(self._filtered) > MAX_FILTERED_VIEWS:
+                self._filtered.popitem(last=False)
+        return result
+
+    def _build_filtered_map(self, include_empty_seats, gender_filter, guest_type_filter, category_filter) -> dict:
+        seating_map = {}
+        for table in self.tables:
+            seating_map[table["table_number"]] = {
+                "table_id": table["id"],
+                "table_number": table["table_number"],
+                "capacity": DEFAULT_TABLE_CAPACITY,
+                "seats": []
+            }
+
+        for seat in self.seats:
+            table_data = seating_map.get(seat["table_number"])
+            if table_data is None:
+                continue
+            has_guest = seat["guest_id"] is not None
+            if has_guest:
+                should_include = True
+                if gender_filter and gender_filter.lower() != seat["gender"].lower():
+                    should_include = False
+                # למוזמנים אין סוג מוזמן, כך ש-guest_type_filter לא מסנן
+                if category_filter and seat["table_head_id"]:
+                    category = seat["category"] if seat["category"] != NO_CATEGORY else ""
+                    if category_filter.lower() != category.lower():
+                        should_include = False
+            else:
+                should_include = include_empty_seats
+            if not should_include:
+                continue
+            table_data["seats"].append({
+                "seat_number": seat["seat_number"],
+                "guest_name": seat["guest_name"],
+                "category": seat["category"],
+                "gender": seat["gender"],
+                "guest_type": "",
+                "is_occupied": has_guest
+            })
+
+        if include_empty_seats:
+            for table_data in seating_map.values():
+                taken = {seat["seat_number"] for seat in table_data["seats"]}
+                for seat_num in range(1, table_data["capacity"] + 1):
+                    if seat_num not in taken:
+                        table_data["seats"].append({
+                            "seat_number": seat_num,
+                            "guest_name": "",
+                            "category": "",
+                            "gender": "",
+                            "guest_type": "",
+                            "is_occupied": False
+                        })
+                table_data["seats"].sort(key=lambda x: (x["seat_number"] is None, x["seat_number"] or 0))
+
+        total_seats = sum(len(table_data["seats"]) for table_data in seating_map.values())
+        occupied_seats = 0
+        gender_stats = {}
+        category_stats = {}
+        for table_data in seating_map.values():
+            for seat in table_data["seats"]:
+                if not seat["is_occupied"]:
+                    continue
+                occupied_seats += 1
+                if seat["gender"]:
+                    gender = seat["gender"].lower()
+                    gender_stats[gender] = gender_stats.get(gender, 0) + 1
+                if seat["category"]:
+                    category_stats[seat["category"]] = category_stats.get(seat["category"], 0) + 1
+
+        return {
+            "event_id": self.event_id,
+            "filters": {
+                "include_empty_seats": include_empty_seats,
+                "gender_filter": gender_filter,
+                "guest_type_filter": guest_type_filter,
+                "category_filter": category_filter
+            },
+            "seating_map": seating_map,
+            "statistics": {
+                "total_tables": len(seating_map),
+                "total_seats": total_seats,
+                "occupied_seats": occupied_seats,
+                "empty_seats": total_seats - occupied_seats,
+                "gender_distribution": gender_stats,
+                "category_distribution": category_stats
+            }
+        }
+
+
+class SeatingProjectionCache:
+    """
+    LRU של תמונות ישיבה לפי אירוע. כתיבות של seatings / מוזמנים / שולחנות / ראשי שולחן
+    דרך ה-repositories קוראות ל-invalidate, והבקשה הבאה טוענת תמונה עדכנית.
+    """
+
+    def __init__(self, max_events: int):
+        self.max_events = max_events
+        self._projections: "OrderedDict[int, SeatingProjection]" = OrderedDict()
+        self._generations: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, db: Session, event_id: int) -> SeatingProjection:
+        with self._lock:
+            projection = self._projections.get(event_id)
+            if projection is not None:
+                self._projections.move_to_end(event_id)
+                self.hits += 1
+                return projection
+            self.misses += 1
+            generation = self._generations.get(event_id, 0)
+
+        projection = SeatingProjection.load(db, event_id)
+
+        with self._lock:
+            # כתיבה שהתבצעה בזמן הטעינה - התמונה אולי לא כוללת אותה, לא שומרים
+            if self._generations.get(event_id, 0) == generation:
+                self._projections[event_id] = projection
+                while len(self._projections) > self.max_events:
+                    self._projections.popitem(last=False)
+        return projection
+
+    def invalidate(self, event_id: int):
+        with self._lock:
+            self._generations[event_id] = self._generations.get(event_id, 0) + 1
+            self._projections.pop(event_id, None)
+
+
+seating_projection_cache = SeatingProjectionCache(settings.SEATING_PROJECTION_CACHE_SIZE)
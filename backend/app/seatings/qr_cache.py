@@ -0,0 +1,161 @@
+import base64
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+from app.core.config import settings
+
+# הפניה לתמונה במטמון כפי שנשמרת בכרטיס, במקום data URL מלא
+QR_REFERENCE_PREFIX = "qr:"
+DATA_URI_PREFIX = "data:image/png;base64,"
+
+
+def qr_key(data: str) -> str:
+    """מפתח התמונה נגזר מתוכן ה-QR - אותו תוכן תמיד מקבל אותה תמונה"""
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()[:32]
+
+
+def is_reference(value: Optional[str]) -> bool:
+    return bool(value) and value.startswith(QR_REFERENCE_PREFIX)
+
+
+class QRAssetCache:
+    """
+    מטמון תמונות QR לפי hash של התוכן: LRU בזיכרון מעל אחסון קבוע בדיסק.
+    כרטיסים, כרטיסי הבוט וייצוא ה-PDF משתמשים באותן תמונות במקום לרנדר מחדש.
+    """
+
+    def __init__(self, directory: str, max_items: int):
+        self.directory = directory
+        self.max_items = max_items
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._matrices: "OrderedDict[str, List[List[bool]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.png")
+
+    def _remember(self, key: str, png: bytes):
+        with self._lock:
+            self._memory[key] = png
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_items:
+                self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[bytes]:
+        if not key or len(key) != 32 or not all(c in "0123456789abcdef" for c in key):
+            return None
+        with self._lock:
+            png = self._memory.get(key)
+            if png is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return png
+        path = self._path(key)
+        if not os.path.exists(path):
+            self.misses += 1
+            return None
+        with open(path, "rb") as f:
+            png = f.read()
+        self.hits += 1
+        self._remember(key, png)
+        return png
+
+    def contains(self, key: str) -> bool:
+        with self._lock:
+            if key in self._memory:
+                return True
+        return os.path.exists(self._path(key))
+
+    def put(self, key: str, png: bytes):
+        path = self._path(key)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # כתיבה לקובץ זמני ו-rename, כדי שקורא במקביל לא יראה קובץ חלקי
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(png)
+            os.replace(tmp_path, path)
+        self._remember(key, png)
+
+    def get_or_render(self, data: str) -> str:
+        """הפניה לתמונת ה-QR של התוכן, עם רינדור ושמירה רק אם עוד לא קיימת"""
+        from app.seatings.card_generation import render_qr_png_bytes  # Local import - card_generation uses this cache
+
+        key = qr_key(data)
+        if not self.contains(key):
+            self.put(key, render_qr_png_bytes(data))
+        return f"{QR_REFERENCE_PREFIX}{key}"
+
+    def matrix_for(self, data: str) -> List[List[bool]]:
+        """מטריצת המודולים של ה-QR לפי התוכן, לציור וקטורי ב-PDF. נבנית מהתוכן עצמו ולא מהתמונה"""
+        from app.seatings.card_generation import render_qr_matrix  # Local import - card_generation uses this cache
+
+        key = qr_key(data)
+        with self._lock:
+            matrix = self._matrices.get(key)
+            if matrix is not None:
+                self._matrices.move_to_end(key)
+                return matrix
+        matrix = render_qr_matrix(data)
+        self._remember_matrix(key, matrix)
+        return matrix
+
+    def matrix_for_stored(self, value: Optional[str]) -> Optional[List[List[bool]]]:
+        """מטריצת ה-QR מהתמונה ששמורה בכרטיס (הפניה למטמון או data URL ישן) - לכרטיסים שלא שמרו את תוכן ה-QR"""
+        from app.seatings.card_generation import qr_matrix_from_png  # Local import - card_generation uses this cache
+
+        if not value:
+            return None
+        # הפניה היא ה-hash של התוכן - אותו מפתח כמו ב-matrix_for
+        key = value[len(QR_REFERENCE_PREFIX):] if is_reference(value) else qr_key(value)
+        with self._lock:
+            matrix = self._matrices.get(key)
+            if matrix is not None:
+                self._matrices.move_to_end(key)
+                return matrix
+        png = self.png_for(value)
+        if png is None:
+            return None
+        matrix = qr_matrix_from_png(png)
+        self._remember_matrix(key, matrix)
+        return matrix
+
+    def _remember_matrix(self, key: str, matrix: List[List[bool]]):
+        with self._lock:
+            self._matrices[key] = matrix
+            while len(self._matrices) > self.max_items:
+                self._matrices.popitem(last=False)
+
+    def png_for(self, value: str) -> Optional[bytes]:
+        """בייטים של ה-PNG עבור הפניה למטמון או data URL ישן שנשמר בכרטיס"""
+        if is_reference(value):
+            return self.get(value[len(QR_REFERENCE_PREFIX):])
+        if value and value.startswith(DATA_URI_PREFIX):
+            return base64.b64decode(value[len(DATA_URI_PREFIX):])
+        return None
+
+    def data_uri(self, value: str) -> Optional[str]:
+        if value and value.startswith(DATA_URI_PREFIX):
+            return value
+        png = self.png_for(value)
+        if png is None:
+            return None
+        return f"{DATA_URI_PREFIX}{base64.b64encode(png).decode()}"
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {"memory_items": len(self._memory), "matrix_items": len(self._matrices), "hits": self.hits, "misses": self.misses}
+
+
+def qr_url(reference: Optional[str]) -> Optional[str]:
+    if not is_reference(reference):
+        return None
+    return f"/seatings/qr/{reference[len(QR_REFERENCE_PREFIX):]}.png"
+
+
+qr_cache = QRAssetCache(settings.QR_CACHE_DIR, settings.QR_CACHE_MEMORY_ITEMS)
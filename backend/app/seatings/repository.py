@@ -1,17 +1,19 @@
+from sqlalchemy import delete, func, insert, update
 from sqlalchemy.orm import Session, joinedload
 from app.seatings import schemas, models
 from app.seatings.models import Seating, SeatingCard
 from fastapi import HTTPException
 from sqlalchemy.exc import IntegrityError
-from app.audit_log.repository import log_change
+from app.audit_log.repository import log_change, log_changes
 from app.guests.models import Guest
 from app.tables.models import Table
 from app.events.models import Event
+from app.seatings.card_generation import ProgressCallback, cache_qr_codes, card_generation_progress, card_qr_payload
+from app.seatings.qr_cache import qr_cache
+from app.realtime.event_caches import invalidate_event_caches
 import json
-import qrcode
-import base64
-from io import BytesIO
-import os
+from datetime import datetime
+from typing import Optional
 
 def assign_seat(db: Session, seating: schemas.SeatingCreate, user_id: int = None):
     new_seating = Seating(**seating.dict())
@@ -41,67 +43,54 @@ def assign_seat(db: Session, seating: schemas.SeatingCreate, user_id: int = None
             event_id=seating.event_id
         )
         db.commit()  # שמור את כל השינויים
+        invalidate_event_caches(seating.event_id)
         return new_seating
     except IntegrityError:
         db.rollback()
         raise HTTPException(status_code=400, detail="Guest already assigned to a table in this event")
 
+# עמודות ה-seating כפי שהן מוחזרות ל-/seatings/event/{event_id} (אותם שדות כמו SeatingOut)
+SEATING_READ_COLUMNS = (
+    "id", "guest_id", "event_id", "table_id", "seat_number", "created_at", "updated_at",
+    "is_occupied", "occupied_at", "occupied_by", "guest_name", "guest_gender", "table_number", "table_size"
+)
+
+def get_seating_rows(db: Session, event_id: int) -> list:
+    """כל ה-seatings של האירוע עם שם ומגדר המוזמן ופרטי השולחן - שאילתה אחת של העמודות הנדרשות בלבד"""
+    rows = db.query(
+        Seating.id, Seating.guest_id, Seating.event_id, Seating.table_id, Seating.seat_number,
+        Seating.created_at, Seating.updated_at, Seating.is_occupied, Seating.occupied_at, Seating.occupied_by,
+        Guest.id.label("joined_guest_id"), Guest.first_name, Guest.last_name, Guest.gender,
+        Table.table_number, Table.size
+    ).outerjoin(
+        Guest, Guest.id == Seating.guest_id
+    ).outerjoin(
+        Table, Table.id == Seating.table_id
+    ).filter(Seating.event_id == event_id).order_by(Seating.id).all()
+
+    return [
+        {
+            "id": row.id,
+            "guest_id": row.guest_id,
+            "event_id": row.event_id,
+            "table_id": row.table_id,
+            "seat_number": row.seat_number,
+            "created_at": row.created_at,
+            "updated_at": row.updated_at,
+            "is_occupied": row.is_occupied,
+            "occupied_at": row.occupied_at,
+            "occupied_by": row.occupied_by,
+            "guest_name": f"{row.first_name} {row.last_name}" if row.joined_guest_id is not None else None,
+            "guest_gender": row.gender,
+            "table_number": row.table_number,
+            "table_size": row.size
+        }
+        for row in rows
+    ]
+
 def get_seatings_by_event(db: Session, event_id: int):
     try:
-        print(f"מתחיל לטעון seatings לאירוע {event_id}")
-        
-        # בדיקה כללית של כל ה-seatings
-        total_seatings = db.query(Seating).count()
-        print(f"סהכ seatings בדאטהבייס: {total_seatings}")
-        
-        # בדיקה ישירה של המוזמנים
-        guests = db.query(Guest).filter(Guest.event_id == event_id).all()
-        print(f"נמצאו {len(guests)} מוזמנים לאירוע {event_id}")
-        for guest in guests:
-            print(f"Guest {guest.id}: {guest.first_name} {guest.last_name}, Gender: {guest.gender}")
-        
-        # בדיקה ישירה של seatings
-        all_seatings = db.query(Seating).filter(Seating.event_id == event_id).all()
-        print(f"נמצאו {len(all_seatings)} seatings לאירוע {event_id}")
-        
-        seatings = db.query(Seating).options(
-            joinedload(Seating.guest),
-            joinedload(Seating.table)
-        ).filter(Seating.event_id == event_id).all()
-        
-        print(f"נמצאו {len(seatings)} seatings עם joins")
-        
-        # הוספת מידע על המוזמן לכל seating
-        result = []
-        for seating in seatings:
-            guest_gender = seating.guest.gender if seating.guest else None
-            guest_name = f"{seating.guest.first_name} {seating.guest.last_name}" if seating.guest else None
-            
-            print(f"Seating {seating.id}: Guest {guest_name}, Gender: {guest_gender}")
-            print(f"Guest object: {seating.guest}")
-            if seating.guest:
-                print(f"Guest gender field: {seating.guest.gender}")
-                print(f"Guest first_name: {seating.guest.first_name}")
-                print(f"Guest last_name: {seating.guest.last_name}")
-            
-            seating_dict = {
-                "id": seating.id,
-                "event_id": seating.event_id,
-                "table_id": seating.table_id,
-                "guest_id": seating.guest_id,
-                "seat_number": seating.seat_number,
-                "is_occupied": seating.is_occupied,
-                "occupied_at": seating.occupied_at,
-                "occupied_by": seating.occupied_by,
-                "guest_name": guest_name,
-                "guest_gender": guest_gender,
-                "table_number": seating.table.table_number if seating.table else None,
-                "table_size": seating.table.size if seating.table else None
-            }
-            result.append(seating_dict)
-        
-        print(f"נמצאו {len(result)} seatings")
-        return result
+        return get_seating_rows(db, event_id)
     except Exception as e:
         print(f"שגיאה בטעינת seatings: {str(e)}")
         import traceback
@@ -138,6 +127,7 @@ def delete_seating(db: Session, seating_id: int, user_id: int = None):
         # מחיקת ה-seating
         db.delete(db_seating)
         db.commit()
+        invalidate_event_caches(db_seating.event_id)
     return db_seating
 
 def update_seating(db: Session, seating_id: int, seating_update: dict, user_id: int = None):
@@ -219,6 +209,7 @@ def update_seating(db: Session, seating_id: int, seating_update: dict, user_id:
                     )
         db.commit()
         db.refresh(db_seating)
+        invalidate_event_caches(db_seating.event_id)
     return db_seating
 
 def delete_seatings_by_event(db: Session, event_id: int, user_id: int = None):
@@ -252,9 +243,161 @@ def delete_seatings_by_event(db: Session, event_id: int, user_id: int = None):
     # מחיקת כל מקומות הישיבה
     db.query(Seating).filter(Seating.event_id == event_id).delete(synchronize_session=False)
     db.commit()
+    invalidate_event_caches(event_id)
     
     return len(seatings)
 
+def _plan_table_index(tables: list, event_table_ids: set) -> tuple:
+    """אינדקס השולחנות שנשלחו בתוכנית לפי מספר ולפי id - רק שולחנות ששייכים לאירוע"""
+    by_number, by_id = {}, {}
+    for table in tables:
+        table_id = table.get("id")
+        if table_id not in event_table_ids:
+            continue
+        by_id.setdefault(table_id, table_id)
+        if table.get("table_number") is not None:
+            by_number.setdefault(table.get("table_number"), table_id)
+    return by_number, by_id
+
+def diff_seating_plan(db: Session, event_id: int, tables: list, guests: list) -> dict:
+    """
+    השוואת תוכנית ישיבה שלמה למצב במסד: אילו seatings להוסיף, לעדכן ולמחוק.
+    מוזמן מזוהה לשולחן לפי tableNumber, שיכול להיות מספר השולחן או ה-id שלו.
+    """
+    table_rows = db.query(Table.id, Table.table_number).filter(Table.event_id == event_id).all()
+    table_numbers = {row.id: row.table_number for row in table_rows}
+    by_number, by_id = _plan_table_index(tables, set(table_numbers))
+
+    event_guest_ids = {
+        guest_id for (guest_id,) in db.query(Guest.id).filter(Guest.event_id == event_id)
+    }
+    existing = {
+        row.guest_id: row
+        for row in db.query(Seating.id, Seating.guest_id, Seating.table_id, Seating.seat_number).filter(
+            Seating.event_id == event_id
+        )
+    }
+
+    created, updated, skipped = [], [], []
+    plan_guest_ids = set()
+    for guest in guests:
+        guest_id = guest.get("id")
+        plan_guest_ids.add(guest_id)
+        table_ref = guest.get("tableNumber")
+        table_id = by_number.get(table_ref) or by_id.get(table_ref)
+        if not table_id:
+            # מוזמן שנשלח בלי שולחן נמצא ב-plan_guest_ids, ולכן המקום הקיים שלו נשמר (כמו קודם) ולא נמחק.
+            # מדווחים עליו כדי שהלקוח יראה שהמקום לא השתנה
+            if table_ref is not None:
+                skipped.append({"guest_id": guest_id, "reason": "table_not_found"})
+            elif guest_id in existing:
+                skipped.append({"guest_id": guest_id, "reason": "no_table_seat_kept"})
+            continue
+        if guest_id not in event_guest_ids:
+            skipped.append({"guest_id": guest_id, "reason": "guest_not_in_event"})
+            continue
+
+        seat_number = guest.get("seatNumber")
+        current = existing.get(guest_id)
+        if current is None:
+            created.append({"guest_id": guest_id, "table_id": table_id, "seat_number": seat_number})
+        elif current.table_id != table_id or current.seat_number != seat_number:
+            updated.append({
+                "seating_id": current.id,
+                "guest_id": guest_id,
+                "table_id": table_id,
+                "seat_number": seat_number,
+                "old_table_id": current.table_id,
+                "old_seat_number": current.seat_number
+            })
+
+    # כמו קודם: מוזמן שלא מופיע בכלל ברשימה - המקום שלו נמחק
+    deleted = [
+        {"seating_id": row.id, "guest_id": guest_id, "table_id": row.table_id, "seat_number": row.seat_number}
+        for guest_id, row in existing.items() if guest_id not in plan_guest_ids
+    ]
+    for items in (created, updated, deleted):
+        for item in items:
+            item["table_number"] = table_numbers.get(item["table_id"])
+    for item in updated:
+        item["old_table_number"] = table_numbers.get(item["old_table_id"])
+    return {"created": created, "updated": updated, "deleted": deleted, "skipped": skipped}
+
+def apply_seating_plan(db: Session, event_id: int, tables: list, guests: list, user_id: int = None,
+                       dry_run: bool = False) -> dict:
+    """
+    שמירת תוכנית ישיבה שלמה כ-diff: INSERT אחד לחדשים, UPDATE מרוכז לשינויים, DELETE אחד למחוקים
+    ושורות לוג בכתיבה אחת - הכל בטרנזקציה אחת. מחזיר את ה-diff (ב-dry_run בלי לשמור).
+    """
+    diff = diff_seating_plan(db, event_id, tables, guests)
+    if dry_run or not (diff["created"] or diff["updated"] or diff["deleted"]):
+        return diff
+
+    guest_ids = {item["guest_id"] for key in ("created", "updated", "deleted") for item in diff[key]}
+    guest_names = {
+        row.id: f"{row.first_name} {row.last_name}"
+        for row in db.query(Guest.id, Guest.first_name, Guest.last_name).filter(Guest.id.in_(guest_ids))
+    }
+
+    def table_info(table_number):
+        return f"שולחן {table_number}" if table_number is not None else "שולחן לא ידוע"
+
+    try:
+        audit_entries = []
+        if diff["deleted"]:
+            seating_ids = [item["seating_id"] for item in diff["deleted"]]
+            db.execute(delete(SeatingCard).where(SeatingCard.seating_id.in_(seating_ids)))
+            db.execute(delete(Seating).where(Seating.id.in_(seating_ids)))
+            for item in diff["deleted"]:
+                audit_entries.append({
+                    "action": "delete", "entity_type": "Seating", "entity_id": item["seating_id"], "field": "table_id",
+                    "old_value": f"{guest_names.get(item['guest_id'], 'מוזמן לא ידוע')} הוסר מ{table_info(item['table_number'])}",
+                    "new_value": ""
+                })
+
+        if diff["updated"]:
+            now = datetime.utcnow()
+            db.execute(update(Seating), [
+                {"id": item["seating_id"], "table_id": item["table_id"], "seat_number": item["seat_number"], "updated_at": now}
+                for item in diff["updated"]
+            ])
+            for item in diff["updated"]:
+                audit_entries.append({
+                    "action": "update", "entity_type": "Seating", "entity_id": item["seating_id"], "field": "table_id",
+                    "old_value": f"{table_info(item.get('old_table_number'))}, מקום {item['old_seat_number']}",
+                    "new_value": f"{guest_names.get(item['guest_id'], 'מוזמן לא ידוע')} הועבר ל{table_info(item['table_number'])}, מקום {item['seat_number']}"
+                })
+
+        if diff["created"]:
+            now = datetime.utcnow()
+            new_ids = db.execute(
+                insert(Seating).returning(Seating.id, Seating.guest_id, sort_by_parameter_order=True),
+                [
+                    {"guest_id": item["guest_id"], "event_id": event_id, "table_id": item["table_id"],
+                     "seat_number": item["seat_number"], "created_at": now, "updated_at": now}
+                    for item in diff["created"]
+                ]
+            ).all()
+            for item, row in zip(diff["created"], new_ids):
+                item["seating_id"] = row.id
+                audit_entries.append({
+                    "action": "create", "entity_type": "Seating", "entity_id": row.id, "field": "table_id",
+                    "old_value": "",
+                    "new_value": f"{guest_names.get(item['guest_id'], 'מוזמן לא ידוע')} הוקצה ל{table_info(item['table_number'])}"
+                })
+
+        log_changes(db, user_id, audit_entries, event_id=event_id)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="תוכנית הישיבה מתנגשת עם נתונים קיימים - נסה לטעון מחדש")
+    except Exception:
+        db.rollback()
+        raise
+
+    invalidate_event_caches(event_id)
+    return diff
+
 # פונקציות חדשות לכרטיסי ישיבה
 def create_seating_card(db: Session, card_data: schemas.SeatingCardCreate):
     db_card = SeatingCard(**card_data.dict())
@@ -280,19 +423,8 @@ def update_card_download_status(db: Session, card_id: int, is_downloaded: bool):
     return None
 
 def generate_qr_code(data: str) -> str:
-    """יצירת QR Code מנתונים"""
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(data)
-    qr.make(fit=True)
-    
-    img = qr.make_image(fill_color="black", back_color="white")
-    buffer = BytesIO()
-    img.save(buffer, format='PNG')
-    buffer.seek(0)
-    
-    # המרה ל-base64
-    img_str = base64.b64encode(buffer.getvalue()).decode()
-    return f"data:image/png;base64,{img_str}"
+    """יצירת QR Code מנתונים (דרך מטמון התמונות)"""
+    return qr_cache.data_uri(qr_cache.get_or_render(data))
 
 def delete_seating_cards_by_event(db: Session, event_id: int):
     """מחיקת כל כרטיסי הישיבה לאירוע מסוים"""
@@ -302,90 +434,96 @@ def delete_seating_cards_by_event(db: Session, event_id: int):
     db.commit()
     return len(cards)
 
-def generate_cards_for_event(db: Session, event_id: int, logo_path: str = None, force_recreate: bool = False):
-    """יצירת כרטיסי ישיבה לכל המוזמנים שהגיעו"""
-    
+def generate_cards_for_event(db: Session, event_id: int, logo_path: str = None, force_recreate: bool = False,
+                             progress_callback: Optional[ProgressCallback] = None):
+    """
+    יצירת כרטיסי ישיבה לכל המוזמנים שהגיעו: שאילתה אחת עם join לכל הנתונים,
+    רינדור ה-QR במקביל ב-pool של תהליכים, והכנסה מרוכזת של כל הכרטיסים בטרנזקציה אחת.
+    """
+
+    def report(**changes):
+        state = card_generation_progress.update(event_id, **changes)
+        if progress_callback:
+            progress_callback(state)
+
     print(f"מתחיל יצירת כרטיסים לאירוע {event_id}")
-    print(f"נתיב לוגו: {logo_path}")
-    print(f"לוגו קיים: {os.path.exists(logo_path) if logo_path else False}")
-    
-    # בדיקה אם כבר קיימים כרטיסים לאירוע זה
-    existing_cards = db.query(SeatingCard).filter(SeatingCard.event_id == event_id).all()
-    if existing_cards and not force_recreate:
-        print(f"כבר קיימים {len(existing_cards)} כרטיסים לאירוע זה. לא יוצרים חדשים.")
-        return existing_cards
-    
-    # אם יש כרטיסים קיימים ורוצים ליצור מחדש, נמחק אותם
-    if existing_cards and force_recreate:
-        print(f"מוחק {len(existing_cards)} כרטיסים קיימים ויוצר חדשים")
-        delete_seating_cards_by_event(db, event_id)
-    
-    # קבלת כל המוזמנים שהגיעו לאירוע
-    confirmed_guests = db.query(Guest).filter(
-        Guest.event_id == event_id,
-        Guest.confirmed_arrival == True
-    ).all()
-    
-    print(f"נמצאו {len(confirmed_guests)} מוזמנים עם אישור הגעה")
-    
-    created_cards = []
-    
-    for guest in confirmed_guests:
-        # בדיקה אם יש מקום ישיבה למוזמן
-        seating = db.query(Seating).filter(
-            Seating.guest_id == guest.id,
-            Seating.event_id == event_id
-        ).first()
-        
-        if not seating:
-            print(f"אין מקום ישיבה למוזמן {guest.first_name} {guest.last_name}")
-            continue
-            
-        # קבלת פרטי השולחן
-        table = db.query(Table).filter(Table.id == seating.table_id).first()
-        event = db.query(Event).filter(Event.id == event_id).first()
-        
-        if not table or not event:
-            print(f"חסרים פרטי שולחן או אירוע למוזמן {guest.first_name} {guest.last_name}")
-            continue
-            
-        # יצירת QR Code - כעת ללא פרטי מקום; רק זיהוי מוזמן + אירוע
-        qr_data = json.dumps({
-            "event_id": event_id,
-            "first_name": guest.first_name,
-            "last_name": guest.last_name,
-            "phone": guest.phone or ""
-        })
-        
-        print(f"QR Code data for {guest.first_name} {guest.last_name}: {qr_data}")
-        
-        qr_code = generate_qr_code(qr_data)
-        
-        # יצירת נתוני הכרטיס
-        card_data = {
-            "guest_name": f"{guest.first_name} {guest.last_name}",
-            "event_name": event.name,
-            "table_number": table.table_number,
-            "seat_number": seating.seat_number,
-            "qr_code": qr_code
-        }
-        
-        print(f"יוצר כרטיס למוזמן: {guest.first_name} {guest.last_name}")
-        print(f"לוגו שישמר: {logo_path}")
-        
-        # יצירת כרטיס ישיבה
-        card_create = schemas.SeatingCardCreate(
-            event_id=event_id,
-            guest_id=guest.id,
-            seating_id=seating.id,
-            qr_code=qr_code,
-            card_data=json.dumps(card_data),
-            logo_path=logo_path
-        )
-        
-        created_card = create_seating_card(db, card_create)
-        created_cards.append(created_card)
-        print(f"כרטיס נוצר בהצלחה עם ID: {created_card.id}")
-    
-    print(f"סה״כ נוצרו {len(created_cards)} כרטיסים")
-    return created_cards
+    card_generation_progress.start(event_id)
+
+    try:
+        # בדיקה אם כבר קיימים כרטיסים לאירוע זה
+        existing_count = db.query(func.count(SeatingCard.id)).filter(SeatingCard.event_id == event_id).scalar()
+        if existing_count and not force_recreate:
+            print(f"כבר קיימים {existing_count} כרטיסים לאירוע זה. לא יוצרים חדשים.")
+            report(status="done", total=existing_count, rendered=existing_count, saved=0)
+            return db.query(SeatingCard).filter(SeatingCard.event_id == event_id).order_by(SeatingCard.id).all()
+
+        event = db.query(Event.name).filter(Event.id == event_id).first()
+        if not event:
+            raise HTTPException(status_code=404, detail="Event not found")
+
+        # כל המוזמנים שהגיעו ויש להם מקום ישיבה, עם פרטי השולחן - בשאילתה אחת
+        rows = db.query(
+            Guest.id, Guest.first_name, Guest.last_name, Guest.phone,
+            Seating.id.label("seating_id"), Seating.seat_number, Table.table_number
+        ).join(
+            Seating, (Seating.guest_id == Guest.id) & (Seating.event_id == event_id)
+        ).join(
+            Table, Table.id == Seating.table_id
+        ).filter(
+            Guest.event_id == event_id,
+            Guest.confirmed_arrival == True
+        ).order_by(Guest.id, Seating.id).all()
+
+        # מקום ישיבה אחד לכל מוזמן (הראשון), כמו קודם
+        guests = []
+        seen = set()
+        for row in rows:
+            if row.id not in seen:
+                seen.add(row.id)
+                guests.append(row)
+
+        print(f"נמצאו {len(guests)} מוזמנים עם אישור הגעה ומקום ישיבה")
+        report(status="rendering", total=len(guests), rendered=0)
+
+        # הכרטיס שומר רק הפניה לתמונה במטמון; תמונות שכבר קיימות (יצירה חוזרת) לא מרונדרות שוב
+        qr_payloads = [card_qr_payload(event_id, guest.first_name, guest.last_name, guest.phone) for guest in guests]
+        qr_codes = cache_qr_codes(qr_payloads, on_rendered=lambda done: report(rendered=done))
+
+        report(status="saving")
+        created_at = datetime.utcnow()
+        card_rows = [
+            {
+                "event_id": event_id,
+                "guest_id": guest.id,
+                "seating_id": guest.seating_id,
+                "qr_code": qr_code,
+                "card_data": json.dumps({
+                    "guest_name": f"{guest.first_name} {guest.last_name}",
+                    "event_name": event.name,
+                    "table_number": guest.table_number,
+                    "seat_number": guest.seat_number,
+                    # התוכן שממנו נוצר ה-QR - ה-PDF מצייר אותו ולא מחשב מחדש מפרטי המוזמן העדכניים
+                    "qr_payload": qr_payload,
+                }),
+                "logo_path": logo_path,
+                "created_at": created_at,
+                "is_downloaded": False,
+            }
+            for guest, qr_payload, qr_code in zip(guests, qr_payloads, qr_codes)
+        ]
+
+        # מחיקת הכרטיסים הישנים והכנסת החדשים באותה טרנזקציה - אין רגע שבו לאירוע אין כרטיסים
+        if existing_count:
+            print(f"מוחק {existing_count} כרטיסים קיימים ויוצר חדשים")
+            db.execute(delete(SeatingCard).where(SeatingCard.event_id == event_id))
+        if card_rows:
+            db.execute(insert(SeatingCard), card_rows)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        report(status="failed", error=str(getattr(e, "detail", e)))
+        raise
+
+    report(status="done", saved=len(card_rows))
+    print(f"סה״כ נוצרו {len(card_rows)} כרטיסים")
+    return db.query(SeatingCard).filter(SeatingCard.event_id == event_id).order_by(SeatingCard.id).all()
@@ -4,12 +4,14 @@ from app.events import models
 from app.tableHead import schemas
 from app.audit_log.repository import log_change
 from app.guests.models import Guest
+from app.realtime.event_caches import invalidate_event_caches
 
 def create_table_head(db: Session, table_head: schemas.TableHeadCreate, user_id: int = None):
     db_table_head = models.TableHead(**table_head.dict())
     db.add(db_table_head)
     db.commit()
     db.refresh(db_table_head)
+    invalidate_event_caches(db_table_head.event_id)
     # תיעוד בלוג
     log_change(
         db=db,
@@ -52,6 +54,7 @@ def delete_table_head(db: Session, table_head_id: int, user_id: int = None):
         )
         db.delete(db_table_head)
         db.commit()
+        invalidate_event_caches(db_table_head.event_id)
     return db_table_head
 
 def update_table_head(db: Session, table_head_id: int, table_head_update: schemas.TableHeadUpdate, user_id: int = None):
@@ -75,4 +78,5 @@ def update_table_head(db: Session, table_head_id: int, table_head_update: schema
                 )
         db.commit()
         db.refresh(db_table_head)
+        invalidate_event_caches(db_table_head.event_id)
     return db_table_head
\ No newline at end of file
@@ -1,7 +1,12 @@
+from sqlalchemy import and_, delete, insert, or_, select, update
 from sqlalchemy.orm import Session
+from fastapi import HTTPException
 from app.tables import models, schemas
 from sqlalchemy.exc import IntegrityError
-from app.audit_log.repository import log_change
+from app.audit_log.repository import log_change, log_changes
+from app.realtime.models import RealTimeNotification
+from app.seatings.models import Seating, SeatingCard
+from app.realtime.event_caches import invalidate_event_caches
 
 def create_table(db: Session, table: schemas.TableCreate, user_id: int = None):
     # בדיקה אם כבר קיימת רשומה עם אותו event_id ו-table_number
@@ -29,6 +34,7 @@ def create_table(db: Session, table: schemas.TableCreate, user_id: int = None):
             event_id=table.event_id
         )
         db.commit()  # שמור את כל השינויים
+        invalidate_event_caches(table.event_id)
     except IntegrityError:
         db.rollback()
         # חפש שוב את הרשומה והחזר אותה
@@ -67,6 +73,7 @@ def update_table(db: Session, table_id: int, table_update: schemas.TableUpdate,
                 )
         db.commit()
         db.refresh(db_table)
+        invalidate_event_caches(db_table.event_id)
     return db_table
 
 
@@ -93,8 +100,145 @@ def delete_table(db: Session, table_id: int, user_id: int = None):
         )
         db.delete(db_table)
         db.commit()
+        invalidate_event_caches(db_table.event_id)
     return db_table
 
+# עמודות של שולחן שמגיעות מהמעצב (table_number נקבע לפי הסדר ברשימה)
+LAYOUT_FIELDS = ("table_number", "size", "shape", "x", "y", "table_head", "category")
+
+def diff_hall_layout(existing: list, submitted: list) -> dict:
+    """
+    השוואת פריסת אולם שנשלחה מהמעצב לשולחנות הקיימים באותו אולם.
+    שולחן מזוהה קודם לפי id (רק id של שולחן מהאולם הזה), ואם אין id - לפי מספר השולחן שנשלח.
+    כמו תמיד, מספרי השולחנות נקבעים מחדש לפי הסדר ברשימה (1..n).
+    """
+    by_id = {table.id: table for table in existing}
+    by_number = {table.table_number: table for table in existing}
+    matches = [None] * len(submitted)
+    claimed = set()
+
+    for position, item in enumerate(submitted):
+        if item.id is not None and item.id in by_id and item.id not in claimed:
+            matches[position] = by_id[item.id]
+            claimed.add(item.id)
+    for position, item in enumerate(submitted):
+        if matches[position] is None and item.id is None:
+            current = by_number.get(item.table_number)
+            if current is not None and current.id not in claimed:
+                matches[position] = current
+                claimed.add(current.id)
+
+    created, updated, unchanged = [], [], []
+    for position, (item, current) in enumerate(zip(submitted, matches), 1):
+        values = {field: getattr(item, field) for field in LAYOUT_FIELDS}
+        values["table_number"] = position
+        if current is None:
+            created.append({"position": position, "values": values})
+            continue
+        changes = {field: value for field, value in values.items() if getattr(current, field) != value}
+        if not changes:
+            unchanged.append({"table_id": current.id, "position": position})
+            continue
+        updated.append({
+            "table_id": current.id,
+            "position": position,
+            "changes": changes,
+            "old": {field: getattr(current, field) for field in changes}
+        })
+
+    deleted = [
+        {"table_id": table.id, "table_number": table.table_number, "size": table.size}
+        for table in existing if table.id not in claimed
+    ]
+    return {"created": created, "updated": updated, "deleted": deleted, "unchanged": unchanged, "unseated": []}
+
+def apply_hall_layout(db: Session, event_id: int, hall_type: str, tables: list, user_id: int = None) -> dict:
+    """
+    שמירת פריסת אולם כ-diff בטרנזקציה אחת: מחיקה של שולחנות שהוסרו (עם המקומות והכרטיסים שלהם בלבד),
+    UPDATE מרוכז לשולחנות שהשתנו, INSERT אחד לחדשים. המקומות בשולחנות שנשארו לא נוגעים -
+    חוץ ממקומות שמספרם גדול מהגודל החדש של שולחן שהוקטן (מוחזרים ב-unseated).
+    """
+    Table = models.Table
+    existing = db.query(Table.id, *[getattr(Table, field) for field in LAYOUT_FIELDS]).filter(
+        Table.event_id == event_id, Table.hall_type == hall_type
+    ).all()
+    diff = diff_hall_layout(existing, tables)
+    if not (diff["created"] or diff["updated"] or diff["deleted"]):
+        return diff
+
+    def describe(number, size):
+        return f"שולחן {number} ({size} מקומות)"
+
+    try:
+        audit_entries = []
+        deleted_ids = [item["table_id"] for item in diff["deleted"]]
+        if deleted_ids:
+            seating_ids = select(Seating.id).where(Seating.table_id.in_(deleted_ids))
+            db.execute(delete(SeatingCard).where(SeatingCard.seating_id.in_(seating_ids)))
+            db.execute(delete(Seating).where(Seating.table_id.in_(deleted_ids)))
+            # ההתראות עצמן נשארות בהיסטוריה, רק בלי קישור לשולחן
+            db.execute(update(RealTimeNotification).where(RealTimeNotification.table_id.in_(deleted_ids)).values(table_id=None))
+            db.execute(delete(Table).where(Table.id.in_(deleted_ids)))
+            for item in diff["deleted"]:
+                audit_entries.append({
+                    "action": "delete", "entity_type": "Table", "entity_id": item["table_id"], "field": "table_number",
+                    "old_value": describe(item["table_number"], item["size"]), "new_value": ""
+                })
+
+        shrunk = [item for item in diff["updated"] if "size" in item["changes"] and item["changes"]["size"] < item["old"]["size"]]
+        if shrunk:
+            overflow = or_(*[
+                and_(Seating.table_id == item["table_id"], Seating.seat_number > item["changes"]["size"])
+                for item in shrunk
+            ])
+            diff["unseated"] = [
+                {"seating_id": row.id, "guest_id": row.guest_id, "table_id": row.table_id, "seat_number": row.seat_number}
+                for row in db.execute(select(Seating.id, Seating.guest_id, Seating.table_id, Seating.seat_number).where(overflow))
+            ]
+            if diff["unseated"]:
+                unseated_ids = [item["seating_id"] for item in diff["unseated"]]
+                db.execute(delete(SeatingCard).where(SeatingCard.seating_id.in_(unseated_ids)))
+                db.execute(delete(Seating).where(Seating.id.in_(unseated_ids)))
+
+        if diff["updated"]:
+            renumbered = [item for item in diff["updated"] if "table_number" in item["changes"]]
+            if renumbered:
+                # מספרים זמניים (שליליים וייחודיים) כדי שהחלפת מספרים בין שולחנות לא תתנגש ב-uq_event_table_number
+                db.execute(update(Table), [{"id": item["table_id"], "table_number": -item["table_id"]} for item in renumbered])
+            db.execute(update(Table), [{"id": item["table_id"], **item["changes"]} for item in diff["updated"]])
+            for item in diff["updated"]:
+                for field, value in item["changes"].items():
+                    old_value = item["old"][field]
+                    audit_entries.append({
+                        "action": "update", "entity_type": "Table", "entity_id": item["table_id"], "field": field,
+                        "old_value": str(old_value) if old_value is not None else "",
+                        "new_value": str(value) if value is not None else ""
+                    })
+
+        if diff["created"]:
+            new_ids = db.execute(
+                insert(Table).returning(Table.id, sort_by_parameter_order=True),
+                [{**item["values"], "event_id": event_id, "hall_type": hall_type} for item in diff["created"]]
+            ).scalars().all()
+            for item, table_id in zip(diff["created"], new_ids):
+                item["table_id"] = table_id
+                audit_entries.append({
+                    "action": "create", "entity_type": "Table", "entity_id": table_id, "field": "table_number",
+                    "old_value": "", "new_value": describe(item["values"]["table_number"], item["values"]["size"])
+                })
+
+        log_changes(db, user_id, audit_entries, event_id=event_id)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="פריסת האולם מתנגשת עם נתונים קיימים - נסה לטעון מחדש")
+    except Exception:
+        db.rollback()
+        raise
+
+    invalidate_event_caches(event_id)
+    return diff
+
 # HallElement repository functions
 def create_hall_element(db: Session, element: schemas.HallElementCreate, user_id: int = None):
     db_element = models.HallElement(**element.dict())
@@ -115,6 +259,7 @@ def create_hall_element(db: Session, element: schemas.HallElementCreate, user_id
             event_id=element.event_id
         )
         db.commit()
+        invalidate_event_caches(element.event_id)
     except IntegrityError:
         db.rollback()
         return db.query(models.HallElement).filter_by(
@@ -137,6 +282,7 @@ def update_hall_element(db: Session, element_id: int, element_update: schemas.Ha
             setattr(db_element, field, value)
         db.commit()
         db.refresh(db_element)
+        invalidate_event_caches(db_element.event_id)
     return db_element
 
 def delete_hall_element(db: Session, element_id: int):
@@ -144,4 +290,5 @@ def delete_hall_element(db: Session, element_id: int):
     if db_element:
         db.delete(db_element)
         db.commit()
+        invalidate_event_caches(db_element.event_id)
     return db_element
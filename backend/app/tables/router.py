@@ -1,27 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException, Body
+from fastapi import APIRouter, Depends, HTTPException, Body, Query
 from sqlalchemy.orm import Session
-from app.core.database import SessionLocal
+from app.core.database import get_db
 from app.auth.dependencies import get_current_user
 from app.tables import models, schemas
 from app.tables.repository import (
-    create_table, get_table, get_tables_by_event, update_table, delete_table,
+    create_table, get_table, get_tables_by_event, update_table, delete_table, apply_hall_layout,
     create_hall_element, get_hall_elements_by_event, update_hall_element, delete_hall_element
 )
 from app.permissions.utils import check_event_permission
 from app.audit_log.repository import log_change
-from typing import List
+from app.realtime.event_caches import invalidate_event_caches
+from app.seatings.projection import seating_projection_cache
+from app.tables.spatial import TABLE_FOOTPRINT, element_box, hall_spatial_cache
+from typing import List, Optional
 import json
 
 router = APIRouter(prefix="/tables", tags=["Tables"])
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.post("/", response_model=schemas.TableOut)
 def create(table: schemas.TableCreate, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
     return create_table(db, table, current_user.id)
@@ -66,204 +62,101 @@ def delete(table_id: int, db: Session = Depends(get_db), current_user = Depends(
 def get_by_event(event_id: int, hall_type: str = None, db: Session = Depends(get_db)):
     return get_tables_by_event(db, event_id, hall_type)
 
-@router.post("/event/{event_id}/bulk", response_model=list[schemas.TableOut])
-def bulk_create_tables(event_id: int, hall_type: str, tables: list[schemas.TableCreate] = Body(...), db: Session = Depends(get_db), current_user = Depends(get_current_user)):
+@router.get("/event/{event_id}/viewport")
+def get_viewport(
+    event_id: int,
+    hall_type: str,
+    min_x: float = Query(...),
+    min_y: float = Query(...),
+    max_x: float = Query(...),
+    max_y: float = Query(...),
+    include_unplaced: bool = False,
+    db: Session = Depends(get_db)
+):
+    """
+    השולחנות והאלמנטים שנמצאים (גם חלקית) בתוך המלבן - כדי שהמעצב יטען רק את מה שעל המסך.
+    bounds הם גבולות כל האולם, לגודל הקנבס ולפס הגלילה.
+    """
+    if min_x > max_x or min_y > max_y:
+        raise HTTPException(status_code=400, detail="viewport לא תקין")
+    index = hall_spatial_cache.get(db, event_id, hall_type)
+    result = index.viewport(min_x, min_y, max_x, max_y)
+    result["bounds"] = index.bounds
+    if include_unplaced:
+        result["unplaced_tables"] = index.unplaced_tables
+    return result
+
+@router.get("/event/{event_id}/nearest-free")
+def get_nearest_free_table(
+    event_id: int,
+    hall_type: str,
+    x: float,
+    y: float,
+    seats: int = Query(1, ge=1),
+    db: Session = Depends(get_db)
+):
+    """השולחן הקרוב ביותר לנקודה שיש בו לפחות seats מקומות פנויים"""
+    occupied = {}
+    for seat in seating_projection_cache.get(db, event_id).seats:
+        if seat["guest_id"] is not None:
+            occupied[seat["table_id"]] = occupied.get(seat["table_id"], 0) + 1
+
+    def free_seats(item):
+        return item.data["size"] - occupied.get(item.id, 0)
+
+    found = hall_spatial_cache.get(db, event_id, hall_type).nearest_table(x, y, lambda item: free_seats(item) >= seats)
+    if found is None:
+        raise HTTPException(status_code=404, detail="לא נמצא שולחן פנוי")
+    item, distance = found
+    return {"table": item.data, "distance": distance, "free_seats": free_seats(item)}
+
+@router.get("/event/{event_id}/collisions")
+def check_collisions(
+    event_id: int,
+    hall_type: str,
+    x: float,
+    y: float,
+    width: float = TABLE_FOOTPRINT,
+    height: float = TABLE_FOOTPRINT,
+    rotation: float = 0.0,
+    exclude_table_id: Optional[int] = None,
+    exclude_element_id: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    בדיקה לפני הצבה / הזזה: האם המלבן (ברירת מחדל - שולחן) חופף לשולחנות או לאלמנטים אחרים.
+    לאלמנט מסובב נבדק המלבן החוסם שלו. exclude_* - הפריט שמזיזים, כדי שלא יתנגש בעצמו.
+    """
+    exclude = None
+    if exclude_table_id is not None:
+        exclude = ("table", exclude_table_id)
+    elif exclude_element_id is not None:
+        exclude = ("element", exclude_element_id)
+    box = element_box(x, y, width, height, rotation)
+    return hall_spatial_cache.get(db, event_id, hall_type).collisions(box, exclude)
+
+@router.post("/event/{event_id}/bulk", response_model=schemas.HallLayoutOut)
+def bulk_create_tables(event_id: int, hall_type: str, tables: list[schemas.TableLayoutItem] = Body(...), db: Session = Depends(get_db), current_user = Depends(get_current_user)):
+    """
+    שמירת כל פריסת האולם מהמעצב: רק שולחנות שנוספו / השתנו / הוסרו נכתבים,
+    והמקומות בשולחנות שנשארו נשמרים. מחזיר את שולחנות האולם לפי הסדר,
+    ואת המקומות שנמחקו משולחנות שהוקטנו (unseated) - המוזמנים שלהם צריכים שיבוץ מחדש.
+    """
     # פעולת bulk – אם לא admin, ודא שהמשתמש מנהל אירוע לאירוע הזה
     if not current_user or getattr(current_user, 'role', None) != 'admin':
         check_event_permission(db, current_user, event_id, required_roles=("event_admin", "event_manager"))
-    print(f"=== FUNCTION CALLED - bulk_create_tables ===")
-    print(f"Event ID: {event_id}")
-    print(f"Hall Type: {hall_type}")
-    print(f"Tables parameter type: {type(tables)}")
-    print(f"Tables parameter: {tables}")
-    
-    from app.seatings import models as seatings_models
-    from app.audit_log.repository import log_change
-    print(f"=== Processing bulk tables for event {event_id}, hall {hall_type} ===")
-    print(f"Received {len(tables) if tables else 0} tables")
-    
-    # לוג מפורט של הנתונים שנקבלו
-    if tables:
-        print("=== RECEIVED TABLE DATA ===")
-        for i, table in enumerate(tables):
-            print(f"Table {i+1}: {table.dict()}")
-        print("=== END RECEIVED DATA ===")
-    
-    try:
-        # שלוף את כל השולחנות הקיימים לפני מחיקה
-        old_tables = db.query(models.Table).filter(
-            models.Table.event_id == event_id,
-            models.Table.hall_type == hall_type
-        ).all()
-        # נשווה רק לפי size ולא לפי table_number כי המספרים משתנים
-        old_set = set(t.size for t in old_tables)
-        
-        # נספור את השולחנות לפי גודל לפני המחיקה
-        old_counts = {}
-        for table in old_tables:
-            old_counts[table.size] = old_counts.get(table.size, 0) + 1
-
-        # מחק רק שיבוצים של השולחנות מה-hall_type הזה
-        table_ids = [t.id for t in old_tables]
-        print(f"Found {len(table_ids)} existing tables to delete")
-        
-        if table_ids:
-            # מחק קודם את seating_cards שמתייחסים ל-seatings של השולחנות הספציפיים
-            from app.seatings.models import SeatingCard
-            deleted_seating_cards = db.query(SeatingCard).filter(
-                SeatingCard.seating_id.in_(
-                    db.query(seatings_models.Seating.id).filter(
-                        seatings_models.Seating.table_id.in_(table_ids)
-                    )
-                )
-            ).delete(synchronize_session=False)
-            print(f"Deleted {deleted_seating_cards} seating cards")
-            
-            # מחק את attendance_logs שמתייחסים ל-guests בשולחנות הספציפיים
-            from app.realtime.models import AttendanceLog
-            guest_ids = db.query(seatings_models.Seating.guest_id).filter(
-                seatings_models.Seating.table_id.in_(table_ids)
-            ).all()
-            if guest_ids:
-                guest_id_list = [g[0] for g in guest_ids]
-                deleted_attendance_logs = db.query(AttendanceLog).filter(
-                    AttendanceLog.guest_id.in_(guest_id_list),
-                    AttendanceLog.event_id == event_id  # רק של האירוע הספציפי
-                ).delete(synchronize_session=False)
-                print(f"Deleted {deleted_attendance_logs} attendance logs")
-            
-            # מחק את realtime_notifications שמתייחסים ל-guests בשולחנות הספציפיים
-            from app.realtime.models import RealTimeNotification
-            if guest_ids:
-                deleted_notifications = db.query(RealTimeNotification).filter(
-                    RealTimeNotification.guest_id.in_(guest_id_list),
-                    RealTimeNotification.event_id == event_id  # רק של האירוע הספציפי
-                ).delete(synchronize_session=False)
-                print(f"Deleted {deleted_notifications} realtime notifications")
-            
-            # מחק את greetings שמתייחסים ל-guests בשולחנות הספציפיים
-            from app.greetings.models import Greeting
-            if guest_ids:
-                deleted_greetings = db.query(Greeting).filter(
-                    Greeting.guest_id.in_(guest_id_list),
-                    Greeting.event_id == event_id  # רק של האירוע הספציפי
-                ).delete(synchronize_session=False)
-                print(f"Deleted {deleted_greetings} greetings")
-            
-            # מחק את guest_field_values שמתייחסים ל-guests בשולחנות הספציפיים
-            from app.guests.models import GuestFieldValue
-            if guest_ids:
-                deleted_field_values = db.query(GuestFieldValue).filter(
-                    GuestFieldValue.guest_id.in_(guest_id_list)
-                ).delete(synchronize_session=False)
-                print(f"Deleted {deleted_field_values} guest field values")
-            
-            # מחק את audit_log שמתייחס לשולחנות שנמחקים
-            from app.audit_log.models import AuditLog
-            deleted_audit_logs = db.query(AuditLog).filter(
-                AuditLog.entity_type == "Table",
-                AuditLog.entity_id.in_(table_ids)
-            ).delete(synchronize_session=False)
-            print(f"Deleted {deleted_audit_logs} audit logs")
-            
-            # מחק את seatings של השולחנות הספציפיים
-            deleted_seatings = db.query(seatings_models.Seating).filter(
-                seatings_models.Seating.table_id.in_(table_ids)
-            ).delete(synchronize_session=False)
-            print(f"Deleted {deleted_seatings} seatings")
-            
-            # מחק את השולחנות הספציפיים
-            db.query(models.Table).filter(
-                models.Table.id.in_(table_ids)
-            ).delete(synchronize_session=False)
-            print(f"Deleted {len(table_ids)} tables")
-            db.commit()
-        else:
-            print("No existing tables to delete")
-        
-        created = []
-        if tables:
-            print("Creating new tables:")
-            for i, t in enumerate(tables, 1):
-                table_data = t.dict()
-                table_data["hall_type"] = hall_type
-                table_data["event_id"] = event_id
-                table_data["table_number"] = i
-                print(f"Processing table {i}: size={table_data['size']}, hall_type={table_data['hall_type']}")
-                table = models.Table(**table_data)
-                db.add(table)
-                created.append(table)
-            db.commit()
-            print("Successfully committed all changes")
-            for table in created:
-                db.refresh(table)
-            
-        # שלוף את כל השולחנות אחרי יצירה
-        new_tables = db.query(models.Table).filter(
-            models.Table.event_id == event_id,
-            models.Table.hall_type == hall_type
-        ).all()
-        
-        # נשווה רק לפי size ולא לפי table_number כי המספרים משתנים
-        new_set = set(t.size for t in new_tables)
-
-        # נוספו
-        added = new_set - old_set
-        # נמחקו
-        removed = old_set - new_set
 
-        # לוג על מה שנוסף
-        if added:
-            # נספור כמה שולחנות מכל גודל נוספו
-            added_counts = {}
-            for table in new_tables:
-                if table.size in added:
-                    added_counts[table.size] = added_counts.get(table.size, 0) + 1
-            
-            details = [f"שולחן ל-{size} סועדים × {count} שולחנות" for size, count in added_counts.items()]
-            log_change(
-                db=db,
-                user_id=current_user.id,
-                action="create",
-                entity_type="Table",
-                entity_id=0,
-                field="bulk_create",
-                old_value="",
-                new_value=", ".join(details),
-                event_id=event_id
-            )
-            print(f"LOG: Created create log for: {', '.join(details)}")
-            db.commit()
-        # לוג על מה שנמחק
-        if removed:
-            # נספור כמה שולחנות מכל גודל נמחקו
-            removed_counts = {}
-            for size in removed:
-                removed_counts[size] = old_counts.get(size, 0)
-            
-            details = [f"שולחן ל-{size} סועדים × {count} שולחנות" for size, count in removed_counts.items()]
-            log_change(
-                db=db,
-                user_id=current_user.id,
-                action="delete",
-                entity_type="Table",
-                entity_id=0,
-                field="bulk_delete",
-                old_value=", ".join(details),
-                new_value="",
-                event_id=event_id
-            )
-            print(f"LOG: Created delete log for: {', '.join(details)}")
-            db.commit()
-        
-        result = created if tables else get_tables_by_event(db, event_id, hall_type)
-        print(f"Returning {len(result)} tables")
-        return result
-        
-    except Exception as e:
-        print(f"Error during bulk operation: {str(e)}")
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Error processing tables: {str(e)}")
+    diff = apply_hall_layout(db, event_id, hall_type, tables, current_user.id)
+    print(
+        f"Hall layout saved for event {event_id} hall {hall_type}: {len(diff['created'])} created, "
+        f"{len(diff['updated'])} updated, {len(diff['deleted'])} deleted, {len(diff['unchanged'])} unchanged, "
+        f"{len(diff['unseated'])} seatings removed from shrunk tables"
+    )
+    tables = db.query(models.Table).filter(
+        models.Table.event_id == event_id,
+        models.Table.hall_type == hall_type
+    ).order_by(models.Table.table_number).all()
+    return {"tables": tables, "unseated": diff["unseated"]}
 
 @router.post("/event/{event_id}/add-single", response_model=schemas.TableOut)
 def add_single_table(event_id: int, table: schemas.TableCreate, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
@@ -294,6 +187,7 @@ def add_single_table(event_id: int, table: schemas.TableCreate, db: Session = De
     db.add(db_table)
     db.commit()
     db.refresh(db_table)
+    invalidate_event_caches(event_id)
     
     # תיעוד בלוג
     log_change(
@@ -345,6 +239,7 @@ def remove_single_table(event_id: int, table_number: int, hall_type: str, db: Se
     # מחק את השולחן
     db.delete(table)
     db.commit()
+    invalidate_event_caches(event_id)
     print(f"Removed table number {table_number} for event {event_id} hall {hall_type}")
     
     return {"message": f"Table {table_number} removed successfully"}
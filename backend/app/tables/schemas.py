@@ -22,6 +22,10 @@ class TableBase(BaseModel):
 class TableCreate(TableBase):
     pass
 
+class TableLayoutItem(TableCreate):
+    """שולחן בפריסת אולם שלמה (bulk) - id של שולחן קיים, אם יש, שומר עליו ועל המקומות שבו"""
+    id: Optional[int] = None
+
 class TableUpdate(BaseModel):
     table_head: str | None = None
     category: str | None = None
@@ -37,6 +41,17 @@ class TableOut(TableBase):
     class Config:
         from_attributes = True
 
+class UnseatedSeating(BaseModel):
+    """מקום ישיבה שנמחק כי מספרו גדול מהגודל החדש של שולחן שהוקטן - המוזמן נשאר בלי מקום"""
+    seating_id: int
+    guest_id: int
+    table_id: int
+    seat_number: int | None = None
+
+class HallLayoutOut(BaseModel):
+    tables: list[TableOut]
+    unseated: list[UnseatedSeating]
+
 # HallElement schemas
 class HallElementBase(BaseModel):
     event_id: int
@@ -0,0 +1,235 @@
+import math
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.tables.models import HallElement, Table
+
+# כמו TABLE_SIZE במעצב (HallMapInline): x/y של שולחן הם הפינה השמאלית העליונה של ריבוע 120x120
+TABLE_FOOTPRINT = 120
+
+TABLE_COLUMNS = ("id", "event_id", "table_number", "table_head", "category", "size", "shape", "x", "y", "hall_type")
+ELEMENT_COLUMNS = ("id", "event_id", "name", "element_type", "x", "y", "width", "height", "rotation", "hall_type", "properties")
+
+
+def element_box(x: float, y: float, width: Optional[float], height: Optional[float],
+                rotation: Optional[float] = 0.0) -> Tuple[float, float, float, float]:
+    """המלבן החוסם (min_x, min_y, max_x, max_y) של אלמנט, כולל סיבוב סביב המרכז"""
+    width = width or 0.0
+    height = height or 0.0
+    if not rotation:
+        return x, y, x + width, y + height
+    angle = math.radians(rotation)
+    cos, sin = abs(math.cos(angle)), abs(math.sin(angle))
+    half_w = (width * cos + height * sin) / 2
+    half_h = (width * sin + height * cos) / 2
+    center_x, center_y = x + width / 2, y + height / 2
+    return center_x - half_w, center_y - half_h, center_x + half_w, center_y + half_h
+
+
+class SpatialItem:
+    __slots__ = ("kind", "id", "min_x", "min_y", "max_x", "max_y", "data")
+
+    def __init__(self, kind: str, id: int, box: Tuple[float, float, float, float], data: dict):
+        self.kind = kind
+        self.id = id
+        self.min_x, self.min_y, self.max_x, self.max_y = box
+        self.data = data
+
+    @property
+    def center(self) -> Tuple[float, float]:
+        return (self.min_x + self.max_x) / 2, (self.min_y + self.max_y) / 2
+
+    def overlaps(self, min_x: float, min_y: float, max_x: float, max_y: float, touching: bool = False) -> bool:
+        if touching:
+            return self.min_x <= max_x and min_x <= self.max_x and self.min_y <= max_y and min_y <= self.max_y
+        # בבדיקת התנגשות נגיעה בקצה בלבד לא נחשבת חפיפה
+        return self.min_x < max_x and min_x < self.max_x and self.min_y < max_y and min_y < self.max_y
+
+
+class HallSpatialIndex:
+    """
+    רשת (grid) של השולחנות והאלמנטים באולם אחד של אירוע: כל פריט רשום בתאים שהמלבן שלו חוצה,
+    כך ששאילתות על אזור בודקות רק את התאים שבאזור. שולחנות בלי מיקום נשמרים בנפרד.
+    המילונים בפריטים משותפים בין בקשות - אסור לשנות אותם.
+    """
+
+    def __init__(self, event_id: int, hall_type: str, tables: list, elements: list, cell_size: int):
+        self.event_id = event_id
+        self.hall_type = hall_type
+        self.cell_size = cell_size
+        self._cells: Dict[Tuple[int, int], List[SpatialItem]] = {}
+        self.tables: Dict[int, SpatialItem] = {}
+        self.elements: Dict[int, SpatialItem] = {}
+        self.unplaced_tables: List[dict] = []
+        self.bounds: Optional[Tuple[float, float, float, float]] = None
+
+        for row in tables:
+            data = dict(zip(TABLE_COLUMNS, row))
+            if data["x"] is None or data["y"] is None:
+                self.unplaced_tables.append(data)
+                continue
+            box = (data["x"], data["y"], data["x"] + TABLE_FOOTPRINT, data["y"] + TABLE_FOOTPRINT)
+            self.tables[data["id"]] = self._insert(SpatialItem("table", data["id"], box, data))
+        for row in elements:
+            data = dict(zip(ELEMENT_COLUMNS, row))
+            if data["x"] is None or data["y"] is None:
+                continue
+            box = element_box(data["x"], data["y"], data["width"], data["height"], data["rotation"])
+            self.elements[data["id"]] = self._insert(SpatialItem("element", data["id"], box, data))
+
+    @classmethod
+    def load(cls, db: Session, event_id: int, hall_type: str) -> "HallSpatialIndex":
+        tables = db.query(*[getattr(Table, column) for column in TABLE_COLUMNS]).filter(
+            Table.event_id == event_id, Table.hall_type == hall_type
+        ).order_by(Table.table_number).all()
+        elements = db.query(*[getattr(HallElement, column) for column in ELEMENT_COLUMNS]).filter(
+            HallElement.event_id == event_id, HallElement.hall_type == hall_type
+        ).order_by(HallElement.id).all()
+        return cls(event_id, hall_type, tables, elements, settings.HALL_GRID_CELL_SIZE)
+
+    def _cell(self, value: float) -> int:
+        return math.floor(value / self.cell_size)
+
+    def _insert(self, item: SpatialItem) -> SpatialItem:
+        for cx in range(self._cell(item.min_x), self._cell(item.max_x) + 1):
+            for cy in range(self._cell(item.min_y), self._cell(item.max_y) + 1):
+                self._cells.setdefault((cx, cy), []).append(item)
+        if self.bounds is None:
+            self.bounds = (item.min_x, item.min_y, item.max_x, item.max_y)
+        else:
+            b = self.bounds
+            self.bounds = (min(b[0], item.min_x), min(b[1], item.min_y), max(b[2], item.max_x), max(b[3], item.max_y))
+        return item
+
+    def query(self, min_x: float, min_y: float, max_x: float, max_y: float, kind: Optional[str] = None,
+              exclude: Optional[Tuple[str, int]] = None, touching: bool = False) -> List[SpatialItem]:
+        """כל הפריטים שחופפים למלבן, לפי סוג ו-id"""
+        if self.bounds is None:
+            return []
+        # חיתוך לגבולות האולם - viewport ענק לא יעבור על מיליוני תאים ריקים
+        b = self.bounds
+        min_x, min_y = max(min_x, b[0]), max(min_y, b[1])
+        max_x, max_y = min(max_x, b[2]), min(max_y, b[3])
+        if min_x > max_x or min_y > max_y:
+            return []
+
+        found = {}
+        for cx in range(self._cell(min_x), self._cell(max_x) + 1):
+            for cy in range(self._cell(min_y), self._cell(max_y) + 1):
+                for item in self._cells.get((cx, cy), ()):
+                    key = (item.kind, item.id)
+                    if key in found or key == exclude or (kind and item.kind != kind):
+                        continue
+                    if item.overlaps(min_x, min_y, max_x, max_y, touching):
+                        found[key] = item
+        return [found[key] for key in sorted(found)]
+
+    def viewport(self, min_x: float, min_y: float, max_x: float, max_y: float) -> dict:
+        # ב-viewport גם נגיעה בקצה נחשבת - שולחן שצמוד לשולי המסך עדיין מוצג
+        items = self.query(min_x, min_y, max_x, max_y, touching=True)
+        return {
+            "tables": [item.data for item in items if item.kind == "table"],
+            "elements": [item.data for item in items if item.kind == "element"],
+        }
+
+    def collisions(self, box: Tuple[float, float, float, float], exclude: Optional[Tuple[str, int]] = None) -> dict:
+        items = self.query(*box, exclude=exclude)
+        return {
+            "collides": bool(items),
+            "tables": [item.data for item in items if item.kind == "table"],
+            "elements": [item.data for item in items if item.kind == "element"],
+        }
+
+    def _ring(self, px: int, py: int, radius: int, cell_range: Tuple[int, int, int, int]):
+        """התאים במרחק (Chebyshev) radius מהתא (px, py), רק בתוך טווח התאים של האולם"""
+        x0, y0, x1, y1 = cell_range
+        if radius == 0:
+            if x0 <= px <= x1 and y0 <= py <= y1:
+                yield px, py
+            return
+        for cy in (py - radius, py + radius):
+            if y0 <= cy <= y1:
+                for cx in range(max(x0, px - radius), min(x1, px + radius) + 1):
+                    yield cx, cy
+        for cx in (px - radius, px + radius):
+            if x0 <= cx <= x1:
+                for cy in range(max(y0, py - radius + 1), min(y1, py + radius - 1) + 1):
+                    yield cx, cy
+
+    def nearest_table(self, x: float, y: float,
+                      accept: Callable[[SpatialItem], bool] = lambda item: True) -> Optional[Tuple[SpatialItem, float]]:
+        """
+        השולחן הקרוב ביותר (לפי המרכז) שעומד בתנאי. חיפוש בטבעות של תאים סביב הנקודה,
+        שנעצר כשאף תא רחוק יותר לא יכול להכיל שולחן קרוב יותר.
+        """
+        if not self.tables:
+            return None
+        b = self.bounds
+        cell_range = (self._cell(b[0]), self._cell(b[1]), self._cell(b[2]), self._cell(b[3]))
+        px, py = self._cell(x), self._cell(y)
+        # טבעת ראשונה שנוגעת באולם, ואחרונה שמכסה את כולו
+        first = max(cell_range[0] - px, px - cell_range[2], cell_range[1] - py, py - cell_range[3], 0)
+        last = max(abs(px - cell_range[0]), abs(px - cell_range[2]), abs(py - cell_range[1]), abs(py - cell_range[3]))
+
+        best, best_distance = None, math.inf
+        seen = set()
+        for radius in range(first, last + 1):
+            # מרכז של שולחן שעוד לא נבדק נמצא בטבעת radius ומעלה - רחוק לפחות radius-1 תאים מהנקודה
+            if best is not None and best_distance <= (radius - 1) * self.cell_size:
+                break
+            for cell in self._ring(px, py, radius, cell_range):
+                for item in self._cells.get(cell, ()):
+                    if item.kind != "table" or item.id in seen:
+                        continue
+                    seen.add(item.id)
+                    if not accept(item):
+                        continue
+                    cx, cy = item.center
+                    distance = math.hypot(cx - x, cy - y)
+                    if distance < best_distance or (distance == best_distance and item.data["table_number"] < best.data["table_number"]):
+                        best, best_distance = item, distance
+        return (best, best_distance) if best is not None else None
+
+
+class HallSpatialCache:
+    """LRU של אינדקסים מרחביים לפי (אירוע, סוג אולם) - כתיבות של שולחנות ואלמנטים קוראות ל-invalidate"""
+
+    def __init__(self, max_halls: int):
+        self.max_halls = max_halls
+        self._indexes: "OrderedDict[Tuple[int, str], HallSpatialIndex]" = OrderedDict()
+        self._generations: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, db: Session, event_id: int, hall_type: str) -> HallSpatialIndex:
+        key = (event_id, hall_type)
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is not None:
+                self._indexes.move_to_end(key)
+                return index
+            generation = self._generations.get(event_id, 0)
+
+        index = HallSpatialIndex.load(db, event_id, hall_type)
+
+        with self._lock:
+            # כתיבה שהתבצעה בזמן הטעינה - האינדקס אולי לא כולל אותה, לא שומרים
+            if self._generations.get(event_id, 0) == generation:
+                self._indexes[key] = index
+                while len(self._indexes) > self.max_halls:
+                    self._indexes.popitem(last=False)
+        return index
+
+    def invalidate(self, event_id: Optional[int]):
+        if event_id is None:
+            return
+        with self._lock:
+            self._generations[event_id] = self._generations.get(event_id, 0) + 1
+            for key in [key for key in self._indexes if key[0] == event_id]:
+                del self._indexes[key]
+
+
+hall_spatial_cache = HallSpatialCache(settings.HALL_SPATIAL_CACHE_SIZE)
@@ -4,6 +4,8 @@ from passlib.hash import bcrypt
 from sqlalchemy.exc import IntegrityError
 from fastapi import HTTPException
 from app.audit_log.repository import log_change
+from app.auth.principal import principal_cache
+from app.permissions.cache import permission_cache
 
 def create_user(db: Session, user: schemas.UserCreate, user_id: int = None):
     existing_user = db.query(models.User).filter(models.User.id_number == user.id_number).first()
@@ -51,6 +53,7 @@ def delete_user(db: Session, user_id: int, current_user_id: int = None):
     # מחק קודם את כל ההרשאות של המשתמש
     db.query(UserEventPermission).filter_by(user_id=user_id).delete()
     db.commit()
+    permission_cache.invalidate_user(user_id)
     user = get_user_by_id(db, user_id)
     if user:
         # Log the user deletion before deleting
@@ -74,6 +77,7 @@ def delete_user(db: Session, user_id: int, current_user_id: int = None):
                 raise Exception("Cannot delete user: user is referenced by events")
             else:
                 raise
+        principal_cache.invalidate(user_id)
     return user
 
 def deactivate_user(db: Session, user_id: int):
@@ -84,6 +88,7 @@ def deactivate_user(db: Session, user_id: int):
     user.is_active = False
     db.commit()
     db.refresh(user)
+    principal_cache.invalidate(user_id)
     return user
 
 def get_user_by_email(db: Session, email: str):
@@ -0,0 +1,51 @@
+"""audit log composite indexes and archive table
+
+Revision ID: c5d8e2f1a7b4
+Revises: a9a8accdf1cb
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5d8e2f1a7b4'
+down_revision: Union[str, Sequence[str], None] = 'a9a8accdf1cb'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # אינדקסים מורכבים לשאילתות ההיסטוריה (דפדוף לפי זמן לאירוע / ישות / משתמש)
+    op.create_index('ix_audit_log_event_timestamp', 'audit_log', ['event_id', 'timestamp', 'id'])
+    op.create_index('ix_audit_log_entity_timestamp', 'audit_log', ['entity_type', 'entity_id', 'timestamp'])
+    op.create_index('ix_audit_log_user_timestamp', 'audit_log', ['user_id', 'timestamp'])
+
+    # ארכיון חודשי דחוס לרשומות ישנות
+    op.create_table(
+        'audit_log_archive',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('event_id', sa.Integer(), nullable=True),
+        sa.Column('period', sa.String(7), nullable=False),
+        sa.Column('row_count', sa.Integer(), nullable=False),
+        sa.Column('first_timestamp', sa.TIMESTAMP(), nullable=True),
+        sa.Column('last_timestamp', sa.TIMESTAMP(), nullable=True),
+        sa.Column('payload', sa.LargeBinary(), nullable=False),
+        sa.Column('created_at', sa.TIMESTAMP(), nullable=True),
+    )
+    op.create_index('ix_audit_log_archive_id', 'audit_log_archive', ['id'])
+    op.create_index('ix_audit_log_archive_event_period', 'audit_log_archive', ['event_id', 'period'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_audit_log_archive_event_period', table_name='audit_log_archive')
+    op.drop_index('ix_audit_log_archive_id', table_name='audit_log_archive')
+    op.drop_table('audit_log_archive')
+    op.drop_index('ix_audit_log_user_timestamp', table_name='audit_log')
+    op.drop_index('ix_audit_log_entity_timestamp', table_name='audit_log')
+    op.drop_index('ix_audit_log_event_timestamp', table_name='audit_log')
@@ -0,0 +1,46 @@
+"""realtime replay messages table
+
+Revision ID: e7b3c9a4d215
+Revises: c5d8e2f1a7b4
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7b3c9a4d215'
+down_revision: Union[str, Sequence[str], None] = 'c5d8e2f1a7b4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # הודעות זרם ה-WebSocket נשמרות בטבלה משלהן ולא בין ההתראות
+    op.create_table(
+        'realtime_replay_messages',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('event_id', sa.Integer(), nullable=False),
+        sa.Column('stream_id', sa.String(32), nullable=False),
+        sa.Column('seq', sa.Integer(), nullable=False),
+        sa.Column('target', sa.String(16), nullable=False),
+        sa.Column('payload', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+    )
+    op.create_index('ix_realtime_replay_messages_id', 'realtime_replay_messages', ['id'])
+    op.create_index('ix_realtime_replay_messages_created_at', 'realtime_replay_messages', ['created_at'])
+    op.create_index('ix_realtime_replay_messages_stream_seq', 'realtime_replay_messages', ['event_id', 'stream_id', 'seq'])
+    # הודעות זרם שנשמרו קודם בטבלת ההתראות
+    op.execute("DELETE FROM realtime_notifications WHERE notification_type LIKE 'ws_replay:%'")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_realtime_replay_messages_stream_seq', table_name='realtime_replay_messages')
+    op.drop_index('ix_realtime_replay_messages_created_at', table_name='realtime_replay_messages')
+    op.drop_index('ix_realtime_replay_messages_id', table_name='realtime_replay_messages')
+    op.drop_table('realtime_replay_messages')
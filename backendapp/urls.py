@@ -12,8 +12,8 @@ from app.events.router import create_event, get_my_events, get_event, update_eve
 
 # Import from guests router
 from app.guests.router import (
-    create_guest, update_guest, delete_guest, get_guests, get_all_guests,
-    filter_guests, export_guests_to_excel, export_guests_to_pdf, export_seating_image,
+    create_guest, import_guests, update_guest, delete_guest, get_guests, get_all_guests,
+    filter_guests, search_guests, search_guests_prefix, export_guests_to_excel, export_guests_to_pdf, export_seating_image,
     create_custom_field, get_custom_fields, delete_custom_field,
     create_field_value, get_field_values, add_field_value, get_guests_with_fields,
     update_guests_with_default_gender_endpoint, create_form_field, list_form_fields, reorder_form_fields
@@ -22,7 +22,8 @@ from app.guests.router import (
 # Import from tables router
 from app.tables.router import (
     create, get_all, get_one, update, delete,
-    get_by_event, bulk_create_tables, add_single_table, remove_single_table,
+    get_by_event, get_viewport, get_nearest_free_table, check_collisions,
+    bulk_create_tables, add_single_table, remove_single_table,
     create_hall_element_endpoint, get_hall_elements, update_hall_element_endpoint, delete_hall_element_endpoint
 )
 
@@ -33,8 +34,8 @@ from app.users.router import create_user, get_all_users, get_user, delete_user
 from app.seatings.router import (
     assign_seat, get_seatings, delete_seating, update_seating, save_seating_plan,
     export_seating_map, export_guest_list, get_seating_statistics,
-    delete_seating_cards, generate_seating_cards, get_seating_cards,
-    download_seating_card, download_all_cards, export_seating_map_filtered,
+    delete_seating_cards, generate_seating_cards, get_card_generation_progress, get_seating_cards,
+    get_qr_image, download_seating_card, download_all_cards, export_seating_map_filtered,
     export_seating_map_filtered_pdf, get_filter_options
 )
 
@@ -50,7 +51,10 @@ from app.tableHead.router import (
 )
 
 # Import from audit_log router
-from app.audit_log.router import get_audit_log, get_all_audit_logs
+from app.audit_log.router import (
+    get_audit_log, get_all_audit_logs, query_audit_logs, archive_audit_logs, get_audit_log_archives,
+    get_audit_log_archive
+)
 
 # Import from greetings router
 from app.greetings.router import (
@@ -78,7 +82,13 @@ from app.payments.router import (
 # Import from realtime router
 from app.realtime.router import (
     websocket_endpoint, scan_qr_code, get_realtime_notifications,
-    mark_notification_read, fix_seating_status
+    mark_notification_read, fix_seating_status, warm_checkin_index,
+    get_sync_snapshot, get_sync_changes, sync_check_ins, get_websocket_metrics
+)
+
+# Import from jobs router
+from app.jobs.router import (
+    submit_job, get_event_jobs, get_job, get_job_progress, cancel_job, download_job_artifact
 )
 # Create main router
 router = APIRouter()
@@ -104,11 +114,14 @@ router.add_api_route("/events/{event_id}", delete_event, methods=["DELETE"])
 
 # Guests
 router.add_api_route("/guests/", create_guest, methods=["POST"])
+router.add_api_route("/guests/events/{event_id}/import", import_guests, methods=["POST"])
 router.add_api_route("/guests/{guest_id}", update_guest, methods=["PUT"])
 router.add_api_route("/guests/{guest_id}", delete_guest, methods=["DELETE"])
 router.add_api_route("/guests/event/{event_id}", get_guests, methods=["GET"])
 router.add_api_route("/guests/", get_all_guests, methods=["GET"])
 router.add_api_route("/guests/filter", filter_guests, methods=["GET"])
+router.add_api_route("/guests/events/{event_id}/search", search_guests, methods=["GET"])
+router.add_api_route("/guests/events/{event_id}/search/prefix", search_guests_prefix, methods=["GET"])
 router.add_api_route("/guests/export", export_guests_to_excel, methods=["GET"])
 router.add_api_route("/guests/export-pdf", export_guests_to_pdf, methods=["GET"])
 router.add_api_route("/guests/export-seating-image", export_seating_image, methods=["GET"])
@@ -131,6 +144,9 @@ router.add_api_route("/tables/{table_id}", get_one, methods=["GET"])
 router.add_api_route("/tables/{table_id}", update, methods=["PUT"])
 router.add_api_route("/tables/{table_id}", delete, methods=["DELETE"])
 router.add_api_route("/tables/event/{event_id}", get_by_event, methods=["GET"])
+router.add_api_route("/tables/event/{event_id}/viewport", get_viewport, methods=["GET"])
+router.add_api_route("/tables/event/{event_id}/nearest-free", get_nearest_free_table, methods=["GET"])
+router.add_api_route("/tables/event/{event_id}/collisions", check_collisions, methods=["GET"])
 router.add_api_route("/tables/event/{event_id}/bulk", bulk_create_tables, methods=["POST"])
 router.add_api_route("/tables/event/{event_id}/add-single", add_single_table, methods=["POST"])
 router.add_api_route("/tables/event/{event_id}/remove-single/{table_number}", remove_single_table, methods=["DELETE"])
@@ -162,7 +178,9 @@ router.add_api_route("/seatings/export-guest-list/{event_id}", export_guest_list
 router.add_api_route("/seatings/seating-statistics/{event_id}", get_seating_statistics, methods=["GET"])
 router.add_api_route("/seatings/cards/{event_id}", delete_seating_cards, methods=["DELETE"])
 router.add_api_route("/seatings/generate-cards/{event_id}", generate_seating_cards, methods=["POST"])
+router.add_api_route("/seatings/generate-cards/{event_id}/progress", get_card_generation_progress, methods=["GET"])
 router.add_api_route("/seatings/cards/{event_id}", get_seating_cards, methods=["GET"])
+router.add_api_route("/seatings/qr/{qr_key}.png", get_qr_image, methods=["GET"])
 router.add_api_route("/seatings/card/{card_id}/download", download_seating_card, methods=["GET"])
 router.add_api_route("/seatings/cards/{event_id}/download-all", download_all_cards, methods=["GET"])
 router.add_api_route("/seatings/export-seating-map-filtered/{event_id}", export_seating_map_filtered, methods=["GET"])
@@ -180,11 +198,16 @@ router.add_api_route("/greetings/{greeting_id}/approve", approve_greeting, metho
 router.add_api_route("/greetings/event/{event_id}/approved", get_approved_greetings_by_event, methods=["GET"])
 
 # Real-time
-router.add_api_route("/realtime/ws/{event_id}", websocket_endpoint, methods=["GET"])  # WebSocket
+router.add_api_websocket_route("/realtime/ws/{event_id}", websocket_endpoint)
+router.add_api_route("/realtime/ws-metrics", get_websocket_metrics, methods=["GET"])
 router.add_api_route("/realtime/scan-qr", scan_qr_code, methods=["POST"])
+router.add_api_route("/realtime/checkin-index/{event_id}/warm", warm_checkin_index, methods=["POST"])
 router.add_api_route("/realtime/notifications/{event_id}", get_realtime_notifications, methods=["GET"])
 router.add_api_route("/realtime/notifications/{notification_id}/mark-read", mark_notification_read, methods=["POST"])
 router.add_api_route("/realtime/fix-seating-status/{event_id}", fix_seating_status, methods=["POST"])
+router.add_api_route("/realtime/sync/{event_id}/snapshot", get_sync_snapshot, methods=["GET"])
+router.add_api_route("/realtime/sync/{event_id}/changes", get_sync_changes, methods=["GET"])
+router.add_api_route("/realtime/sync/{event_id}/check-ins", sync_check_ins, methods=["POST"])
 
 # Permissions
 router.add_api_route("/permissions/", create_permission, methods=["POST"])
@@ -196,6 +219,10 @@ router.add_api_route("/permissions/{permission_id}", update_permission, methods=
 # Audit Log
 router.add_api_route("/audit-log/", get_audit_log, methods=["GET"])
 router.add_api_route("/audit-log/all", get_all_audit_logs, methods=["GET"])
+router.add_api_route("/audit-log/query", query_audit_logs, methods=["GET"])
+router.add_api_route("/audit-log/archive", archive_audit_logs, methods=["POST"])
+router.add_api_route("/audit-log/archive", get_audit_log_archives, methods=["GET"])
+router.add_api_route("/audit-log/archive/{archive_id}", get_audit_log_archive, methods=["GET"])
 
 # Bot Integration
 router.add_api_route("/bot/event/{event_id}", get_event_info_for_bot, methods=["GET"])
@@ -226,4 +253,10 @@ router.add_api_route("/payments/{payment_id}", update_payment, methods=["PATCH"]
 router.add_api_route("/payments/webhook/nedarim-plus/regular", nedarim_plus_webhook_regular, methods=["POST"])
 router.add_api_route("/payments/webhook/nedarim-plus/keva", nedarim_plus_webhook_keva, methods=["POST"])
 
-
+# Background jobs
+router.add_api_route("/jobs/", submit_job, methods=["POST"], status_code=202)
+router.add_api_route("/jobs/event/{event_id}", get_event_jobs, methods=["GET"])
+router.add_api_route("/jobs/{job_id}", get_job, methods=["GET"])
+router.add_api_route("/jobs/{job_id}/progress", get_job_progress, methods=["GET"])
+router.add_api_route("/jobs/{job_id}/cancel", cancel_job, methods=["POST"])
+router.add_api_route("/jobs/{job_id}/download", download_job_artifact, methods=["GET"])
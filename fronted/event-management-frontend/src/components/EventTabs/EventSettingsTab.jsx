@@ -587,6 +587,9 @@ export default function EventSettingsTab({ eventId }) {
           }
 
           const data = await response.json();
+          if (data.unseated && data.unseated.length > 0) {
+            alert(`${data.unseated.length} מוזמנים הוסרו ממקומות בשולחנות שהוקטנו וצריכים שיבוץ מחדש`);
+          }
         }
         
         // שמור את המפתח של השמירה הנוכחית